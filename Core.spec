@@ -2,10 +2,10 @@
 
 
 a = Analysis(
-    ['Core.py'],
+    ['batch.py'],
     pathex=[],
     binaries=[],
-    datas=[],
+    datas=[('tesseract', 'tesseract'), ('data', 'data')],
     hiddenimports=[],
     hookspath=[],
     hooksconfig={},
@@ -25,7 +25,7 @@ exe = EXE(
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    upx=False,
     console=True,
     disable_windowed_traceback=False,
     argv_emulation=False,
@@ -38,7 +38,7 @@ coll = COLLECT(
     a.binaries,
     a.datas,
     strip=False,
-    upx=True,
+    upx=False,
     upx_exclude=[],
     name='Core',
 )
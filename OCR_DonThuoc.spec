@@ -2,10 +2,10 @@
 
 
 a = Analysis(
-    ['core.py'],
+    ['main.py'],
     pathex=[],
     binaries=[],
-    datas=[('tesseract', 'tesseract')],
+    datas=[('tesseract', 'tesseract'), ('data', 'data')],
     hiddenimports=[],
     hookspath=[],
     hooksconfig={},
@@ -16,19 +16,18 @@ a = Analysis(
 )
 pyz = PYZ(a.pure)
 
+# One-folder build: a one-file exe unpacks OpenCV and Tesseract into a
+# temp directory on every launch, which dominated cold start.
 exe = EXE(
     pyz,
     a.scripts,
-    a.binaries,
-    a.datas,
     [],
+    exclude_binaries=True,
     name='OCR_DonThuoc',
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
-    upx_exclude=[],
-    runtime_tmpdir=None,
+    upx=False,
     console=False,
     disable_windowed_traceback=False,
     argv_emulation=False,
@@ -36,3 +35,12 @@ exe = EXE(
     codesign_identity=None,
     entitlements_file=None,
 )
+coll = COLLECT(
+    exe,
+    a.binaries,
+    a.datas,
+    strip=False,
+    upx=False,
+    upx_exclude=[],
+    name='OCR_DonThuoc',
+)
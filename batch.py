@@ -0,0 +1,63 @@
+"""Chạy OCR hàng loạt không cần giao diện
+
+Ví dụ:
+    python batch.py scans/ -o results.jsonl --workers 8
+    python batch.py danh_sach.txt -o results.jsonl
+    python batch.py scans/ -o results.jsonl --queue jobs.sqlite   # chạy lại lệnh này để tiếp tục
+    python batch.py scans/ --format parquet -o results.parquet
+"""
+import argparse
+import multiprocessing
+import sys
+from pathlib import Path
+
+from core.batch import BatchProcessor
+from core.exporter import FORMATS
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="OCR + KE đơn thuốc hàng loạt")
+    parser.add_argument('inputs', nargs='+',
+                        help="Thư mục ảnh, file ảnh hoặc file .txt chứa danh sách ảnh")
+    parser.add_argument('-o', '--output', default=None,
+                        help="File kết quả (mặc định: results.<định dạng>)")
+    parser.add_argument('--format', choices=FORMATS, default=None,
+                        help="jsonl, parquet (cần pyarrow, nếu không có sẽ ghi CSV) hoặc csv; "
+                             "mặc định theo đuôi file output, không có thì jsonl")
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help="Số process (mặc định: batch.workers hoặc số lõi CPU)")
+    parser.add_argument('--no-recursive', action='store_true',
+                        help="Không duyệt thư mục con")
+    parser.add_argument('--queue', metavar='DB',
+                        help="Hàng đợi SQLite: lưu kết quả từng ảnh, chạy lại cùng lệnh để tiếp tục sau khi bị dừng")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    Path("logs").mkdir(exist_ok=True)
+
+    processor = BatchProcessor(workers=args.workers)
+    images = processor.collect_images(args.inputs, recursive=not args.no_recursive)
+
+    if not images:
+        print("Không tìm thấy ảnh nào", file=sys.stderr)
+        return 1
+
+    def progress(done, total, result):
+        status = "❌" if 'error' in result else "✅"
+        print(f"[{done}/{total}] {status} {result['image']}", file=sys.stderr)
+
+    output = args.output or f"results.{args.format or 'jsonl'}"
+    if args.queue:
+        stats = processor.run_queue(images, output, args.queue, callback=progress, fmt=args.format)
+    else:
+        stats = processor.run(images, output, callback=progress, fmt=args.format)
+    print(f"Hoàn tất: {stats['ok']}/{stats['total']} ảnh, {stats['failed']} lỗi → {stats['output']}",
+          file=sys.stderr)
+    return 0 if stats['failed'] == 0 else 2
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,212 @@
+"""Benchmark toàn bộ pipeline OCR với thời gian từng giai đoạn
+
+Generates synthetic prescription images (rendered text at several
+resolutions and noise levels), runs ImagePreprocessor.process, OCREngine
+recognition and KeywordExtractor.extract exactly as the pipeline does
+(deskew, threshold tuning, tiling and re-OCR follow config.yaml) and
+reports the metrics spans they emit, so every stage is covered. Saves
+throughput, p50/p95 latency and peak RSS as JSON for comparison across
+commits.
+
+Ví dụ:
+    python -m benchmarks.bench_pipeline --output bench/HEAD.json
+    python -m benchmarks.bench_pipeline --widths 1000 2000 --noise 0 20 --repeat 5
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from utils.config import Config
+from utils.metrics import Metrics
+
+# Hershey fonts cannot render Vietnamese diacritics, so the synthetic text is unaccented
+SAMPLE_LINES = [
+    "PHONG KHAM DA KHOA AN BINH",
+    "Ho ten: Nguyen Van An   Tuoi: 45",
+    "Dia chi: 12 Le Loi, Quan 1",
+    "Chan doan: Viem hong cap",
+    "1. AUGMENTIN 625mg  x 14 vien",
+    "   Uong sang 1 vien, toi 1 vien",
+    "2. PARACETAMOL 500mg  x 10 vien",
+    "   Uong khi sot, cach 6 gio",
+    "3. LORATADINE 10mg  x 7 vien",
+    "   Uong toi 1 vien",
+    "Ngay kham: 12/03/2024   Bac si: Tran Thi B",
+]
+
+
+def render_prescription(width, noise_sigma, seed):
+    """Vẽ một đơn thuốc giả lập, trả về bytes PNG"""
+    rng = np.random.default_rng(seed)
+    scale = width / 1000.0
+    line_height = int(60 * scale)
+    height = line_height * (len(SAMPLE_LINES) + 2)
+
+    img = np.full((height, width, 3), 245, dtype=np.uint8)
+    for i, text in enumerate(SAMPLE_LINES, 1):
+        cv2.putText(img, text, (int(40 * scale), i * line_height),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1.1 * scale, (20, 20, 20),
+                    max(1, int(2 * scale)), cv2.LINE_AA)
+
+    if noise_sigma:
+        noise = rng.normal(0, noise_sigma, img.shape)
+        img = np.clip(img.astype(np.float32) + noise, 0, 255).astype(np.uint8)
+
+    ok, encoded = cv2.imencode('.png', img)
+    if not ok:
+        raise RuntimeError("Cannot encode synthetic image")
+    return encoded.tobytes()
+
+
+def peak_rss_mb():
+    """Peak RSS của process (MB), None nếu không đo được"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS bytes
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+        except (ImportError, AttributeError):
+            return None
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else None
+
+
+def run_once(image_bytes, preprocessor, engine, extractor):
+    """Chạy pipeline một lần, trả về dict thời gian (giây) theo span + 'total'"""
+    start = time.perf_counter()
+    with Metrics().collect() as spans:
+        if engine is not None:
+            processed, _, gray = engine.preprocess(image_bytes)
+            blocks = engine._recognize(processed, gray)
+            lines = [line for block in blocks for line in block['lines']]
+        else:
+            preprocessor.process(image_bytes)
+            lines = list(SAMPLE_LINES)
+        extractor.extract(lines)
+    total = time.perf_counter() - start
+
+    t = {}
+    for span in spans:
+        # Spans repeated within one run (e.g. per region) are summed
+        t[span['name']] = t.get(span['name'], 0.0) + span['duration_ms'] / 1000
+    t['total'] = total
+    return t
+
+
+def summarize(samples):
+    """p50/p95/mean (ms) cho từng giai đoạn, theo thứ tự xuất hiện"""
+    stages = list(dict.fromkeys(stage for s in samples for stage in s))
+    stages.append(stages.pop(stages.index('total')))
+    summary = {}
+    for stage in stages:
+        values = [s[stage] * 1000 for s in samples if stage in s]
+        summary[stage] = {
+            'p50_ms': percentile(values, 50),
+            'p95_ms': percentile(values, 95),
+            'mean_ms': float(np.mean(values)),
+        }
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the OCR pipeline per stage")
+    parser.add_argument('--widths', nargs='+', type=int, default=[800, 1600, 3200],
+                        help="Chiều rộng ảnh giả lập (px)")
+    parser.add_argument('--noise', nargs='+', type=float, default=[0, 15, 30],
+                        help="Độ lệch chuẩn nhiễu Gauss")
+    parser.add_argument('--repeat', type=int, default=3, help="Số lần chạy mỗi cấu hình")
+    parser.add_argument('--no-ocr', action='store_true',
+                        help="Bỏ qua Tesseract (đo tiền xử lý + trích xuất)")
+    parser.add_argument('--output', help="Ghi kết quả ra file JSON")
+    args = parser.parse_args(argv)
+
+    # Stage timings come from the metrics spans; no sinks, only collect()
+    config = Config()
+    config.set('metrics.enabled', True)
+    config.set('metrics.sinks', [])
+
+    from core.preprocessor import ImagePreprocessor
+    from core.keyword_extractor import KeywordExtractor
+
+    preprocessor = ImagePreprocessor()
+    extractor = KeywordExtractor()
+    engine = None
+    if not args.no_ocr:
+        from core.ocr_engine import OCREngine
+        engine = OCREngine()
+
+    cases = []
+    all_samples = []
+    wall_start = time.perf_counter()
+
+    for width in args.widths:
+        for sigma in args.noise:
+            image_bytes = render_prescription(width, sigma, seed=width * 1000 + int(sigma))
+            # Warm-up run is not recorded
+            run_once(image_bytes, preprocessor, engine, extractor)
+            samples = [run_once(image_bytes, preprocessor, engine, extractor)
+                       for _ in range(args.repeat)]
+            all_samples.extend(samples)
+            cases.append({
+                'width': width,
+                'noise_sigma': sigma,
+                'image_bytes': len(image_bytes),
+                'stages': summarize(samples),
+            })
+            total = cases[-1]['stages']['total']
+            print(f"width={width:<5} noise={sigma:<5} total p50={total['p50_ms']:.1f}ms "
+                  f"p95={total['p95_ms']:.1f}ms", file=sys.stderr)
+
+    busy = sum(s['total'] for s in all_samples)
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'opencv': cv2.__version__,
+        'ocr': not args.no_ocr,
+        'config': {'ocr': config.get('ocr', {}), 'tesseract': config.get('tesseract', {})},
+        'images': len(all_samples),
+        'throughput_images_per_s': len(all_samples) / busy if busy else None,
+        'wall_time_s': time.perf_counter() - wall_start,
+        'peak_rss_mb': peak_rss_mb(),
+        'overall': summarize(all_samples),
+        'cases': cases,
+    }
+
+    print(f"{'stage':<34}{'p50 ms':>10}{'p95 ms':>10}")
+    for stage, stats in report['overall'].items():
+        print(f"{stage:<34}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}")
+    print(f"throughput: {report['throughput_images_per_s']:.2f} img/s, "
+          f"peak RSS: {report['peak_rss_mb']} MB")
+
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
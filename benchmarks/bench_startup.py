@@ -0,0 +1,142 @@
+"""Đo thời gian khởi động (cold start) của GUI, CLI và bản build PyInstaller
+
+Every target is started as a fresh process and timed until it exits. The
+GUI targets run with OCR_STARTUP_PROBE set, so OCRApp quits as soon as the
+engines are ready and reports its own milestones (widgets built, window
+shown, heavy imports done, engines ready). The first run of each target
+is reported separately: it is the closest to a kiosk cold boot, later runs
+hit the OS file cache.
+
+Ví dụ:
+    python -m benchmarks.bench_startup --output bench/startup.json
+    python -m benchmarks.bench_startup --targets cli_help frozen_cli --repeat 10
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+EXE_SUFFIX = '.exe' if sys.platform == 'win32' else ''
+
+# name -> (command, uses the GUI startup probe)
+TARGETS = {
+    'cli_help': ([sys.executable, 'batch.py', '--help'], False),
+    'cli_ready': ([sys.executable, '-c',
+                   'from core.batch import get_pipeline; get_pipeline().warm_up()'], False),
+    'gui_ready': ([sys.executable, 'main.py'], True),
+    'frozen_cli': ([str(Path('dist', 'Core', 'Core' + EXE_SUFFIX)), '--help'], False),
+    'frozen_gui': ([str(Path('dist', 'OCR_DonThuoc', 'OCR_DonThuoc' + EXE_SUFFIX))], True),
+}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_once(command, probe, timeout):
+    """Chạy một process, trả về dict thời gian (ms) hoặc {'error'}"""
+    env = dict(os.environ)
+    report_path = None
+    if probe:
+        fd, report_path = tempfile.mkstemp(suffix='.json', prefix='startup_')
+        os.close(fd)
+        env['OCR_STARTUP_PROBE'] = report_path
+
+    try:
+        start = time.perf_counter()
+        completed = subprocess.run(command, env=env, timeout=timeout,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        sample = {'total_ms': (time.perf_counter() - start) * 1000}
+
+        if completed.returncode != 0:
+            return {'error': completed.stderr.decode('utf-8', 'replace').strip()[-500:]
+                    or f"exit code {completed.returncode}"}
+
+        if probe:
+            milestones = json.loads(Path(report_path).read_text(encoding='utf-8') or '{}')
+            if milestones.get('error'):
+                return {'error': milestones['error']}
+            sample.update((k, v) for k, v in milestones.items() if k.endswith('_ms'))
+        return sample
+    except (OSError, subprocess.TimeoutExpired, ValueError) as e:
+        return {'error': str(e)}
+    finally:
+        if report_path:
+            Path(report_path).unlink(missing_ok=True)
+
+
+def summarize(samples):
+    """Lần chạy đầu + median/min của các lần sau cho từng mốc"""
+    keys = [k for k in samples[0] if k.endswith('_ms')]
+    summary = {'first': samples[0]}
+    rest = samples[1:]
+    if rest:
+        summary['warm_median'] = {k: statistics.median(s[k] for s in rest) for k in keys}
+        summary['warm_min'] = {k: min(s[k] for s in rest) for k in keys}
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold-start time of the app entry points")
+    parser.add_argument('--targets', nargs='+', choices=list(TARGETS), default=list(TARGETS),
+                        help="Các entry point cần đo (mặc định: tất cả)")
+    parser.add_argument('--repeat', type=int, default=5, help="Số lần khởi động mỗi target")
+    parser.add_argument('--timeout', type=float, default=120, help="Giới hạn mỗi lần chạy (giây)")
+    parser.add_argument('--output', help="Ghi kết quả ra file JSON")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name in args.targets:
+        command, probe = TARGETS[name]
+        if name.startswith('frozen') and not Path(command[0]).exists():
+            results[name] = {'skipped': f"{command[0]} not found (run pyinstaller first)"}
+            print(f"{name:<12} skipped: {results[name]['skipped']}", file=sys.stderr)
+            continue
+
+        samples = []
+        for _ in range(max(1, args.repeat)):
+            sample = run_once(command, probe, args.timeout)
+            if 'error' in sample:
+                results[name] = {'error': sample['error']}
+                break
+            samples.append(sample)
+        else:
+            results[name] = summarize(samples)
+
+        if 'error' in results[name]:
+            print(f"{name:<12} error: {results[name]['error']}", file=sys.stderr)
+            continue
+        first = results[name]['first']
+        warm = results[name].get('warm_median', {})
+        milestones = ' '.join(f"{k}={v:.0f}" for k, v in first.items() if k != 'total_ms')
+        print(f"{name:<12} first {first['total_ms']:>8.0f}ms  warm p50 "
+              f"{warm.get('total_ms', float('nan')):>8.0f}ms  {milestones}", file=sys.stderr)
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'targets': results,
+    }
+
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,434 @@
+"""Xử lý hàng loạt ảnh đơn thuốc bằng process pool"""
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+from pathlib import Path
+from utils.config import Config
+from utils.logger import Logger
+from utils.metrics import Metrics
+from core.exporter import ResultExporter
+
+# The pipeline is created once per worker process by _init_worker
+_pipeline = None
+
+
+def _init_worker():
+    """Khởi tạo OCRPipeline (OCREngine + KeywordExtractor) trong mỗi worker process"""
+    global _pipeline
+    from multiprocessing.util import Finalize
+    from core.pipeline import OCRPipeline
+    from utils.metrics import Metrics
+
+    _pipeline = OCRPipeline()
+    # Flush buffered metrics when the worker exits normally (pool.close/join, executor shutdown)
+    Finalize(None, Metrics().close, exitpriority=10)
+
+
+def get_pipeline():
+    """OCRPipeline của worker process hiện tại (tạo nếu chưa có)"""
+    if _pipeline is None:
+        _init_worker()
+    return _pipeline
+
+
+def process_image(image_path):
+    """Chạy OCR + trích xuất cho một ảnh, trả về dict có thể ghi ra JSON"""
+    try:
+        result = get_pipeline().run(image_path)
+        result['image'] = str(image_path)
+        return result
+    except Exception as e:
+        return {'image': str(image_path), 'error': str(e)}
+
+
+def process_page(task):
+    """Raster hóa và xử lý một trang của tài liệu PDF/TIFF ngay trong worker
+
+    Args:
+        task: (document_path, page_number) tuple
+
+    Returns:
+        Page result dict with 'image' and 'page'
+    """
+    from core.document_loader import DocumentLoader
+
+    path, number = task
+    try:
+        page = DocumentLoader().load_page(path, number)
+        result = get_pipeline().run(page)
+    except Exception as e:
+        result = {'error': str(e)}
+    result['image'] = str(path)
+    result['page'] = number
+    return result
+
+
+def process_task(task):
+    """Task của pool: đường dẫn ảnh hoặc (tài liệu, số trang)"""
+    if isinstance(task, tuple):
+        return process_page(task)
+    return process_image(task)
+
+
+# Worker-side connection to the job queue, opened by _init_queue_worker
+_queue = None
+
+
+def _init_queue_worker(queue_path):
+    """Như _init_worker, thêm kết nối tới JobQueue để ghi nhận lần thử"""
+    global _queue
+    from core.job_queue import JobQueue
+
+    _init_worker()
+    _queue = JobQueue(queue_path)
+
+
+def process_job(job):
+    """Task của pool khi chạy với JobQueue: (job_id, task) → (job_id, kết quả)
+
+    The attempt is recorded before processing starts, so a job that kills
+    its worker still counts towards batch.queue.max_attempts.
+    """
+    job_id, task = job
+    if _queue is not None:
+        _queue.start(job_id)
+    return job_id, process_task(task)
+
+
+def _crashed_result(task):
+    """Kết quả lỗi cho task làm worker process chết"""
+    if isinstance(task, tuple):
+        return {'image': str(task[0]), 'page': task[1], 'error': 'worker process crashed'}
+    return {'image': str(task), 'error': 'worker process crashed'}
+
+
+def _iter_completed(executor, func, tasks, window):
+    """Như Pool.imap_unordered trên ProcessPoolExecutor: yield (task, future) khi xong
+
+    At most `window` tasks are in flight. A worker that dies breaks the
+    executor instead of hanging it: the futures of all in-flight tasks then
+    fail with BrokenProcessPool, nothing more is submitted and the
+    remaining tasks stay in the `tasks` iterator.
+    """
+    tasks = iter(tasks)
+    pending = {executor.submit(func, task): task for task in islice(tasks, window)}
+    broken = False
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            broken = broken or isinstance(future.exception(), BrokenProcessPool)
+            yield pending.pop(future), future
+        if not broken:
+            pending.update((executor.submit(func, task), task) for task in islice(tasks, len(done)))
+
+
+class BatchProcessor:
+    """Headless batch OCR over many images"""
+
+    def __init__(self, workers=None):
+        self.config = Config()
+        self.logger = Logger.get_logger('BatchProcessor')
+
+        workers = workers or self.config.get('batch.workers', 0)
+        self.workers = int(workers) if workers else (os.cpu_count() or 1)
+        self.chunksize = int(self.config.get('batch.chunksize', 4) or 1)
+        # Tasks submitted ahead of the workers
+        self.window = self.workers * self.chunksize
+        self.extensions = {
+            ext.lower() for ext in
+            (self.config.get('batch.extensions', ['.jpg', '.jpeg', '.png', '.bmp', '.pdf', '.tif', '.tiff']) or [])
+        }
+
+    def collect_images(self, inputs, recursive=True):
+        """Gom danh sách ảnh từ thư mục, file ảnh hoặc file danh sách (.txt)
+
+        Args:
+            inputs: Iterable of directory, image or list-file paths
+            recursive: Walk sub-directories when an input is a directory
+
+        Returns:
+            Sorted list of image paths (str)
+        """
+        images = []
+        for item in inputs:
+            path = Path(item)
+            if path.is_dir():
+                pattern = '**/*' if recursive else '*'
+                images.extend(
+                    str(p) for p in path.glob(pattern)
+                    if p.is_file() and p.suffix.lower() in self.extensions
+                )
+            elif path.suffix.lower() in self.extensions:
+                images.append(str(path))
+            elif path.is_file():
+                # Plain text list: one image path per line
+                with open(path, 'r', encoding='utf-8') as f:
+                    images.extend(ln.strip() for ln in f if ln.strip())
+            else:
+                self.logger.warning(f"Skipping unknown input: {item}")
+
+        return sorted(set(images))
+
+    def run(self, image_paths, output_path, callback=None, fmt=None):
+        """Xử lý song song và ghi mỗi kết quả thành một dòng JSON (hoặc Parquet/CSV)
+
+        PDF/TIFF documents are split into one task per page so their pages
+        are processed in parallel; each worker rasterizes only the page it
+        is working on. Page results are merged into one line per document
+        as soon as its last page finishes.
+
+        Args:
+            image_paths: List of image or document paths
+            output_path: Output file
+            callback: Optional progress callback(done, total, result)
+            fmt: 'jsonl', 'parquet' or 'csv' (default: from the output suffix),
+                see core.exporter.ResultExporter
+
+        Returns:
+            dict with 'total', 'ok' and 'failed' counts and 'output' (the
+            file actually written, .csv when Parquet is unavailable)
+        """
+        total = len(image_paths)
+        stats = {'total': total, 'ok': 0, 'failed': 0}
+        self.logger.info(f"Batch started: {total} images, {self.workers} workers")
+
+        tasks, documents, failures = self._make_tasks(image_paths)
+
+        with ResultExporter(output_path, fmt) as out:
+            results = self._iter_tasks(tasks)
+
+            for done, result in enumerate(self._merge_documents(failures, results, documents), 1):
+                out.write(result)
+
+                if 'error' in result:
+                    stats['failed'] += 1
+                    self.logger.error(f"Failed {result['image']}: {result['error']}")
+                else:
+                    stats['ok'] += 1
+
+                if callback:
+                    callback(done, total, result)
+
+        Metrics().close()
+        stats['output'] = str(out.path)
+        self.logger.info(f"Batch completed: {stats['ok']} ok, {stats['failed']} failed")
+        return stats
+
+    def run_queue(self, image_paths, output_path, queue_path, callback=None, fmt=None):
+        """Như run(), nhưng qua hàng đợi SQLite bền vững: dừng giữa chừng rồi chạy lại sẽ tiếp tục
+
+        Inputs not yet in the queue are added as pending jobs (documents as
+        one job per page); images already done in an earlier run are not
+        processed again. Jobs are claimed in rounds of batch.queue.claim_size
+        and every result is committed to the queue as soon as it arrives.
+        Failed jobs are retried up to batch.queue.max_attempts. When nothing
+        is pending any more, all finished results are exported to
+        output_path, one JSON line per image or document.
+
+        Args:
+            image_paths: List of image or document paths
+            output_path: Output file (rewritten from the queue)
+            queue_path: SQLite job database, created if missing
+            callback: Optional progress callback(done, total, result), called per job
+            fmt: Output format, as in run()
+
+        Returns:
+            dict with 'total', 'ok' and 'failed' counts of exported records,
+            'output' and 'resumed' (jobs already done before this run)
+        """
+        from core.job_queue import JobQueue, DONE, FAILED
+
+        queue = JobQueue(queue_path)
+        claim_size = int(self.config.get('batch.queue.claim_size', 512) or 1)
+        try:
+            queue.recover()
+            counts = queue.counts()
+            done = resumed = counts[DONE] + counts[FAILED]
+
+            known = queue.known_paths()
+            tasks, _, failures = self._make_tasks([p for p in image_paths if str(p) not in known])
+            queue.add(tasks)
+            for failure in failures:
+                queue.add_failure(failure['image'], failure['error'])
+
+            counts = queue.counts()
+            total = sum(counts.values())
+            self.logger.info(f"Queue {queue_path}: {counts['pending']} pending, {resumed} finished "
+                             f"of {total} jobs, {self.workers} workers")
+
+            pool = self._start_pool(_init_queue_worker, str(queue_path))
+            try:
+                suspects, stalled = [], 0
+                while True:
+                    if suspects:
+                        # Jobs in flight when a worker died: one at a time, so only the culprit crashes again
+                        jobs, window = queue.claim(len(suspects), ids=suspects), 1
+                    else:
+                        jobs, window = queue.claim(claim_size), self.window
+                        if not jobs:
+                            break
+
+                    finished, crashed = 0, []
+                    for (job_id, _), future in _iter_completed(pool, process_job, jobs, window):
+                        try:
+                            _, result = future.result()
+                        except BrokenProcessPool:
+                            crashed.append(job_id)
+                            continue
+                        finished += 1
+                        if 'error' in result:
+                            retry = queue.fail(job_id, result['error'])
+                            self.logger.error(f"Failed {result['image']}: {result['error']}"
+                                              + (" (will retry)" if retry else ""))
+                            if retry:
+                                continue
+                        else:
+                            queue.complete(job_id, result)
+                        done += 1
+                        if callback:
+                            callback(done, total, result)
+
+                    if suspects and not crashed:
+                        suspects = []
+                    elif crashed:
+                        # Started jobs were charged an attempt; recover() fails the exhausted ones
+                        self.logger.error(f"A worker process died with {len(crashed)} jobs in flight, "
+                                          f"restarting the pool")
+                        pool = self._restart_pool(pool, _init_queue_worker, str(queue_path))
+                        queue.recover()
+                        # Isolate the in-flight jobs; while isolating, go on after the one that crashed
+                        suspects = sorted(crashed) if not suspects else suspects[suspects.index(crashed[0]) + 1:]
+                        stalled = 0 if finished else stalled + 1
+                        if stalled > queue.max_attempts * 2:
+                            raise RuntimeError("Worker processes keep dying before finishing any job")
+            finally:
+                pool.shutdown(wait=True, cancel_futures=True)
+
+            stats = self._export_queue(queue, output_path, fmt)
+            stats['resumed'] = resumed
+        finally:
+            queue.close()
+            Metrics().close()
+
+        self.logger.info(f"Batch completed: {stats['ok']} ok, {stats['failed']} failed "
+                         f"({resumed} jobs resumed from {queue_path})")
+        return stats
+
+    def _iter_tasks(self, tasks):
+        """Chạy task trên process pool, yield kết quả theo thứ tự xong
+
+        A worker that dies (native crash in Tesseract or OpenCV) breaks the
+        pool instead of hanging it. The tasks that were in flight are then
+        run again one at a time on a new pool, and the one that crashes it
+        again is reported as an error result.
+        """
+        tasks = iter(tasks)
+        pool = self._start_pool(_init_worker)
+        try:
+            while True:
+                suspects = []
+                for task, future in _iter_completed(pool, process_task, tasks, self.window):
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool:
+                        suspects.append(task)
+                        continue
+                    yield result
+                if not suspects:
+                    return
+
+                self.logger.error(f"A worker process died with {len(suspects)} tasks in flight, "
+                                  f"restarting the pool")
+                pool = self._restart_pool(pool, _init_worker)
+                for task in suspects:
+                    try:
+                        result = pool.submit(process_task, task).result()
+                    except BrokenProcessPool:
+                        result = _crashed_result(task)
+                        pool = self._restart_pool(pool, _init_worker)
+                    yield result
+        finally:
+            # Workers exit normally (not terminated) and flush their metrics
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def _start_pool(self, initializer, *initargs):
+        """Process pool; engine được khởi tạo trong từng worker"""
+        return ProcessPoolExecutor(self.workers, initializer=initializer, initargs=initargs)
+
+    def _restart_pool(self, pool, initializer, *initargs):
+        """Thay pool bị hỏng (một worker đã chết) bằng pool mới"""
+        pool.shutdown(wait=True, cancel_futures=True)
+        return self._start_pool(initializer, *initargs)
+
+    def _export_queue(self, queue, output_path, fmt=None):
+        """Ghi mọi kết quả đã xong trong hàng đợi ra file, gộp trang theo tài liệu"""
+        from core.pipeline import OCRPipeline
+
+        stats = {'total': 0, 'ok': 0, 'failed': 0}
+
+        def records():
+            pages, current = [], None
+            for path, page, result in queue.iter_finished():
+                if not page:
+                    yield dict(result, image=path)
+                    continue
+                if path != current and pages:
+                    yield dict({'image': current}, **OCRPipeline.merge_pages(pages))
+                    pages = []
+                current = path
+                pages.append(dict(result, page=page))
+            if pages:
+                yield dict({'image': current}, **OCRPipeline.merge_pages(pages))
+
+        with ResultExporter(output_path, fmt) as out:
+            for record in records():
+                out.write(record)
+                stats['total'] += 1
+                stats['failed' if 'error' in record else 'ok'] += 1
+        stats['output'] = str(out.path)
+        return stats
+
+    def _make_tasks(self, image_paths):
+        """Tách tài liệu nhiều trang thành task theo trang
+
+        Returns:
+            (tasks, documents, failures): pool tasks, {path: page_count} and
+            error results for documents that could not be opened
+        """
+        from core.document_loader import DocumentLoader
+
+        loader = DocumentLoader()
+        tasks, documents, failures = [], {}, []
+        for path in image_paths:
+            if not loader.is_document(path):
+                tasks.append(path)
+                continue
+            try:
+                count = loader.page_count(path)
+            except Exception as e:
+                failures.append({'image': str(path), 'error': str(e)})
+                continue
+            if count == 0:
+                failures.append({'image': str(path), 'error': 'document has no pages'})
+                continue
+            documents[str(path)] = count
+            tasks.extend((path, number) for number in range(1, count + 1))
+        return tasks, documents, failures
+
+    def _merge_documents(self, failures, results, documents):
+        """Yield kết quả hoàn chỉnh: ảnh đơn ngay lập tức, tài liệu khi đủ trang"""
+        from core.pipeline import OCRPipeline
+
+        yield from failures
+        pages = {}
+        for result in results:
+            if 'page' not in result:
+                yield result
+                continue
+
+            path = result.pop('image')
+            pages.setdefault(path, []).append(result)
+            if len(pages[path]) == documents[path]:
+                merged = OCRPipeline.merge_pages(pages.pop(path))
+                yield dict({'image': path}, **merged)
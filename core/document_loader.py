@@ -0,0 +1,111 @@
+"""Đọc tài liệu nhiều trang (PDF, TIFF) và raster hóa từng trang khi cần"""
+from pathlib import Path
+import cv2
+import numpy as np
+from utils.config import Config
+from utils.logger import Logger
+
+
+class DocumentLoader:
+    """Lazy page rasterizer for multi-page PDF and TIFF files
+
+    Pages are decoded one at a time (1-based page numbers) and returned as
+    BGR numpy arrays, so a caller never holds more than the page it is
+    working on. PDF support needs PyMuPDF (`pip install pymupdf`); TIFF is
+    read with Pillow.
+    """
+
+    EXTENSIONS = ('.pdf', '.tif', '.tiff')
+
+    def __init__(self):
+        self.config = Config()
+        self.logger = Logger.get_logger('DocumentLoader')
+        self.dpi = int(self.config.get('document.dpi', 200) or 200)
+        self.max_pages = int(self.config.get('document.max_pages', 0) or 0)
+
+    @classmethod
+    def is_document(cls, path):
+        """True nếu file là PDF/TIFF (có thể nhiều trang)"""
+        return isinstance(path, (str, Path)) and Path(path).suffix.lower() in cls.EXTENSIONS
+
+    def page_count(self, path):
+        """Số trang sẽ được xử lý (đã áp dụng document.max_pages)"""
+        try:
+            if self._is_pdf(path):
+                with self._open_pdf(path) as doc:
+                    count = doc.page_count
+            else:
+                from PIL import Image
+                with Image.open(path) as img:
+                    count = getattr(img, 'n_frames', 1)
+        except Exception as e:
+            self.logger.error(f"Cannot open document {path}: {e}")
+            raise
+
+        return min(count, self.max_pages) if self.max_pages else count
+
+    def load_page(self, path, page_number):
+        """Raster hóa một trang (đánh số từ 1) thành ảnh BGR"""
+        try:
+            if self._is_pdf(path):
+                with self._open_pdf(path) as doc:
+                    return self._render_pdf_page(doc[page_number - 1])
+
+            from PIL import Image
+            with Image.open(path) as img:
+                img.seek(page_number - 1)
+                return self._pil_to_bgr(img)
+        except Exception as e:
+            self.logger.error(f"Cannot load page {page_number} of {path}: {e}")
+            raise
+
+    def iter_pages(self, path):
+        """Generator (page_number, BGR image); mở file một lần, giải mã từng trang"""
+        count = self.page_count(path)
+        self.logger.info(f"Document {path}: {count} pages at {self.dpi} DPI")
+
+        if self._is_pdf(path):
+            with self._open_pdf(path) as doc:
+                for number in range(1, count + 1):
+                    yield number, self._render_pdf_page(doc[number - 1])
+        else:
+            from PIL import Image
+            with Image.open(path) as img:
+                for number in range(1, count + 1):
+                    img.seek(number - 1)
+                    yield number, self._pil_to_bgr(img)
+
+    @staticmethod
+    def _is_pdf(path):
+        return Path(path).suffix.lower() == '.pdf'
+
+    @staticmethod
+    def _pymupdf():
+        """Module PyMuPDF (tên `pymupdf` từ 1.24, `fitz` với bản cũ)"""
+        try:
+            import pymupdf
+        except ImportError:
+            try:
+                import fitz as pymupdf
+            except ImportError:
+                raise ImportError("PDF input requires PyMuPDF: pip install pymupdf")
+        return pymupdf
+
+    def _open_pdf(self, path):
+        return self._pymupdf().open(str(path))
+
+    def _render_pdf_page(self, page):
+        """Render trang PDF ở DPI cấu hình, không có kênh alpha"""
+        zoom = self.dpi / 72.0
+        pix = page.get_pixmap(matrix=self._pymupdf().Matrix(zoom, zoom), alpha=False)
+        rgb = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+        if pix.n == 1:
+            return cv2.cvtColor(rgb, cv2.COLOR_GRAY2BGR)
+        return cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+
+    @staticmethod
+    def _pil_to_bgr(img):
+        """Frame PIL (1-bit, L, RGB, CMYK...) → BGR uint8"""
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        return cv2.cvtColor(np.asarray(img), cv2.COLOR_RGB2BGR)
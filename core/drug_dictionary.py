@@ -0,0 +1,196 @@
+"""Từ điển tên thuốc và bộ so khớp Aho-Corasick"""
+import os
+import re
+import sys
+from collections import deque, namedtuple
+from pathlib import Path
+from utils.config import Config
+from utils.logger import Logger
+from core.fuzzy_matcher import SymSpellIndex
+
+# distance = 0 for exact dictionary hits, > 0 for fuzzy (OCR-error tolerant) hits
+DrugMatch = namedtuple('DrugMatch', ['start', 'end', 'text', 'canonical', 'distance'], defaults=[0])
+
+# Candidate tokens for fuzzy lookup: words starting with a letter (digits allowed inside, e.g. PARACETAM0L)
+_TOKEN_PATTERN = re.compile(r'[^\W\d_][^\W_]*')
+
+
+def _upper_same_length(text):
+    """Upper-case giữ nguyên độ dài để span khớp với chuỗi gốc"""
+    upper = text.upper()
+    if len(upper) == len(text):
+        return upper
+    return ''.join(c.upper() if len(c.upper()) == 1 else c for c in text)
+
+
+class DrugDictionary:
+    """Drug name dictionary compiled into an Aho-Corasick automaton
+
+    Matching is case-insensitive, respects word boundaries and runs in time
+    linear in the line length regardless of dictionary size.
+    """
+
+    def __init__(self, path=None):
+        self.config = Config()
+        self.logger = Logger.get_logger('DrugDictionary')
+
+        self.path = self._resolve_path(path or self.config.get('keywords.drug_dictionary', 'data/drugs.txt'))
+        self.canonical = {}  # upper-cased surface form -> canonical name
+        self.fuzzy_max_distance = int(self.config.get('keywords.fuzzy_max_distance', 2) or 0)
+        self.fuzzy_min_length = int(self.config.get('keywords.fuzzy_min_length', 5) or 5)
+        self._load()
+        self._build_automaton()
+        self.fuzzy_index = SymSpellIndex(self.canonical, max_distance=self.fuzzy_max_distance)
+
+    @staticmethod
+    def _resolve_path(path):
+        """Tìm file dữ liệu cả khi chạy từ bản build PyInstaller"""
+        if os.path.isabs(path) or os.path.exists(path):
+            return Path(path)
+        if getattr(sys, 'frozen', False):
+            return Path(sys._MEIPASS) / path
+        return Path(__file__).parent.parent / path
+
+    def _load(self):
+        """Đọc danh mục: một tên mỗi dòng, 'BIẾN THỂ = TÊN CHUẨN' cho alias"""
+        if not self.path.exists():
+            raise FileNotFoundError(f"Drug dictionary not found: {self.path}")
+
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for raw in f:
+                ln = raw.strip()
+                if not ln or ln.startswith('#'):
+                    continue
+                if '=' in ln:
+                    alias, canonical = (part.strip() for part in ln.split('=', 1))
+                else:
+                    alias = canonical = ln
+                self.canonical[_upper_same_length(alias)] = canonical
+
+        self.logger.info(f"Loaded {len(self.canonical)} drug names from {self.path}")
+
+    def _build_automaton(self):
+        """Dựng trie + failure links"""
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]  # state -> list of pattern lengths ending here
+
+        for name in self.canonical:
+            state = 0
+            for ch in name:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = nxt
+            self._out[state].append(len(name))
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find_all(self, text, fuzzy=False):
+        """Tìm mọi tên thuốc trong dòng
+
+        Args:
+            text: Line to search
+            fuzzy: Also look up words not matched exactly in the fuzzy index
+
+        Returns:
+            List of DrugMatch (start, end, text, canonical, distance),
+            non-overlapping, preferring the longest match at each position
+        """
+        if not text:
+            return []
+
+        matches = self._find_exact(text)
+        if fuzzy and self.fuzzy_max_distance > 0:
+            matches = self._add_fuzzy(text, matches)
+        return matches
+
+    def _find_exact(self, text):
+        """Quét Aho-Corasick một lượt qua dòng"""
+        upper = _upper_same_length(text)
+        goto, fail, out = self._goto, self._fail, self._out
+        candidates = []
+        state = 0
+
+        for i, ch in enumerate(upper):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for length in out[state]:
+                start = i + 1 - length
+                end = i + 1
+                if (start == 0 or not upper[start - 1].isalnum()) and \
+                        (end == len(upper) or not upper[end].isalnum()):
+                    candidates.append((start, end))
+
+        # Resolve overlaps: leftmost, then longest
+        candidates.sort(key=lambda span: (span[0], -span[1]))
+        matches = []
+        last_end = -1
+        for start, end in candidates:
+            if start >= last_end:
+                matches.append(DrugMatch(start, end, text[start:end], self.canonical[upper[start:end]]))
+                last_end = end
+        return matches
+
+    def _add_fuzzy(self, text, matches):
+        """Bổ sung các từ gần giống tên thuốc (lỗi OCR) chưa khớp chính xác"""
+        covered = [(m.start, m.end) for m in matches]
+        extra = []
+
+        for token in _TOKEN_PATTERN.finditer(text):
+            start, end = token.span()
+            if end - start < self.fuzzy_min_length:
+                continue
+            if any(s < end and start < e for s, e in covered):
+                continue
+
+            # Allow one edit per 4 characters, capped by keywords.fuzzy_max_distance
+            max_distance = max(1, min(self.fuzzy_max_distance, (end - start) // 4))
+            found = self.fuzzy_index.lookup(_upper_same_length(token.group()), max_distance)
+            if found:
+                best = found[0]
+                extra.append(DrugMatch(start, end, token.group(), self.canonical[best.term], best.distance))
+
+        if not extra:
+            return matches
+        return sorted(matches + extra, key=lambda m: m.start)
+
+    def lookup(self, token):
+        """Tra một từ: trả về [(canonical, distance), ...] theo khoảng cách tăng dần"""
+        key = _upper_same_length(token)
+        if key in self.canonical:
+            return [(self.canonical[key], 0)]
+        return [(self.canonical[m.term], m.distance) for m in self.fuzzy_index.lookup(key)]
+
+    def has_match(self, text, fuzzy=True):
+        """Dòng có chứa tên thuốc không (chỉ tra fuzzy khi không khớp chính xác)"""
+        if not text:
+            return False
+        if self._find_exact(text):
+            return True
+        return fuzzy and self.fuzzy_max_distance > 0 and bool(self._add_fuzzy(text, []))
+
+    def first_match(self, text, fuzzy=True):
+        """Tên thuốc đầu tiên trong dòng, hoặc None"""
+        matches = self.find_all(text, fuzzy=fuzzy)
+        return matches[0] if matches else None
+
+    def __contains__(self, name):
+        return _upper_same_length(name) in self.canonical
+
+    def __len__(self):
+        return len(self.canonical)
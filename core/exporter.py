@@ -0,0 +1,189 @@
+"""Ghi kết quả hàng loạt ra JSON Lines, Parquet (pyarrow) hoặc CSV theo từng row group"""
+import csv
+import json
+from pathlib import Path
+from utils.config import Config
+from utils.logger import Logger
+
+FORMATS = ('jsonl', 'parquet', 'csv')
+
+# Medication record fields (core.medication_parser.Medication) stored per row
+MEDICATION_FIELDS = (
+    ('drug', 'string'), ('drug_start', 'int32'), ('drug_end', 'int32'),
+    ('strength', 'float64'), ('unit', 'string'), ('quantity', 'float64'), ('form', 'string'),
+    ('dose', 'float64'), ('times_per_day', 'float64'), ('route', 'string'),
+    ('morning', 'float64'), ('noon', 'float64'), ('afternoon', 'float64'), ('evening', 'float64'),
+    ('line', 'string'),
+)
+
+COLUMNS = ('image', 'page_count', 'error', 'info', 'meds', 'medications', 'raw_text', 'timings')
+# Nested columns are JSON-encoded in CSV cells
+NESTED_COLUMNS = ('info', 'meds', 'medications', 'timings')
+
+
+class ResultExporter:
+    """Buffered writer for pipeline results, one row per image or document
+
+    Columns: image, page_count (documents only), error, info and meds (lists
+    of lines), medications (list of structured records), raw_text and
+    timings (stage -> ms). Rows are buffered in memory and written
+    export.row_group_size at a time, so each Parquet row group / CSV write
+    covers many results. Parquet needs pyarrow (`pip install pyarrow`);
+    without it the export falls back to CSV next to the requested path.
+    JSON Lines rows are written immediately, as the batch runner always did.
+
+    Usage:
+        with ResultExporter('results.parquet') as exporter:
+            for result in results:
+                exporter.write(result)
+    """
+
+    def __init__(self, path, fmt=None):
+        self.config = Config()
+        self.logger = Logger.get_logger('ResultExporter')
+        self.path = Path(path)
+        self.format = fmt or self.format_for(self.path)
+        if self.format not in FORMATS:
+            raise ValueError(f"Unknown export format: {self.format} (expected one of {', '.join(FORMATS)})")
+        self.row_group_size = int(self.config.get('export.row_group_size', 10000) or 1)
+        self.compression = self.config.get('export.compression', 'zstd') or None
+
+        self.rows = 0
+        self._buffer = []
+        self._file = None
+        self._writer = None
+        self._pa = None
+
+        if self.format == 'parquet':
+            try:
+                import pyarrow
+                import pyarrow.parquet
+                self._pa = pyarrow
+            except ImportError:
+                self.path = self.path.with_suffix('.csv')
+                self.format = 'csv'
+                self.logger.warning(f"Parquet export requires pyarrow (pip install pyarrow); "
+                                    f"writing CSV to {self.path} instead")
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def format_for(path):
+        """Định dạng theo đuôi file: .parquet, .csv, còn lại là JSON Lines"""
+        suffix = Path(path).suffix.lower()
+        if suffix in ('.parquet', '.pq'):
+            return 'parquet'
+        if suffix == '.csv':
+            return 'csv'
+        return 'jsonl'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write(self, result):
+        """Thêm một kết quả (dict của OCRPipeline.run/merge_pages có thêm 'image')"""
+        if self.format == 'jsonl':
+            if self._file is None:
+                self._file = open(self.path, 'w', encoding='utf-8')
+            self._file.write(json.dumps(result, ensure_ascii=False) + '\n')
+            self._file.flush()
+            self.rows += 1
+            return
+
+        self._buffer.append(self._row(result))
+        if len(self._buffer) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        """Ghi các dòng đang đệm thành một row group"""
+        if not self._buffer:
+            return
+        try:
+            if self.format == 'parquet':
+                self._flush_parquet()
+            else:
+                self._flush_csv()
+        except Exception as e:
+            self.logger.error(f"Export to {self.path} failed: {e}")
+            raise
+        self.rows += len(self._buffer)
+        self._buffer = []
+
+    def close(self):
+        """Ghi phần còn lại và đóng file (không có dòng nào vẫn tạo file hợp lệ có header/schema)"""
+        self.flush()
+        if self.format == 'parquet':
+            if self._writer is None:
+                self._open_parquet()
+            self._writer.close()
+        elif self.format == 'csv' and self._writer is None:
+            self._open_csv()
+        elif self.format == 'jsonl' and self._file is None:
+            self._file = open(self.path, 'w', encoding='utf-8')
+
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.logger.info(f"Exported {self.rows} results to {self.path} ({self.format})")
+
+    @staticmethod
+    def _row(result):
+        """Kết quả pipeline → dict theo COLUMNS"""
+        medications = []
+        for med in result.get('medications') or []:
+            medications.append({name: med.get(name) for name, _ in MEDICATION_FIELDS})
+        return {
+            'image': str(result.get('image', '')),
+            'page_count': result.get('page_count'),
+            'error': result.get('error'),
+            'info': list(result.get('info') or []),
+            'meds': list(result.get('meds') or []),
+            'medications': medications,
+            'raw_text': result.get('raw_text'),
+            'timings': {name: float(ms) for name, ms in (result.get('timings') or {}).items()},
+        }
+
+    def _schema(self):
+        pa = self._pa
+        medication = pa.struct([(name, getattr(pa, kind)()) for name, kind in MEDICATION_FIELDS])
+        return pa.schema([
+            ('image', pa.string()),
+            ('page_count', pa.int32()),
+            ('error', pa.string()),
+            ('info', pa.list_(pa.string())),
+            ('meds', pa.list_(pa.string())),
+            ('medications', pa.list_(medication)),
+            ('raw_text', pa.string()),
+            ('timings', pa.map_(pa.string(), pa.float64())),
+        ])
+
+    def _open_parquet(self):
+        self._writer = self._pa.parquet.ParquetWriter(str(self.path), self._schema(),
+                                                      compression=self.compression)
+
+    def _flush_parquet(self):
+        if self._writer is None:
+            self._open_parquet()
+        columns = {name: [row[name] for row in self._buffer] for name in COLUMNS}
+        # Map columns take (key, value) pairs
+        columns['timings'] = [list(timings.items()) for timings in columns['timings']]
+        table = self._pa.Table.from_pydict(columns, schema=self._writer.schema)
+        self._writer.write_table(table, row_group_size=len(self._buffer))
+
+    def _open_csv(self):
+        self._file = open(self.path, 'w', encoding='utf-8', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(COLUMNS)
+
+    def _flush_csv(self):
+        if self._writer is None:
+            self._open_csv()
+        self._writer.writerows(
+            [json.dumps(row[name], ensure_ascii=False) if name in NESTED_COLUMNS else row[name]
+             for name in COLUMNS]
+            for row in self._buffer
+        )
+        self._file.flush()
@@ -0,0 +1,87 @@
+"""So khớp gần đúng (chịu lỗi OCR) bằng chỉ mục xóa ký tự kiểu SymSpell"""
+from collections import namedtuple
+
+FuzzyMatch = namedtuple('FuzzyMatch', ['term', 'distance'])
+
+
+def _deletes(word, max_distance):
+    """Tất cả biến thể sau khi xóa tối đa max_distance ký tự"""
+    result = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        nxt = set()
+        for w in frontier:
+            if len(w) <= 1:
+                continue
+            for i in range(len(w)):
+                nxt.add(w[:i] + w[i + 1:])
+        nxt -= result
+        result |= nxt
+        frontier = nxt
+    return result
+
+
+def bounded_distance(a, b, max_distance):
+    """Damerau-Levenshtein (OSA), trả về max_distance + 1 nếu vượt ngưỡng"""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+
+    prev_prev = None
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        row_min = i
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            val = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if prev_prev is not None and i > 1 and j > 1 and \
+                    a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                val = min(val, prev_prev[j - 2] + 1)
+            cur[j] = val
+            row_min = min(row_min, val)
+        if row_min > max_distance:
+            return max_distance + 1
+        prev_prev, prev = prev, cur
+    return prev[-1]
+
+
+class SymSpellIndex:
+    """Symmetric-delete index for bounded edit-distance lookups
+
+    Every term contributes the deletions of its first prefix_length
+    characters; a query only verifies terms that share a deletion variant,
+    so a lookup never scans the whole dictionary.
+    """
+
+    def __init__(self, terms, max_distance=2, prefix_length=7):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self._index = {}
+
+        for term in terms:
+            for variant in _deletes(term[:prefix_length], max_distance):
+                self._index.setdefault(variant, []).append(term)
+
+    def lookup(self, token, max_distance=None):
+        """Tìm các term trong ngưỡng khoảng cách
+
+        Returns:
+            List of FuzzyMatch sorted by distance, then term
+        """
+        if max_distance is None:
+            max_distance = self.max_distance
+        max_distance = min(max_distance, self.max_distance)
+
+        seen = set()
+        matches = []
+        for variant in _deletes(token[:self.prefix_length], max_distance):
+            for term in self._index.get(variant, ()):
+                if term in seen:
+                    continue
+                seen.add(term)
+                distance = bounded_distance(token, term, max_distance)
+                if distance <= max_distance:
+                    matches.append(FuzzyMatch(term, distance))
+
+        matches.sort(key=lambda m: (m.distance, m.term))
+        return matches
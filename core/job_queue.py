@@ -0,0 +1,175 @@
+"""Hàng đợi công việc bền vững (SQLite) cho batch chạy lại được sau khi bị dừng"""
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from utils.config import Config
+from utils.logger import Logger
+
+PENDING = 'pending'
+IN_PROGRESS = 'in_progress'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class JobQueue:
+    """SQLite-backed queue of batch jobs (one image or one document page each)
+
+    Every finished job is committed with its result, so the database is the
+    checkpoint: after a crash or restart, jobs left in_progress go back to
+    pending and only unfinished work is processed again. An attempt is
+    counted when a worker starts a job (see start), so a job that kills its
+    worker (a native crash in Tesseract or OpenCV) also uses up its
+    attempts, while jobs that were only claimed do not. Jobs are retried
+    until batch.queue.max_attempts, then kept as failed.
+    """
+
+    def __init__(self, path):
+        self.config = Config()
+        self.logger = Logger.get_logger('JobQueue')
+        self._lock = threading.Lock()
+        self.path = Path(path)
+        self.max_attempts = int(self.config.get('batch.queue.max_attempts', 3) or 1)
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL survives process crashes; only an OS crash can lose the last commits
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY, path TEXT NOT NULL, page INTEGER NOT NULL DEFAULT 0, "
+            "status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+            "error TEXT, result TEXT, updated REAL NOT NULL, UNIQUE (path, page))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, id)")
+        self._db.commit()
+
+    def recover(self):
+        """Đưa các job đang dở (in_progress) của lần chạy trước về pending
+
+        Jobs that already used all attempts are marked failed instead: they
+        were running every time the runner died.
+
+        Returns:
+            Number of jobs put back to pending
+        """
+        now = time.time()
+        with self._lock:
+            failed = self._db.execute(
+                "UPDATE jobs SET status = ?, error = COALESCE(error, ?), updated = ? "
+                "WHERE status = ? AND attempts >= ?",
+                (FAILED, "interrupted (worker crash?) on every attempt", now, IN_PROGRESS,
+                 self.max_attempts)).rowcount
+            recovered = self._db.execute("UPDATE jobs SET status = ?, updated = ? WHERE status = ?",
+                                         (PENDING, now, IN_PROGRESS)).rowcount
+            self._db.commit()
+        if failed:
+            self.logger.warning(f"{failed} interrupted jobs reached batch.queue.max_attempts, marked failed")
+        if recovered:
+            self.logger.info(f"Recovered {recovered} interrupted jobs")
+        return recovered
+
+    def known_paths(self):
+        """Tập đường dẫn đã có trong hàng đợi (ở bất kỳ trạng thái nào)"""
+        with self._lock:
+            return {row[0] for row in self._db.execute("SELECT DISTINCT path FROM jobs")}
+
+    def add(self, tasks):
+        """Thêm task (đường dẫn ảnh hoặc (tài liệu, số trang)); task đã có được giữ nguyên
+
+        Returns:
+            Number of newly added jobs
+        """
+        now = time.time()
+        rows = [(str(task[0]), task[1], PENDING, now) if isinstance(task, tuple)
+                else (str(task), 0, PENDING, now) for task in tasks]
+        with self._lock:
+            before = self._db.total_changes
+            self._db.executemany(
+                "INSERT OR IGNORE INTO jobs (path, page, status, updated) VALUES (?, ?, ?, ?)", rows)
+            self._db.commit()
+            return self._db.total_changes - before
+
+    def add_failure(self, path, error):
+        """Ghi nhận một input không tạo được job (ví dụ tài liệu không mở được)"""
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO jobs (path, page, status, attempts, error, updated) "
+                "VALUES (?, 0, ?, 1, ?, ?)", (str(path), FAILED, error, time.time()))
+            self._db.commit()
+
+    def claim(self, limit, ids=None):
+        """Lấy tối đa `limit` job pending (chỉ trong `ids` nếu có) và đánh dấu in_progress
+
+        Returns:
+            List of (job_id, task) with task as accepted by core.batch.process_task
+        """
+        query, params = "SELECT id, path, page FROM jobs WHERE status = ?", [PENDING]
+        if ids is not None:
+            query += f" AND id IN ({', '.join('?' * len(ids))})"
+            params += list(ids)
+        with self._lock:
+            rows = self._db.execute(query + " ORDER BY id LIMIT ?", params + [int(limit)]).fetchall()
+            self._db.executemany("UPDATE jobs SET status = ?, updated = ? WHERE id = ?",
+                                 [(IN_PROGRESS, time.time(), job_id) for job_id, _, _ in rows])
+            self._db.commit()
+        return [(job_id, (path, page) if page else path) for job_id, path, page in rows]
+
+    def start(self, job_id):
+        """Tính một lần thử khi worker bắt đầu xử lý job (gọi từ worker process)"""
+        with self._lock:
+            self._db.execute("UPDATE jobs SET attempts = attempts + 1, updated = ? WHERE id = ?",
+                             (time.time(), job_id))
+            self._db.commit()
+
+    def complete(self, job_id, result):
+        """Lưu kết quả thành công (checkpoint)"""
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, error = NULL, result = ?, updated = ? "
+                "WHERE id = ?", (DONE, json.dumps(result, ensure_ascii=False), time.time(), job_id))
+            self._db.commit()
+
+    def fail(self, job_id, error):
+        """Ghi lỗi; job quay lại pending cho tới khi hết batch.queue.max_attempts
+
+        Returns:
+            True if the job will be retried
+        """
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET error = ?, updated = ?, "
+                "status = CASE WHEN attempts < ? THEN ? ELSE ? END WHERE id = ?",
+                (error, time.time(), self.max_attempts, PENDING, FAILED, job_id))
+            self._db.commit()
+            status = self._db.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+        return status == PENDING
+
+    def counts(self):
+        """Số job theo trạng thái"""
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {PENDING: 0, IN_PROGRESS: 0, DONE: 0, FAILED: 0}
+        counts.update(rows)
+        return counts
+
+    def iter_finished(self):
+        """Generator các job đã xong hoặc đã hết lượt thử, theo (path, page)
+
+        Yields:
+            (path, page, result dict); failed jobs yield {'error': ...}
+        """
+        # Streamed from the cursor so millions of results are never held in memory at once;
+        # meant for the export at the end of a run, when no worker thread uses the queue
+        rows = self._db.execute(
+            "SELECT path, page, status, result, error FROM jobs WHERE status IN (?, ?) "
+            "ORDER BY path, page", (DONE, FAILED))
+        for path, page, status, result, error in rows:
+            yield path, page, json.loads(result) if status == DONE else {'error': error}
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -2,6 +2,20 @@
 import re
 from utils.config import Config
 from utils.logger import Logger
+from utils.metrics import Metrics
+from core.drug_dictionary import DrugDictionary
+from core.semantic_classifier import SemanticClassifier
+from core.medication_parser import MedicationParser
+
+# Vietnamese letters (any case), used to keep only lines with real text
+_VI_LETTER_PATTERN = re.compile(r'[a-záàảãạăằẳẵặâầẩẫậéèẻẽẹêềểễệíìỉĩịóòỏõọôồổỗộơờởỡợúùủũụưừửữựýỳỷỹỵđA-ZÀÁẢÃẠĂẰẲẴẶÂẦẨẪẬÉÈẺẼẸÊỀỂỄỆÍÌỈĨỊÓÒỎÕỌÔỒỔỖỘƠỜỞỠỢÚÙỦŨỤƯỪỬỮỰÝỲỶỸỴĐ]')
+
+# Split on sentence-like boundaries: period + space + capital letter, or common keywords
+_SEGMENT_PATTERN = re.compile(r'(?:\.(?=\s+[A-ZÀÁẢÃẠĂẰẲẴẶÂẦẨẪẬÉÈẺẼẸÊỀỂỄỆÍÌỈĨỊÓÒỎÕỌÔỒỔỖỘƠỜỞỠỢÚÙỦŨỤƯỪỬỮỰÝỲỶỸỴĐ])|(?=(?:PROPANOLOL|AUGMENTIN|PARACETAMOL|IBUPROFEN|SỐ|ĐƠN THUỐC)))')
+
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+_DIGIT_PATTERN = re.compile(r'\d')
+_NON_WORD_PATTERN = re.compile(r'[^a-záàảãạăằẳẵặâầẩẫậéèẻẽẹêềểễệíìỉĩịóòỏõọôồổỗộơờởỡợúùủũụưừửữựýỳỷỹỵđ0-9\s]')
 
 class KeywordExtractor:
     """Keyword Extraction & Classification"""
@@ -9,25 +23,73 @@ class KeywordExtractor:
     def __init__(self):
         self.config = Config()
         self.logger = Logger.get_logger('KeywordExtractor')
+        self.metrics = Metrics()
+        self._build_classifiers()
+        # Optional embedding fallback (keywords.semantic), model loaded on first use
+        self.semantic = SemanticClassifier()
+    
+    def reload(self):
+        """Biên dịch lại các pattern và tạo lại bộ phân loại semantic sau khi config thay đổi"""
+        self._build_classifiers()
+        # Model, prototypes and thresholds are read when the classifier is created; loaded again on first use
+        self.semantic = SemanticClassifier()
+        self.logger.info("Classifiers reloaded from config")
+    
+    def warm_up(self):
+        """Tải trước model semantic (nếu bật) để lần phân tích đầu không phải chờ"""
+        self.semantic.load()
+    
+    def _build_classifiers(self):
+        """Biên dịch tất cả regex phân loại một lần"""
+        info_keywords = self.config.get('keywords.info', []) or []
+        
+        # Build pattern for info keywords
+        info_pattern_parts = [re.escape(kw.lower()) for kw in info_keywords]
+        self.info_pattern = re.compile('|'.join(info_pattern_parts), re.I) if info_pattern_parts else None
+        
+        # Medication patterns
+        self.med_pattern = re.compile(r"\d+\s*(mg|ml|g|viên|tab|mcg|%)", re.I)
+        self.dosage_pattern = re.compile(r"\b(uống|sáng|chiều|tối|buổi|lần|ngày|tuần|gói|lần|x)\b", re.I)
+        self.unit_pattern = re.compile(r"\b(mg|ml|g|viên|tab|mcg|%|gói)\b", re.I)
+        
+        # Drug names from the dictionary file, with fuzzy matching for OCR misreads
+        self.drugs = DrugDictionary()
+        self.medication_parser = MedicationParser(self.drugs)
+        
+        # Exclude patterns - these are definitely NOT medications
+        self.exclude_pattern = re.compile(r"(phòng khám|bệnh viện|bs\.|dr\.|thi|trang|địa|bệnh viện|số điện|quận|thành phố|tỉnh|www|@|\.com|\.vn|^[a-z0-9]{1,2}$)", re.I)
     
     def extract(self, text, callback=None):
-        """Phân tích và phân loại văn bản"""
+        """Phân tích và phân loại văn bản
+        
+        Args:
+            text: OCR text, or the recognized lines (strings or the line dicts
+                from OCREngine.extract_lines), which are used as-is
+            callback: Status callback function
+        """
         try:
             if callback:
                 callback("⏳ Analyzing text...")
             
-            lines = self._parse_lines(text)
+            with self.metrics.span('extract.parse_lines') as span:
+                lines = self._parse_lines(text)
+                span['lines'] = len(lines)
             self.logger.debug(f"Parsed {len(lines)} lines from OCR text")
             
-            patient_info, medications = self._classify_lines(lines)
+            with self.metrics.span('extract.classify', lines=len(lines)):
+                patient_info, medications = self._classify_lines(lines)
             
             self.logger.info(f"Extracted {len(patient_info)} info lines, {len(medications)} medications")
             
             # If still empty, log the actual text for debugging
             if not patient_info and not medications:
-                self.logger.warning(f"No results extracted. Text preview: {text[:200]}")
+                self.logger.warning(f"No results extracted. Text preview: {str(text)[:200]}")
             
-            return {'info': patient_info, 'meds': medications}
+            return {
+                'info': patient_info,
+                'meds': medications,
+                'medications': self.medication_records(medications),
+            }
             
         except Exception as e:
             self.logger.error(f"Extraction error: {e}")
@@ -37,109 +99,143 @@ class KeywordExtractor:
         """Smart line parsing that handles both structured and unstructured OCR text"""
         lines = []
         
-        # First try: split by actual line breaks
-        potential_lines = text.splitlines()
-        
-        # If very few lines (< 3), the text is likely one huge block - split it
-        if len(potential_lines) < 3:
-            # Split on sentence-like boundaries: period + space + capital letter, or common keywords
-            segments = re.split(r'(?:\.(?=\s+[A-ZÀÁẢÃẠĂẰẲẴẶÂẦẨẪẬÉÈẺẼẸÊỀỂỄỆÍÌỈĨỊÓÒỎÕỌÔỒỔỖỘƠỜỞỠỢÚÙỦŨỤƯỪỬỮỰÝỲỶỸỴĐ])|(?=(?:PROPANOLOL|AUGMENTIN|PARACETAMOL|IBUPROFEN|SỐ|ĐƠN THUỐC)))', text, maxsplit=50)
-            potential_lines = [s.strip() for s in segments if s.strip()]
+        if isinstance(text, (list, tuple)):
+            # Lines from OCREngine.extract_lines: Tesseract already segmented them
+            potential_lines = [ln['text'] if isinstance(ln, dict) else ln for ln in text]
+        else:
+            # First try: split by actual line breaks
+            potential_lines = text.splitlines()
+            
+            # If very few lines (< 3), the text is likely one huge block - split it
+            if len(potential_lines) < 3:
+                segments = _SEGMENT_PATTERN.split(text)
+                potential_lines = [s.strip() for s in segments if s.strip()]
         
         for ln in potential_lines:
             # Clean up whitespace
-            s = re.sub(r'\s+', ' ', ln.strip())
+            s = _WHITESPACE_PATTERN.sub(' ', ln.strip())
             
             # Keep lines that have actual Vietnamese text (not just symbols)
-            if len(s) >= 3 and re.search(r'[a-záàảãạăằẳẵặâầẩẫậéèẻẽẹêềểễệíìỉĩịóòỏõọôồổỗộơờởỡợúùủũụưừửữựýỳỷỹỵđA-ZÀÁẢÃẠĂẰẲẴẶÂẦẨẪẬÉÈẺẼẸÊỀỂỄỆÍÌỈĨỊÓÒỎÕỌÔỒỔỖỘƠỜỞỠỢÚÙỦŨỤƯỪỬỮỰÝỲỶỸỴĐ]', s):
+            if len(s) >= 3 and _VI_LETTER_PATTERN.search(s):
                 lines.append(s)
         
         self.logger.debug(f"Total lines parsed: {len(lines)}")
         if len(lines) < 1:
-            self.logger.warning(f"Very few lines parsed. Raw text: {text[:100]}")
+            self.logger.warning(f"Very few lines parsed. Raw text: {potential_lines[:5]}")
         
         return lines
     
     def _classify_lines(self, lines):
-        info_keywords = self.config.get('keywords.info', []) or []
+        """Phân loại từng dòng (chỉ dùng pattern đã biên dịch sẵn)"""
+        categories = [self.classify_line(ln) for ln in lines]
+        self._classify_semantic(lines, categories)
         
-        patient_info = []
-        medications = []
+        patient_info = [ln for ln, category in zip(lines, categories) if category == 'info']
+        medications = [ln for ln, category in zip(lines, categories) if category == 'meds']
         
-        # Build pattern for info keywords with fuzzy matching
-        info_pattern_parts = []
-        for kw in info_keywords:
-            # Make each keyword match even with OCR errors
-            info_pattern_parts.append(re.escape(kw.lower()))
+        # Last resort: return something
+        if not medications and not patient_info and lines:
+            medications = self._fallback_medications(lines)
         
-        if info_pattern_parts:
-            info_pattern = re.compile('|'.join(info_pattern_parts), re.I)
-        else:
-            info_pattern = None
+        self.logger.info(f"Extracted {len(patient_info)} info lines, {len(medications)} medications from {len(lines)} parsed lines")
+        return patient_info, medications
+    
+    def classify_line(self, ln):
+        """Phân loại một dòng: 'info', 'meds' hoặc None"""
+        if not ln or len(ln) < 2:
+            return None
         
-        # Medication patterns
-        med_pattern = re.compile(r"\d+\s*(mg|ml|g|viên|tab|mcg|%)", re.I)
-        dosage_pattern = re.compile(r"\b(uống|sáng|chiều|tối|buổi|lần|ngày|tuần|gói|lần|x)\b", re.I)
-        unit_pattern = re.compile(r"\b(mg|ml|g|viên|tab|mcg|%|gói)\b", re.I)
+        lnl_clean = _NON_WORD_PATTERN.sub('', ln.lower())
         
-        # Common drug names - explicitly list them (including misspelled versions from OCR)
-        drug_names = r"\b(PROPANOLOL|AUGMENTIN|AUNGMENTIN|PARACETAMOL|IBUPROFEN|AMOXICILLIN|CEPHALEXIN|CEFIXIME|OMEPRAZOLE|RANITIDINE|SALBUTAMOL|LORATADINE|CETIRIZINE|VITAMIN|ASPIRIN|METFORMIN|LISINOPRIL|AMLODIPINE|LACTASE|SODIUM|CALCIUM|ZINC|IRON|ERYTHROMYCIN|DOXYCYCLINE|FLUOROQUINOLONE)\b"
-        drug_pattern = re.compile(drug_names, re.I)
+        has_drug = self.drugs.has_match(ln)
         
-        # Exclude patterns - these are definitely NOT medications
-        exclude_pattern = re.compile(r"(phòng khám|bệnh viện|bs\.|dr\.|thi|trang|địa|bệnh viện|số điện|quận|thành phố|tỉnh|www|@|\.com|\.vn|^[a-z0-9]{1,2}$)", re.I)
+        # Skip lines with exclude patterns (but keep if they have drug names)
+        if self.exclude_pattern.search(ln) and not has_drug:
+            return None
         
-        # Clean function
-        def clean_for_match(text):
-            return re.sub(r'[^a-záàảãạăằẳẵặâầẩẫậéèẻẽẹêềểễệíìỉĩịóòỏõọôồổỗộơờởỡợúùủũụưừửữựýỳỷỹỵđ0-9\s]', '', text.lower())
+        # PRIORITY 1: If it contains drug name, it's medication
+        if has_drug:
+            return 'meds'
         
-        for ln in lines:
-            if not ln or len(ln) < 2:
-                continue
-            
-            lnl = ln.lower()
-            lnl_clean = clean_for_match(lnl)
-            
-            # Skip lines with exclude patterns (but keep if they have drug names)
-            if exclude_pattern.search(ln) and not drug_pattern.search(ln):
-                continue
-            
-            # PRIORITY 1: If it contains drug name, it's medication
-            if drug_pattern.search(ln):
-                medications.append(ln)
-                continue
-            
-            # PRIORITY 2: Check if it contains patient info keyword
-            if info_pattern and info_pattern.search(lnl_clean):
-                patient_info.append(ln)
-                continue
-            
-            # PRIORITY 3: If it has clear dosage info AND units, likely medication
-            if med_pattern.search(ln) and len(ln) < 100:
-                medications.append(ln)
-                continue
-            
-            # PRIORITY 4: If it has dosage words AND units, likely medication
-            if dosage_pattern.search(lnl_clean) and unit_pattern.search(ln) and len(ln) < 150:
-                medications.append(ln)
-                continue
-            
-            # PRIORITY 5: Contains dosage words alone
-            if dosage_pattern.search(lnl_clean) and len(ln) < 150:
-                medications.append(ln)
+        # PRIORITY 2: Check if it contains patient info keyword
+        if self.info_pattern and self.info_pattern.search(lnl_clean):
+            return 'info'
         
-        # Last resort: return something
-        if not medications and not patient_info and lines:
-            # Return lines with numbers (likely dosages)
-            for ln in lines:
-                if re.search(r'\d', ln) and len(ln) < 200:
-                    medications.append(ln)
-            
-            # Or just return first few lines
-            if not medications:
-                medications = lines[:20]
+        # PRIORITY 3: If it has clear dosage info AND units, likely medication
+        if self.med_pattern.search(ln) and len(ln) < 100:
+            return 'meds'
         
-        self.logger.info(f"Extracted {len(patient_info)} info lines, {len(medications)} medications from {len(lines)} parsed lines")
-        return patient_info, medications
+        # PRIORITY 4: If it has dosage words AND units, likely medication
+        if self.dosage_pattern.search(lnl_clean) and self.unit_pattern.search(ln) and len(ln) < 150:
+            return 'meds'
         
-        return patient_info, medications
+        # PRIORITY 5: Contains dosage words alone
+        if self.dosage_pattern.search(lnl_clean) and len(ln) < 150:
+            return 'meds'
+        
+        return None
+    
+    def _classify_semantic(self, lines, categories):
+        """Gửi tất cả dòng chưa phân loại sang SemanticClassifier trong một lô (sửa categories tại chỗ)"""
+        if not self.semantic.enabled:
+            return categories
+        
+        pending = [i for i, category in enumerate(categories) if category is None]
+        if pending:
+            found = self.semantic.classify([lines[i] for i in pending])
+            for i, category in zip(pending, found):
+                categories[i] = category
+        return categories
+    
+    def parse_medications(self, lines):
+        """Tách các dòng thuốc thành bản ghi Medication (tên, hàm lượng, số lượng, lịch uống)"""
+        with self.metrics.span('extract.parse_medications', lines=len(lines)):
+            return self.medication_parser.parse_all(lines)
+    
+    def medication_records(self, lines):
+        """Như parse_medications nhưng trả về dict (để ghi JSON/cache)"""
+        return [med.to_dict() for med in self.parse_medications(lines)]
+    
+    def _fallback_medications(self, lines):
+        """Khi không phân loại được dòng nào"""
+        # Return lines with numbers (likely dosages)
+        medications = [ln for ln in lines if _DIGIT_PATTERN.search(ln) and len(ln) < 200]
+        
+        # Or just return first few lines
+        return medications or lines[:20]
+    
+    def iter_extract(self, chunks):
+        """Phân loại tăng dần khi văn bản OCR đến theo từng khối
+        
+        Args:
+            chunks: Iterable of OCR text chunks or line lists (e.g. one per text block)
+            
+        Yields:
+            (category, line) with category 'info' or 'meds'. Lines classified
+            by the semantic fallback come after all rule-based lines (one
+            batch per document); the last-resort fallback lines are yielded
+            at the end if nothing was classified
+        """
+        seen = []
+        unclassified = []
+        classified = False
+        
+        for chunk in chunks:
+            for ln in self._parse_lines(chunk):
+                seen.append(ln)
+                category = self.classify_line(ln)
+                if category:
+                    classified = True
+                    yield category, ln
+                else:
+                    unclassified.append(ln)
+        
+        categories = self._classify_semantic(unclassified, [None] * len(unclassified))
+        for ln, category in zip(unclassified, categories):
+            if category:
+                classified = True
+                yield category, ln
+        
+        if not classified and seen:
+            for ln in self._fallback_medications(seen):
+                yield 'meds', ln
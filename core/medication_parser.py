@@ -0,0 +1,175 @@
+"""Tách dòng thuốc thành bản ghi có cấu trúc: tên thuốc, hàm lượng, số lượng, đường dùng, lịch uống"""
+import re
+
+# Numbers (500, 0,5, 1/2) or words; digits and letters are separate tokens so "500mg" -> "500", "mg"
+_TOKEN_PATTERN = re.compile(r'\d+(?:[.,]\d+)?(?:/\d+)?|[^\W\d_]+|%')
+
+STRENGTH_UNITS = {'mg', 'mcg', 'µg', 'g', 'ml', 'l', 'ui', 'iu', '%'}
+FORM_UNITS = {'viên', 'vien', 'tab', 'gói', 'goi', 'ống', 'ong', 'chai', 'lọ', 'tuýp', 'tuyp',
+              'vỉ', 'hộp', 'giọt', 'nang', 'túi', 'miếng', 'liều'}
+QUANTITY_MARKERS = {'x', 'sl', 'số', 'lượng'}
+ROUTES = {'uống', 'nhỏ', 'bôi', 'tiêm', 'ngậm', 'xịt', 'đặt', 'dán', 'truyền', 'súc', 'hít', 'uong'}
+# OCR often drops the diacritics, so the unaccented spellings are accepted too
+# Words that open an instruction line ("Ngày uống 2 lần", "Mỗi lần 1 viên", "Sau ăn"), never a drug name
+INSTRUCTION_WORDS = {'ngày', 'mỗi', 'lần', 'khi', 'sau', 'trước', 'cách',
+                     'ngay', 'moi', 'lan', 'truoc', 'cach'}
+TIMES_PER = {'lần', 'lan'}  # "ngày 2 lần" -> times_per_day, "mỗi lần 1 viên" -> dose
+EACH = {'mỗi', 'moi'}
+TIMES = {'sáng': 'morning', 'trưa': 'noon', 'chiều': 'afternoon', 'tối': 'evening',
+         'sang': 'morning', 'trua': 'noon', 'chieu': 'afternoon', 'toi': 'evening'}
+
+
+class Medication:
+    """One parsed medication line
+
+    Spans are character offsets into `line`; numeric fields are floats or
+    None when the line does not state them.
+    """
+
+    __slots__ = ('line', 'drug', 'drug_start', 'drug_end', 'strength', 'unit',
+                 'quantity', 'form', 'dose', 'times_per_day', 'route',
+                 'morning', 'noon', 'afternoon', 'evening')
+
+    def __init__(self, line):
+        self.line = line
+        self.drug = None
+        self.drug_start = self.drug_end = None
+        self.strength = self.unit = None
+        self.quantity = self.form = None
+        self.dose = self.times_per_day = None
+        self.route = None
+        self.morning = self.noon = self.afternoon = self.evening = None
+
+    @property
+    def rest(self):
+        """Phần dòng sau tên thuốc (hàm lượng, cách dùng...)"""
+        return self.line[self.drug_end:].strip() if self.drug_end is not None else self.line
+
+    @property
+    def schedule(self):
+        """{'morning': 1.0, 'evening': 1.0, ...} chỉ gồm các buổi có ghi liều"""
+        return {slot: getattr(self, slot) for slot in ('morning', 'noon', 'afternoon', 'evening')
+                if getattr(self, slot) is not None}
+
+    def absorb(self, other):
+        """Gộp dòng hướng dẫn (không có tên thuốc) vào thuốc phía trên; chỉ điền các trường còn trống"""
+        self.line = f"{self.line} {other.line}"
+        for name in self.__slots__[4:]:  # every field after the drug span
+            if getattr(self, name) is None:
+                setattr(self, name, getattr(other, name))
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        fields = ', '.join(f"{name}={getattr(self, name)!r}" for name in self.__slots__[1:]
+                           if getattr(self, name) is not None)
+        return f"Medication({fields})"
+
+
+def _number(text):
+    if '/' in text:
+        num, den = text.split('/', 1)
+        return float(num.replace(',', '.')) / float(den) if float(den) else None
+    return float(text.replace(',', '.'))
+
+
+class MedicationParser:
+    """Single-pass tokenizer that turns medication lines into Medication records
+
+    The drug name comes from DrugDictionary (aliases resolve to the
+    canonical name); everything else is read from one left-to-right walk
+    over the remaining tokens.
+    """
+
+    def __init__(self, drugs):
+        self.drugs = drugs
+
+    def parse(self, line):
+        """Phân tích một dòng thuốc → Medication"""
+        med = Medication(line)
+
+        match = self.drugs.first_match(line)
+        if match:
+            med.drug, med.drug_start, med.drug_end = match.canonical, match.start, match.end
+
+        tokens = [
+            (m.group().lower(), m.start(), m.end()) for m in _TOKEN_PATTERN.finditer(line)
+            if not (match and m.start() < match.end and m.end() > match.start)
+        ]
+
+        slot = None         # time of day waiting for its amount ("sáng 1 viên")
+        pending = None      # amount waiting for its time of day ("1 viên sáng")
+        marker = False      # previous token was a quantity marker ("x 14 viên", "SL: 14")
+        each = False        # "mỗi lần": the next amount is the dose per intake
+        name_open = med.drug is None   # unknown drug: words before the first number
+        name_start = name_end = None
+
+        for i, (token, start, end) in enumerate(tokens):
+            if i == 0 and token.isdigit() and line[end:end + 1] in ('.', ')'):
+                continue  # list numbering "1." / "2)"
+
+            if name_open:
+                if token[0].isdigit() or token in ROUTES or token in TIMES or token in INSTRUCTION_WORDS:
+                    name_open = False
+                else:
+                    name_start = start if name_start is None else name_start
+                    name_end = end
+
+            following = tokens[i + 1][0] if i + 1 < len(tokens) else None
+            after_unit = tokens[i + 2][0] if i + 2 < len(tokens) else None
+
+            if token[0].isdigit():
+                value = _number(token)
+                if following in STRENGTH_UNITS:
+                    if med.strength is None:
+                        med.strength, med.unit = value, following
+                elif following in TIMES_PER:
+                    med.times_per_day = value
+                elif each:
+                    med.dose = value
+                    if following in FORM_UNITS:
+                        med.form = med.form or following
+                elif slot is not None:
+                    setattr(med, slot, value)
+                    slot = None
+                elif following in FORM_UNITS:
+                    med.form = med.form or following
+                    if marker or (med.quantity is None and med.route is None
+                                  and not med.schedule and after_unit not in TIMES):
+                        med.quantity = value
+                    else:
+                        pending = value
+                        if med.dose is None:
+                            med.dose = value
+                marker = each = False
+                continue
+
+            if token in TIMES:
+                if pending is not None:
+                    setattr(med, TIMES[token], pending)
+                    pending = None
+                else:
+                    slot = TIMES[token]
+            elif token in ROUTES and med.route is None:
+                med.route = token
+
+            each = token in TIMES_PER and i > 0 and tokens[i - 1][0] in EACH
+            marker = token in QUANTITY_MARKERS
+
+        if med.drug is None and name_end is not None:
+            med.drug_start, med.drug_end = name_start, name_end
+            med.drug = line[name_start:name_end]
+
+        return med
+
+    def parse_all(self, lines):
+        """Phân tích các dòng thuốc theo thứ tự; dòng chỉ có cách dùng được gộp vào thuốc phía trên"""
+        records = []
+        for ln in lines:
+            med = self.parse(ln)
+            if med.drug is None and records:
+                records[-1].absorb(med)
+            else:
+                records.append(med)
+        return records
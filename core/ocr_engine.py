@@ -1,11 +1,22 @@
 """OCR Engine sử dụng Tesseract"""
 import sys
 import os
+import re
+import time
+import cv2
+import numpy as np
 import pytesseract
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from utils.config import Config
 from utils.logger import Logger
+from utils.metrics import Metrics, image_attrs
 from core.preprocessor import ImagePreprocessor
+from core.layout import TextRegionDetector
+from core.tesseract_backend import create_backend
+
+_CONTROL_CHARS = re.compile(r'[\x00-\x08\x0B-\x0C\x0E-\x1F\x7F]')
+_SPACES = re.compile(r'[ \t\f\v]+')
 
 class OCREngine:
     """Tesseract OCR Engine"""
@@ -13,7 +24,9 @@ class OCREngine:
     def __init__(self):
         self.config = Config()
         self.logger = Logger.get_logger('OCREngine')
+        self.metrics = Metrics()
         self.preprocessor = ImagePreprocessor()
+        self.layout = TextRegionDetector()
         self._setup_tesseract()
     
     def _setup_tesseract(self):
@@ -35,6 +48,9 @@ class OCREngine:
             pytesseract.pytesseract.tesseract_cmd = tesseract_path
             self.logger.info(f"Tesseract path: {tesseract_path}")
             
+            self.backend = create_backend(self.config, tesseract_path, self.logger)
+            self.logger.info(f"Tesseract backend: {self.backend.name}")
+            
         except Exception as e:
             self.logger.error(f"Tesseract setup error: {e}")
             raise
@@ -43,42 +59,77 @@ class OCREngine:
         """Trích xuất văn bản từ ảnh
         
         Args:
-            image_path: Path to the image
+            image_path: Path to the image, or the encoded image bytes
             callback: Status callback function
             return_preprocessing_steps: If True, returns (text, preprocessing_dict)
             
         Returns:
-            If return_preprocessing_steps=False: extracted text string
+            If return_preprocessing_steps=False: extracted text, one OCR line per line
             If return_preprocessing_steps=True: tuple (text, preprocessing_steps_dict)
         """
+        if return_preprocessing_steps:
+            lines, preprocessing_steps = self.extract_lines(image_path, callback, return_preprocessing_steps=True)
+            return '\n'.join(line['text'] for line in lines), preprocessing_steps
+        
+        lines = self.extract_lines(image_path, callback)
+        return '\n'.join(line['text'] for line in lines)
+    
+    def extract_lines(self, image_path, callback=None, return_preprocessing_steps=False):
+        """Trích xuất các dòng chữ kèm vị trí và độ tin cậy
+        
+        Args:
+            image_path: Path to the image, the encoded image bytes or a decoded page
+            callback: Status callback function
+            return_preprocessing_steps: If True, returns (lines, preprocessing_dict)
+            
+        Returns:
+            List of line dicts in reading order:
+            {'text', 'conf' (mean word confidence 0-100), 'bbox': (x, y, w, h),
+             'block' (text region index), 'words': [{'text', 'conf', 'bbox'}]}
+            Lines re-recognized by ocr.reocr also carry 'reocr' (the variant used).
+        """
         try:
             if callback:
                 callback("⏳ Preprocessing image...")
             
-            processed_img, preprocessing_steps = self.preprocessor.process(
-                image_path, 
-                return_steps=True
-            )
+            # Batch/server path (no return_preprocessing_steps): no intermediate snapshots are kept
+            processed_img, preprocessing_steps, gray = self.preprocess(image_path, return_preprocessing_steps)
             
             if callback:
                 callback("⏳ Running OCR...")
             
-            lang = self.config.get('tesseract.lang', 'vie')
-            config_str = self.config.get('tesseract.config', '--oem 1 --psm 6')
+            blocks = self._recognize(processed_img, gray)
+            lines = [dict(line, block=block['index']) for block in blocks for line in block['lines']]
             
-            text = pytesseract.image_to_string(
-                processed_img,
-                lang=lang,
-                config=config_str
-            )
+            self.logger.info(f"OCR completed. Extracted {len(lines)} lines, "
+                             f"{sum(len(line['text']) for line in lines)} characters")
             
-            text = self._post_process_text(text)
+            if return_preprocessing_steps:
+                return lines, preprocessing_steps
+            return lines
             
-            self.logger.info(f"OCR completed. Extracted {len(text)} characters")
+        except Exception as e:
+            self.logger.error(f"OCR error: {e}")
+            if callback:
+                callback(f"❌ OCR Error: {e}")
+            raise
+    
+    def extract_blocks(self, image_path, callback=None):
+        """Trích xuất văn bản theo từng khối chữ
+        
+        Returns:
+            List of dicts {'index', 'bbox': (x, y, w, h), 'text', 'lines'} in
+            reading order (lines as in extract_lines). With ocr.layout disabled
+            the blocks are full-width horizontal bands (see ocr.bands).
+        """
+        try:
+            if callback:
+                callback("⏳ Preprocessing image...")
+            processed_img, _, gray = self.preprocess(image_path)
             
-            if return_preprocessing_steps:
-                return text, preprocessing_steps
-            return text
+            if callback:
+                callback("⏳ Running OCR...")
+            return self._recognize(processed_img, gray)
             
         except Exception as e:
             self.logger.error(f"OCR error: {e}")
@@ -86,8 +137,267 @@ class OCREngine:
                 callback(f"❌ OCR Error: {e}")
             raise
     
+    def preprocess(self, image_path, return_steps=False, snapshots=None):
+        """Tiền xử lý cho OCR → (processed_img, steps hoặc None, ảnh xám hoặc None)
+        
+        The full-resolution grayscale page is only kept when ocr.reocr is
+        enabled; pass it on to _recognize/iter_recognize for re-OCR.
+        snapshots overrides ocr.snapshots for the returned steps (see
+        ImagePreprocessor.process).
+        """
+        reocr = bool(self.config.get('ocr.reocr.enabled', False))
+        if return_steps and reocr:
+            return self.preprocessor.process(image_path, return_steps=True, snapshots=snapshots,
+                                             return_gray=True)
+        if return_steps:
+            processed_img, steps = self.preprocessor.process(image_path, return_steps=True, snapshots=snapshots)
+            return processed_img, steps, None
+        if reocr:
+            processed_img, gray = self.preprocessor.process(image_path, return_gray=True)
+            return processed_img, None, gray
+        return self.preprocessor.process(image_path), None, None
+    
+    def _recognize(self, processed_img, gray=None):
+        """OCR ảnh đã tiền xử lý, chỉ trên các vùng có chữ nếu bật ocr.layout
+        
+        With the grayscale page given, low-confidence lines are re-OCR'd
+        (see _reocr_lines).
+        """
+        regions = self._detect_regions(processed_img, self.config.get('ocr.layout.enabled', False))
+        
+        def recognize(region):
+            x, y, rw, rh = region['bbox']
+            words = self.backend.image_to_data(processed_img[y:y + rh, x:x + rw])
+            return dict(region, lines=self._group_lines(words, x, y))
+        
+        with self.metrics.span('ocr.tesseract', backend=self.backend.name, regions=len(regions),
+                               **image_attrs(processed_img)) as span:
+            if len(regions) == 1:
+                blocks = [recognize(regions[0])]
+            else:
+                with ThreadPoolExecutor(max_workers=min(self._region_workers(), len(regions))) as pool:
+                    blocks = list(pool.map(recognize, regions))
+            span['lines'] = sum(len(block['lines']) for block in blocks)
+        
+        if gray is not None:
+            # Per block, as in iter_recognize, so both paths give the same lines
+            for block in blocks:
+                self._reocr_lines(block['lines'], processed_img, gray)
+        
+        with self.metrics.span('ocr.post_process'):
+            for block in blocks:
+                self._finish_block(block)
+        
+        return blocks
+    
+    def iter_recognize(self, processed_img, gray=None):
+        """Generator: trả từng khối chữ (theo thứ tự đọc) ngay khi OCR xong
+        
+        Uses the same regions as _recognize, so the output is identical to
+        extract_blocks, so the first block is available long before the whole
+        page is done: text blocks with ocr.layout enabled, otherwise
+        horizontal bands of the page (ocr.bands). Regions are OCR'd in
+        parallel but yielded in reading order.
+        With the grayscale page given, low-confidence lines of each block are
+        re-OCR'd before it is yielded.
+        """
+        regions = self._detect_regions(processed_img, self.config.get('ocr.layout.enabled', False))
+        
+        def recognize(region):
+            x, y, rw, rh = region['bbox']
+            start = time.perf_counter()
+            words = self.backend.image_to_data(processed_img[y:y + rh, x:x + rw])
+            return self._group_lines(words, x, y), (time.perf_counter() - start) * 1000
+        
+        with ThreadPoolExecutor(max_workers=min(self._region_workers(), len(regions))) as pool:
+            futures = [pool.submit(recognize, region) for region in regions]
+            for region, future in zip(regions, futures):
+                lines, elapsed_ms = future.result()
+                self.metrics.record('ocr.tesseract', elapsed_ms, backend=self.backend.name,
+                                    region=region['index'], lines=len(lines))
+                if gray is not None:
+                    self._reocr_lines(lines, processed_img, gray)
+                yield self._finish_block(dict(region, lines=lines))
+    
+    @staticmethod
+    def _group_lines(words, dx=0, dy=0):
+        """Gom các từ theo dòng của Tesseract; bbox đổi sang toạ độ trang"""
+        grouped = {}
+        for word in words:
+            grouped.setdefault(word['line'], []).append(word)
+        
+        lines = []
+        for line_words in grouped.values():
+            boxes = [(x + dx, y + dy, w, h) for x, y, w, h in (word['bbox'] for word in line_words)]
+            x0 = min(b[0] for b in boxes)
+            y0 = min(b[1] for b in boxes)
+            x1 = max(b[0] + b[2] for b in boxes)
+            y1 = max(b[1] + b[3] for b in boxes)
+            confs = [word['conf'] for word in line_words if word['conf'] >= 0]
+            lines.append({
+                'text': ' '.join(word['text'] for word in line_words),
+                'conf': round(sum(confs) / len(confs), 1) if confs else -1.0,
+                'bbox': (x0, y0, x1 - x0, y1 - y0),
+                'words': [{'text': word['text'], 'conf': word['conf'], 'bbox': box}
+                          for word, box in zip(line_words, boxes)],
+            })
+        return lines
+    
+    REOCR_VARIANTS = ('single_line', 'no_denoise', 'threshold', 'upscale')
+    
+    def _reocr_lines(self, lines, processed_img, gray):
+        """Nhận dạng lại các dòng có độ tin cậy thấp, giữ giả thuyết tốt nhất
+        
+        Only lines below ocr.reocr.min_conf are touched (lowest first, at most
+        ocr.reocr.max_lines per text block), so the extra Tesseract calls scale with the
+        uncertain text rather than with the page. Lines are updated in place.
+        """
+        min_conf = float(self.config.get('ocr.reocr.min_conf', 60))
+        max_lines = int(self.config.get('ocr.reocr.max_lines', 20) or 0)
+        
+        candidates = sorted((line for line in lines if line['conf'] < min_conf), key=lambda line: line['conf'])
+        if max_lines:
+            candidates = candidates[:max_lines]
+        if not candidates:
+            return 0
+        
+        with self.metrics.span('ocr.reocr', candidates=len(candidates)) as span:
+            with ThreadPoolExecutor(max_workers=min(self._region_workers(), len(candidates))) as pool:
+                hypotheses = list(pool.map(lambda line: self._best_hypothesis(line, processed_img, gray),
+                                           candidates))
+            
+            improved = 0
+            for line, hypothesis in zip(candidates, hypotheses):
+                if hypothesis is not None:
+                    line.update(hypothesis)
+                    improved += 1
+            span['improved'] = improved
+        
+        self.logger.debug(f"Re-OCR: {improved}/{len(candidates)} low-confidence lines improved")
+        return improved
+    
+    def _best_hypothesis(self, line, processed_img, gray):
+        """Thử từng biến thể trong ocr.reocr.variants; None nếu không cái nào tốt hơn dòng gốc
+        
+        A hypothesis wins on mean word confidence, must beat the original by
+        ocr.reocr.min_gain and keep at least half of its characters (dropping
+        the doubtful words would otherwise always raise the mean).
+        """
+        pad = int(self.config.get('ocr.reocr.padding', 6) or 0)
+        psm = self.config.get('ocr.reocr.psm', 7)
+        min_gain = float(self.config.get('ocr.reocr.min_gain', 3) or 0)
+        variants = self.config.get('ocr.reocr.variants', None) or self.REOCR_VARIANTS
+        
+        rows, cols = gray.shape[:2]
+        x, y, w, h = line['bbox']
+        roi = (max(0, x - pad), max(0, y - pad), min(cols, x + w + pad), min(rows, y + h + pad))
+        
+        best, best_conf = None, line['conf'] + min_gain
+        for variant in variants:
+            img, scale = self._reocr_image(variant, processed_img, gray, roi)
+            if img is None:
+                continue
+            words = self.backend.image_to_data(img, psm=psm)
+            if not words:
+                continue
+            
+            words = [dict(word, line=0, bbox=tuple(int(round(v / scale)) for v in word['bbox']))
+                     for word in words]
+            hypothesis = self._group_lines(words, roi[0], roi[1])[0]
+            if len(hypothesis['text']) * 2 < len(line['text']):
+                continue
+            if hypothesis['conf'] > best_conf:
+                best, best_conf = dict(hypothesis, reocr=variant), hypothesis['conf']
+        
+        return best
+    
+    def _reocr_image(self, variant, processed_img, gray, roi):
+        """Ảnh vùng dòng cho một biến thể re-OCR → (ảnh, hệ số phóng)"""
+        x0, y0, x1, y1 = roi
+        if variant == 'single_line':
+            # Same pixels, only the page segmentation mode changes
+            return processed_img[y0:y1, x0:x1], 1.0
+        if variant == 'no_denoise':
+            return self.preprocessor.binarize(gray, roi, denoise=False), 1.0
+        if variant == 'threshold':
+            block_size = self.config.get('ocr.reocr.threshold_block', 15)
+            c = self.config.get('ocr.reocr.threshold_c', 5)
+            return self.preprocessor.binarize(gray, roi, block_size=block_size, c=c), 1.0
+        if variant == 'upscale':
+            scale = float(self.config.get('ocr.reocr.upscale', 2.0) or 2.0)
+            crop = cv2.resize(gray[y0:y1, x0:x1], None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+            return self.preprocessor.binarize(crop), scale
+        
+        self.logger.warning(f"Unknown ocr.reocr variant: {variant}")
+        return None, 1.0
+    
+    def _finish_block(self, block):
+        """Làm sạch từng dòng của một khối, bỏ dòng rỗng và ghép 'text' của khối"""
+        lines = []
+        for line in block['lines']:
+            line['text'] = self._post_process_text(line['text'])
+            if line['text']:
+                lines.append(line)
+        block['lines'] = lines
+        block['text'] = '\n'.join(line['text'] for line in lines)
+        return block
+    
+    def _detect_regions(self, processed_img, use_layout):
+        """Danh sách vùng cần OCR; các dải ngang của trang nếu không dùng/không tìm thấy vùng chữ"""
+        h, w = processed_img.shape[:2]
+        regions = None
+        
+        if use_layout:
+            with self.metrics.span('ocr.layout') as span:
+                regions = self.layout.detect(processed_img)
+                span['regions'] = len(regions)
+                span['coverage'] = round(TextRegionDetector.covered_fraction(regions, (h, w)), 3)
+        
+        if not regions:
+            bands = self._split_bands(processed_img, int(self.config.get('ocr.bands', 4) or 1))
+            regions = [{'index': i, 'bbox': (0, y0, w, y1 - y0)} for i, (y0, y1) in enumerate(bands)]
+        return regions
+    
+    MIN_BAND_HEIGHT = 100
+    
+    @classmethod
+    def _split_bands(cls, processed_img, count):
+        """Chia trang thành tối đa `count` dải ngang, chỉ cắt ở các hàng trắng (không cắt qua dòng chữ)
+        
+        Returns:
+            List of (y0, y1) row ranges covering the whole page
+        """
+        h = processed_img.shape[0]
+        if count <= 1 or h < 2 * cls.MIN_BAND_HEIGHT:
+            return [(0, h)]
+        
+        # Binarized page: dark text on white; a row without ink can be cut
+        blank = ~(processed_img < 128).any(axis=1)
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], blank.view(np.int8), [0]))))
+        gaps = edges.reshape(-1, 2)  # [start, end) of each blank run
+        centers = (gaps[:, 0] + gaps[:, 1]) // 2
+        
+        cuts = [0]
+        for k in range(1, count):
+            target = h * k // count
+            # Closest blank row to the ideal boundary that keeps both bands tall enough
+            allowed = centers[(centers - cuts[-1] >= cls.MIN_BAND_HEIGHT) & (h - centers >= cls.MIN_BAND_HEIGHT)]
+            if len(allowed):
+                cut = int(allowed[np.argmin(np.abs(allowed - target))])
+                if cut > cuts[-1] and abs(cut - target) < h / (2 * count):
+                    cuts.append(cut)
+        cuts.append(h)
+        return list(zip(cuts[:-1], cuts[1:]))
+    
+    def _region_workers(self):
+        return int(self.config.get('ocr.layout.workers', 0) or 0) or (os.cpu_count() or 1)
+    
+    def close(self):
+        """Giải phóng các Tesseract worker"""
+        self.backend.close()
+    
     def _post_process_text(self, text):
-        """Sửa lỗi OCR phổ biến"""
+        """Sửa lỗi OCR phổ biến, giữ nguyên ngắt dòng"""
         # Replace common OCR mistakes
         replacements = {
             'O': '0',  # Letter O to Zero in numbers
@@ -95,12 +405,11 @@ class OCREngine:
             '|': 'I',  # Pipe to I
         }
         
-        # Remove extra spaces and clean up
-        text = ' '.join(text.split())
-        
-        # Remove isolated special characters that are likely noise
-        import re
-        text = re.sub(r'\s+', ' ', text)  # Multiple spaces to single
-        text = re.sub(r'[\x00-\x08\x0B-\x0C\x0E-\x1F\x7F]', '', text)  # Remove control chars
+        # Remove control chars and extra spaces within each line, drop empty lines
+        lines = []
+        for ln in text.splitlines():
+            ln = _SPACES.sub(' ', _CONTROL_CHARS.sub('', ln)).strip()
+            if ln:
+                lines.append(ln)
         
-        return text
+        return '\n'.join(lines)
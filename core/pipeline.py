@@ -0,0 +1,307 @@
+"""Pipeline hoàn chỉnh: OCR + trích xuất từ khóa, có cache kết quả"""
+import threading
+from pathlib import Path
+import numpy as np
+from utils.config import Config
+from utils.logger import Logger
+from utils.metrics import Metrics
+from core.ocr_engine import OCREngine
+from core.keyword_extractor import KeywordExtractor
+from core.result_cache import ResultCache
+from core.document_loader import DocumentLoader
+
+
+class OCRPipeline:
+    """OCREngine + KeywordExtractor with content-addressed result caching"""
+
+    def __init__(self, ocr_engine=None, keyword_extractor=None):
+        self.config = Config()
+        self.logger = Logger.get_logger('OCRPipeline')
+        self.metrics = Metrics()
+        self.ocr_engine = ocr_engine or OCREngine()
+        self.keyword_extractor = keyword_extractor or KeywordExtractor()
+        self.cache = ResultCache() if self.config.get('cache.enabled', True) else None
+
+    def run(self, image_path, callback=None, return_preprocessing_steps=False):
+        """Chạy OCR + trích xuất cho một ảnh
+
+        Args:
+            image_path: Path to the image, the encoded image bytes or a decoded
+                BGR page array (see run_document for PDF/TIFF files)
+            callback: Status callback function
+            return_preprocessing_steps: If True, returns (result, preprocessing_steps_dict);
+                the dict is empty when the result came from the cache
+
+        Returns:
+            dict with 'info', 'meds' (medication lines), 'medications'
+            (structured records, see core.medication_parser), 'lines' (OCR
+            lines with 'text', 'conf' and 'bbox' in preprocessed-image
+            pixels), 'raw_text' and, when metrics are enabled, 'timings'
+            (milliseconds per stage)
+        """
+        with self.metrics.collect() as spans:
+            with self.metrics.span('pipeline.total'):
+                result, preprocessing_steps = self._run(image_path, callback, return_preprocessing_steps)
+
+        if spans:
+            result['timings'] = self._timings(spans)
+
+        if return_preprocessing_steps:
+            return result, preprocessing_steps
+        return result
+
+    @staticmethod
+    def _timings(spans):
+        """Tổng thời gian (ms) theo tên giai đoạn"""
+        timings = {}
+        for span in spans:
+            timings[span['name']] = round(timings.get(span['name'], 0.0) + span['duration_ms'], 3)
+        return timings
+
+    @staticmethod
+    def _line_summary(line):
+        """Dòng OCR cho kết quả JSON: text, độ tin cậy, bbox (bỏ danh sách từ cho gọn)"""
+        return {'text': line['text'], 'conf': line['conf'], 'bbox': list(line['bbox'])}
+
+    def _read_bytes(self, image_path):
+        if isinstance(image_path, np.ndarray):
+            page = np.ascontiguousarray(image_path)
+            return page, f"<page {page.shape[1]}x{page.shape[0]}>"
+        if isinstance(image_path, (bytes, bytearray)):
+            image_bytes = bytes(image_path)
+            return image_bytes, f"<{len(image_bytes)} bytes>"
+        return Path(image_path).read_bytes(), image_path
+
+    def run_document(self, path, callback=None, page_callback=None):
+        """Chạy pipeline cho tài liệu nhiều trang (PDF/TIFF), từng trang một
+
+        Pages are rasterized lazily, so only the current page is held in
+        memory. For page-parallel processing use BatchProcessor.
+
+        Args:
+            path: PDF or TIFF file
+            callback: Status callback function
+            page_callback: Optional function called with each page result
+
+        Returns:
+            Merged result, see merge_pages()
+        """
+        loader = DocumentLoader()
+        count = loader.page_count(path)
+        results = []
+
+        for number, page in loader.iter_pages(path):
+            if callback:
+                callback(f"⏳ Page {number}/{count}...")
+            try:
+                result = self.run(page, callback)
+            except Exception as e:
+                self.logger.error(f"Page {number} of {path} failed: {e}")
+                result = {'error': str(e)}
+            result['page'] = number
+            results.append(result)
+
+            if page_callback:
+                page_callback(result)
+
+        return self.merge_pages(results)
+
+    @staticmethod
+    def merge_pages(page_results):
+        """Gộp kết quả từng trang thành một kết quả duy nhất
+
+        Args:
+            page_results: Per-page result dicts, each with a 'page' number,
+                in any order
+
+        Returns:
+            dict with the usual 'info', 'meds', 'medications', 'lines' (each
+            with its 'page'), 'raw_text' (pages in order, repeated header lines
+            kept once), 'page_count' and 'pages' ([{'page', 'info', 'meds',
+            'medications', 'raw_text'} or {'page', 'error'}]).
+            If every page failed the dict also has 'error'.
+        """
+        pages = sorted(page_results, key=lambda r: r['page'])
+        merged = {'info': [], 'meds': [], 'medications': [], 'lines': [], 'raw_text': '',
+                  'page_count': len(pages), 'pages': []}
+        texts = []
+        timings = {}
+
+        for page in pages:
+            if 'error' in page:
+                merged['pages'].append({'page': page['page'], 'error': page['error']})
+                continue
+
+            merged['pages'].append({
+                'page': page['page'],
+                'info': page['info'],
+                'meds': page['meds'],
+                'medications': page.get('medications', []),
+                'raw_text': page['raw_text'],
+            })
+            # Patient/header lines are usually printed on every page
+            merged['info'].extend(ln for ln in page['info'] if ln not in merged['info'])
+            merged['meds'].extend(page['meds'])
+            merged['medications'].extend(page.get('medications', []))
+            merged['lines'].extend(dict(line, page=page['page']) for line in page.get('lines', []))
+            texts.append(page['raw_text'])
+            for name, ms in page.get('timings', {}).items():
+                timings[name] = round(timings.get(name, 0.0) + ms, 3)
+
+        merged['raw_text'] = '\n\n'.join(texts)
+        if timings:
+            merged['timings'] = timings
+        if pages and all('error' in page for page in pages):
+            merged['error'] = pages[0]['error']
+        return merged
+
+    def iter_results(self, image_path, callback=None, return_preprocessing_steps=False, snapshots=None):
+        """Generator: trả kết quả từng phần ngay khi OCR xong mỗi khối chữ
+
+        snapshots overrides ocr.snapshots for the preprocessing steps, e.g.
+        'all' for full-resolution images in the GUI.
+
+        Yields event dicts:
+            {'type': 'preprocessed', 'steps': {...}}   only if return_preprocessing_steps
+            {'type': 'block', 'index', 'bbox', 'text', 'lines'}  each OCR'd text block
+            {'type': 'line', 'category': 'info'|'meds', 'text'}  each classified line
+            {'type': 'done', 'result': {...}}           final result, identical to run()
+        """
+        with self.metrics.collect() as spans:
+            image_bytes, label = self._read_bytes(image_path)
+            key = None
+
+            if self.cache is not None:
+                key = self.cache.make_key(image_bytes)
+                result = self.cache.get(key)
+                if result is not None:
+                    self.logger.info(f"Cache hit for {label}")
+                    if callback:
+                        callback("✅ Cached result")
+                    for category in ('info', 'meds'):
+                        for ln in result[category]:
+                            yield {'type': 'line', 'category': category, 'text': ln}
+                    yield {'type': 'done', 'result': result}
+                    return
+
+            if callback:
+                callback("⏳ Preprocessing image...")
+            processed_img, steps, gray = self.ocr_engine.preprocess(image_bytes, return_preprocessing_steps,
+                                                                    snapshots)
+            if return_preprocessing_steps:
+                yield {'type': 'preprocessed', 'steps': steps}
+
+            if callback:
+                callback("⏳ Running OCR...")
+
+            blocks = []
+            pending = []
+
+            def chunks():
+                for block in self.ocr_engine.iter_recognize(processed_img, gray):
+                    blocks.append(block)
+                    pending.append(block)
+                    yield block['lines']
+
+            for category, ln in self.keyword_extractor.iter_extract(chunks()):
+                while pending:
+                    yield dict(pending.pop(0), type='block')
+                yield {'type': 'line', 'category': category, 'text': ln}
+            while pending:
+                yield dict(pending.pop(0), type='block')
+
+            # The final result shares the cache with run(), so build it the same way: streamed lines
+            # are in arrival order (semantic fallback last), extract() keeps document order.
+            # Rules are cheap and semantic embeddings are cached, so this costs little.
+            lines = [line for block in blocks for line in block['lines']]
+            result = self.keyword_extractor.extract(lines)
+            result['lines'] = [self._line_summary(line) for line in lines]
+            result['raw_text'] = '\n'.join(line['text'] for line in lines)
+            if self.cache is not None:
+                self.cache.put(key, result)
+
+        if spans:
+            result['timings'] = self._timings(spans)
+        yield {'type': 'done', 'result': result}
+
+    async def aiter_results(self, image_path, callback=None):
+        """Async iterator của iter_results (chạy pipeline trong thread riêng)"""
+        import asyncio
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        finished = object()
+
+        def produce():
+            try:
+                for event in self.iter_results(image_path, callback):
+                    loop.call_soon_threadsafe(queue.put_nowait, event)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, finished)
+
+        threading.Thread(target=produce, daemon=True).start()
+        while True:
+            event = await queue.get()
+            if event is finished:
+                return
+            if isinstance(event, Exception):
+                raise event
+            yield event
+
+    def _run(self, image_path, callback, return_preprocessing_steps):
+        image_bytes, image_path = self._read_bytes(image_path)
+        key = None
+
+        if self.cache is not None:
+            with self.metrics.span('pipeline.cache_get') as span:
+                key = self.cache.make_key(image_bytes)
+                result = self.cache.get(key)
+                span['hit'] = result is not None
+            if result is not None:
+                self.logger.info(f"Cache hit for {image_path}")
+                if callback:
+                    callback("✅ Cached result")
+                return result, {}
+
+        preprocessing_steps = {}
+        if return_preprocessing_steps:
+            lines, preprocessing_steps = self.ocr_engine.extract_lines(
+                image_bytes,
+                callback,
+                return_preprocessing_steps=True
+            )
+        else:
+            lines = self.ocr_engine.extract_lines(image_bytes, callback)
+
+        result = self.keyword_extractor.extract(lines, callback)
+        result['lines'] = [self._line_summary(line) for line in lines]
+        result['raw_text'] = '\n'.join(line['text'] for line in lines)
+
+        if self.cache is not None:
+            self.cache.put(key, result)
+
+        return result, preprocessing_steps
+
+    def warm_up(self):
+        """Chạy tiền xử lý một ảnh nhỏ để OpenCV khởi tạo trước khi có ảnh thật
+
+        Only the first call of each OpenCV routine pays for its lazy
+        initialisation; doing it at startup keeps it out of the first
+        request. The semantic model is loaded too when enabled. Nothing is
+        cached and failures are only logged.
+        """
+        try:
+            with self.metrics.span('pipeline.warm_up'):
+                page = np.full((64, 256, 3), 255, dtype=np.uint8)
+                page[24:40, 16:240:8] = 0
+                self.ocr_engine.preprocessor.process(page)
+                self.keyword_extractor.warm_up()
+        except Exception as e:
+            self.logger.warning(f"Warm-up failed: {e}")
+
+    def close(self):
+        self.ocr_engine.close()
+        if self.cache is not None:
+            self.logger.info(f"Cache stats: {self.cache.stats}")
+            self.cache.close()
@@ -1,8 +1,11 @@
 """Xử lý tiền xử lý ảnh trước OCR"""
+import os
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 import numpy as np
 from utils.config import Config
 from utils.logger import Logger
+from utils.metrics import Metrics, image_attrs
 
 class ImagePreprocessor:
     """Image Preprocessing Pipeline"""
@@ -10,63 +13,219 @@ class ImagePreprocessor:
     def __init__(self):
         self.config = Config()
         self.logger = Logger.get_logger('ImagePreprocessor')
+        self.metrics = Metrics()
         self.processing_steps = {}  # Store intermediate images
+        self._tuned_threshold = None  # (block_size, c) chosen for the current image
     
-    def process(self, image_path, return_steps=False):
+    STAGES = ('original', 'resized', 'deskewed', 'grayscale', 'sharpened', 'denoised', 'binary', 'final')
+    
+    def process(self, image_path, return_steps=False, snapshots=None, return_gray=False):
         """Tiền xử lý ảnh
         
         Args:
-            image_path: Path to the image
+            image_path: Path to the image, the encoded image bytes or an
+                already decoded BGR array (e.g. a rasterized document page)
             return_steps: If True, returns dict with intermediate processing stages
+            snapshots: Snapshot policy overriding ocr.snapshots when return_steps=True:
+                'all', 'none', 'preview' or a list of stage names
+            return_gray: If True, the full-resolution grayscale page (same
+                size as the processed image) is appended to the return value,
+                for re-binarizing parts of it with binarize()
             
         Returns:
             If return_steps=False: processed image (final cleaned image)
             If return_steps=True: tuple (processed_image, steps_dict)
+            With return_gray=True: (processed_image, gray) or
+            (processed_image, steps_dict, gray)
         """
         try:
-            self.logger.info(f"Processing image: {image_path}")
+            if isinstance(image_path, (bytes, bytearray)):
+                self.logger.info(f"Processing image: <{len(image_path)} bytes>")
+            elif isinstance(image_path, np.ndarray):
+                self.logger.info(f"Processing image: <page {image_path.shape[1]}x{image_path.shape[0]}>")
+            else:
+                self.logger.info(f"Processing image: {image_path}")
             self.processing_steps = {}
+            self._configure_snapshots(snapshots if return_steps else 'none')
             
-            img = self._read_image(image_path)
-            self.processing_steps['original'] = img.copy()
+            img = self._timed('decode', self._read_image, image_path)
+            self._snapshot('original', img)
             
-            img = self._resize_if_needed(img)
-            self.processing_steps['resized'] = img.copy()
+            img = self._timed('resize', self._resize_if_needed, img)
+            self._snapshot('resized', img)
             
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            self.processing_steps['grayscale'] = gray.copy()
+            if self.config.get('ocr.deskew.enabled', False):
+                img = self._timed('deskew', self._deskew_image, img)
+                self._snapshot('deskewed', img)
             
-            sharp = self._sharpen_image(gray)
-            self.processing_steps['sharpened'] = sharp.copy()
+            gray = self._timed('grayscale', cv2.cvtColor, img, cv2.COLOR_BGR2GRAY)
+            self._snapshot('grayscale', gray)
             
-            denoised = self._denoise_image(sharp)
-            self.processing_steps['denoised'] = denoised.copy()
-
-            # Apply binary adaptive threshold to enhance text contrast
-            binary = self._apply_threshold(denoised)
-            self.processing_steps['binary'] = binary.copy()
-
-            # Morphological cleaning on the binary image to produce final output
-            clean = self._morphological_clean(binary)
-            self.processing_steps['final'] = clean.copy()
+            self._tuned_threshold = None
+            if self.config.get('ocr.threshold_tuning.enabled', False):
+                self._tuned_threshold = self._tune_threshold(gray)
+            
+            if self._use_tiling(gray):
+                with self.metrics.span('preprocess.filter_chain_tiled', **image_attrs(gray)):
+                    stages = self._filter_chain_tiled(gray)
+            else:
+                stages = self._filter_chain(gray, instrument=True)
+            
+            for name in ('sharpened', 'denoised', 'binary', 'final'):
+                if name in stages:
+                    self._snapshot(name, stages[name])
+            clean = stages['final']
             
             self.logger.info("Image preprocessing completed")
             
+            if return_steps and return_gray:
+                return clean, self.processing_steps, gray
             if return_steps:
                 return clean, self.processing_steps
+            if return_gray:
+                return clean, gray
             return clean
             
         except Exception as e:
             self.logger.error(f"Preprocessing error: {e}")
             raise
     
+    def _timed(self, stage, func, *args):
+        """Chạy một giai đoạn trong metrics span, ghi kích thước + bộ nhớ output"""
+        with self.metrics.span(f'preprocess.{stage}') as span:
+            out = func(*args)
+            span.update(image_attrs(out))
+        return out
+    
+    def _filter_chain(self, gray, instrument=False):
+        """Sharpen → denoise → threshold → morphology trên ảnh xám
+        
+        instrument=False is used for tiled strips so that per-strip calls
+        do not flood the metrics sinks.
+        """
+        if instrument:
+            run = self._timed
+        else:
+            def run(stage, func, *args):
+                return func(*args)
+        
+        sharp = run('sharpen', self._sharpen_image, gray)
+        denoised = run('denoise', self._denoise_image, sharp)
+        
+        # Apply binary adaptive threshold to enhance text contrast
+        binary = run('threshold', self._apply_threshold, denoised)
+        
+        # Morphological cleaning on the binary image to produce final output
+        clean = run('morphology', self._morphological_clean, binary)
+        
+        return {'sharpened': sharp, 'denoised': denoised, 'binary': binary, 'final': clean}
+    
+    def _use_tiling(self, gray):
+        """Chỉ chia dải khi bật ocr.tiling và ảnh đủ lớn"""
+        if not self.config.get('ocr.tiling.enabled', False):
+            return False
+        if self.config.get('ocr.denoise_method', 'nlmeans') == 'nlmeans_downscaled':
+            # Resampling is not local, strips would not stitch back identically
+            return False
+        min_pixels = int(self.config.get('ocr.tiling.min_pixels', 4000000) or 0)
+        return gray.size >= min_pixels
+    
+    def _chain_halo(self):
+        """Bán kính ảnh hưởng tổng cộng của chuỗi filter
+        
+        Each stage only reads pixels within its radius, so strips padded by
+        the sum of all radii produce exactly the full-image output in their
+        interior.
+        """
+        method = self.config.get('ocr.denoise_method', 'nlmeans') or 'none'
+        denoise_radius = {
+            'nlmeans': 7 // 2 + 21 // 2,
+            'bilateral': 7 // 2,
+            'median': 3 // 2,
+        }.get(method, 0)
+        block_size, _ = self._threshold_params()
+        sharpen_radius = 1
+        morph_radius = 0
+        return sharpen_radius + denoise_radius + block_size // 2 + morph_radius
+    
+    def _filter_chain_tiled(self, gray):
+        """Chạy chuỗi filter trên các dải ngang song song rồi ghép lại
+        
+        OpenCV releases the GIL, so a thread pool keeps every core busy on
+        one large image. Output is pixel-identical to _filter_chain.
+        """
+        rows = gray.shape[0]
+        strip_height = max(1, int(self.config.get('ocr.tiling.strip_height', 512) or 512))
+        workers = int(self.config.get('ocr.tiling.workers', 0) or 0) or (os.cpu_count() or 1)
+        halo = self._chain_halo()
+        keep = [name for name in ('sharpened', 'denoised', 'binary') if name in self._keep_stages]
+        
+        strips = []
+        for top in range(0, rows, strip_height):
+            bottom = min(rows, top + strip_height)
+            pad_top = max(0, top - halo)
+            pad_bottom = min(rows, bottom + halo)
+            strips.append((top, bottom, pad_top, pad_bottom))
+        
+        def run(strip):
+            top, bottom, pad_top, pad_bottom = strip
+            stages = self._filter_chain(gray[pad_top:pad_bottom])
+            lo, hi = top - pad_top, bottom - pad_top
+            return {name: img[lo:hi] for name, img in stages.items() if name == 'final' or name in keep}
+        
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(run, strips))
+        
+        self.logger.debug(f"Tiled preprocessing: {len(strips)} strips, halo {halo}px, {workers} threads")
+        return {name: np.vstack([part[name] for part in parts]) for name in parts[0]}
+    
+    def _configure_snapshots(self, policy=None):
+        """Xác định giai đoạn nào được giữ lại trong processing_steps"""
+        if policy is None:
+            policy = self.config.get('ocr.snapshots', 'all')
+        
+        self._preview_size = None
+        if policy == 'all':
+            self._keep_stages = set(self.STAGES)
+        elif policy in (None, 'none', False):
+            self._keep_stages = set()
+        elif policy == 'preview':
+            self._keep_stages = set(self.STAGES)
+            self._preview_size = int(self.config.get('ocr.snapshot_preview_size', 400) or 400)
+        else:
+            self._keep_stages = set(policy)
+    
+    def _snapshot(self, name, img):
+        """Lưu một giai đoạn (dùng chung bộ nhớ, không copy)
+        
+        Every stage returns a new array and nothing is modified in place,
+        so kept stages can safely reference the pipeline buffers directly.
+        """
+        if name not in self._keep_stages:
+            return
+        
+        if self._preview_size:
+            h, w = img.shape[:2]
+            if max(h, w) > self._preview_size:
+                scale = self._preview_size / max(h, w)
+                img = cv2.resize(img, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+        
+        self.processing_steps[name] = img
+    
     def get_processing_steps(self):
         """Get the intermediate processing steps"""
         return self.processing_steps
     
     def _read_image(self, path):
-        """Đọc ảnh (hỗ trợ Unicode path)"""
-        stream = np.fromfile(path, dtype=np.uint8)
+        """Đọc ảnh (hỗ trợ Unicode path, bytes đã đọc sẵn hoặc mảng BGR đã giải mã)"""
+        if isinstance(path, np.ndarray):
+            if path.ndim == 2:
+                return cv2.cvtColor(path, cv2.COLOR_GRAY2BGR)
+            return path
+        if isinstance(path, (bytes, bytearray)):
+            stream = np.frombuffer(path, dtype=np.uint8)
+        else:
+            stream = np.fromfile(path, dtype=np.uint8)
         img = cv2.imdecode(stream, cv2.IMREAD_COLOR)
         
         if img is None:
@@ -74,29 +233,206 @@ class ImagePreprocessor:
         
         return img
     
+    def _deskew_image(self, img):
+        """Xoay ảnh về đúng hướng và khử nghiêng bằng một phép warp duy nhất
+        
+        Angles are estimated on a downscaled copy; only the final affine
+        warp touches the full-resolution image.
+        """
+        analysis_size = int(self.config.get('ocr.deskew.analysis_size', 1000) or 1000)
+        h, w = img.shape[:2]
+        scale = min(1.0, analysis_size / max(h, w))
+        small = cv2.resize(img, (max(1, int(w * scale)), max(1, int(h * scale))),
+                           interpolation=cv2.INTER_AREA) if scale < 1.0 else img
+        small_gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        
+        rotation = 0
+        if self.config.get('ocr.deskew.orientation', False):
+            rotation = self._detect_orientation(small_gray)
+            if rotation:
+                small_gray = self._rotate_right_angle(small_gray, rotation)
+        
+        min_angle = float(self.config.get('ocr.deskew.min_angle', 0.3) or 0)
+        # max_angle 0 turns skew correction off (orientation correction still applies)
+        max_angle = float(self.config.get('ocr.deskew.max_angle', 15))
+        skew = self._estimate_skew(small_gray) if max_angle > 0 else 0.0
+        if abs(skew) < min_angle or abs(skew) > max_angle:
+            skew = 0.0
+        
+        if not rotation and not skew:
+            return img
+        
+        # OSD reports clockwise degrees; getRotationMatrix2D expects counter-clockwise
+        angle = skew - rotation
+        M = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+        cos, sin = abs(M[0, 0]), abs(M[0, 1])
+        new_w = int(round(h * sin + w * cos))
+        new_h = int(round(h * cos + w * sin))
+        M[0, 2] += new_w / 2 - w / 2
+        M[1, 2] += new_h / 2 - h / 2
+        
+        self.logger.debug(f"Deskew: orientation {rotation}°, skew {skew:.2f}°")
+        return cv2.warpAffine(img, M, (new_w, new_h), flags=cv2.INTER_LINEAR,
+                              borderMode=cv2.BORDER_CONSTANT, borderValue=(255, 255, 255))
+    
+    def _estimate_skew(self, gray):
+        """Ước lượng góc nghiêng (độ) từ các dòng chữ bằng minAreaRect"""
+        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+        
+        # Merge characters into line blobs
+        kernel_w = max(3, gray.shape[1] // 40)
+        lines = cv2.dilate(binary, cv2.getStructuringElement(cv2.MORPH_RECT, (kernel_w, 3)))
+        contours, _ = cv2.findContours(lines, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        
+        angles = []
+        weights = []
+        for contour in contours:
+            (_, _), (rw, rh), angle = cv2.minAreaRect(contour)
+            if rw < rh:
+                rw, rh = rh, rw
+                angle -= 90
+            # Only elongated blobs look like text lines
+            if rh < 2 or rw / rh < 4:
+                continue
+            # minAreaRect angle conventions differ across OpenCV versions
+            while angle > 45:
+                angle -= 90
+            while angle <= -45:
+                angle += 90
+            angles.append(angle)
+            weights.append(rw)
+        
+        if not angles:
+            return 0.0
+        
+        # Length-weighted median is robust to stamps and stray blobs
+        order = np.argsort(angles)
+        cumulative = np.cumsum(np.asarray(weights)[order])
+        return float(np.asarray(angles)[order][np.searchsorted(cumulative, cumulative[-1] / 2)])
+    
+    def _detect_orientation(self, gray):
+        """Góc xoay 0/90/180/270 (theo chiều kim đồng hồ) từ Tesseract OSD"""
+        try:
+            import pytesseract
+            osd = pytesseract.image_to_osd(gray, config='--psm 0')
+        except Exception as e:
+            self.logger.warning(f"Orientation detection failed: {e}")
+            return 0
+        
+        for line in osd.splitlines():
+            if line.startswith('Rotate:'):
+                return int(line.split(':', 1)[1]) % 360
+        return 0
+    
+    @staticmethod
+    def _rotate_right_angle(img, clockwise_degrees):
+        codes = {
+            90: cv2.ROTATE_90_CLOCKWISE,
+            180: cv2.ROTATE_180,
+            270: cv2.ROTATE_90_COUNTERCLOCKWISE,
+        }
+        return cv2.rotate(img, codes[clockwise_degrees]) if clockwise_degrees in codes else img
+    
     def _resize_if_needed(self, img):
-        """Resize ảnh nếu quá lớn"""
+        """Chuẩn hóa độ phân giải theo chiều cao chữ, và resize nếu quá lớn"""
         max_dim = self.config.get('ocr.max_image_dimension', 1600)
         h, w = img.shape[:2]
         
-        if max(h, w) > max_dim:
+        scale = 1.0
+        if self.config.get('ocr.normalize.enabled', False):
+            scale = self._text_height_scale(img)
+        
+        if max(h, w) * scale > max_dim:
             scale = max_dim / max(h, w)
-            new_size = (int(w * scale), int(h * scale))
-            img = cv2.resize(img, new_size, interpolation=cv2.INTER_AREA)
-            self.logger.debug(f"Resized image to {new_size}")
+        
+        if scale != 1.0:
+            new_size = (max(1, int(w * scale)), max(1, int(h * scale)))
+            interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_CUBIC
+            img = cv2.resize(img, new_size, interpolation=interpolation)
+            self.logger.debug(f"Resized image to {new_size} (scale {scale:.2f})")
         
         return img
     
+    def _estimate_text_height(self, img):
+        """Ước lượng chiều cao chữ phổ biến (px, theo ảnh gốc) bằng connected components
+        
+        Runs on a downscaled grayscale copy; returns None when there are too
+        few glyph-like components for a reliable estimate.
+        """
+        analysis_size = int(self.config.get('ocr.normalize.analysis_size', 1500) or 1500)
+        h, w = img.shape[:2]
+        factor = min(1.0, analysis_size / max(h, w))
+        small = cv2.resize(img, (max(1, int(w * factor)), max(1, int(h * factor))),
+                           interpolation=cv2.INTER_AREA) if factor < 1.0 else img
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        
+        _, ink = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+        _, _, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+        widths = stats[1:, cv2.CC_STAT_WIDTH]
+        heights = stats[1:, cv2.CC_STAT_HEIGHT]
+        areas = stats[1:, cv2.CC_STAT_AREA]
+        
+        # Glyph-like: not specks, not rules/table lines, not page-sized blobs
+        glyph = (heights >= 3) & (areas >= 6) & (widths <= heights * 4) & \
+                (heights <= small.shape[0] * 0.1)
+        if np.count_nonzero(glyph) < 20:
+            return None
+        
+        return float(np.median(heights[glyph])) / factor
+    
+    def _text_height_scale(self, img):
+        """Hệ số scale để chiều cao chữ đạt ocr.normalize.target_text_height"""
+        target = float(self.config.get('ocr.normalize.target_text_height', 30) or 30)
+        min_scale = float(self.config.get('ocr.normalize.min_scale', 0.25) or 0.25)
+        max_scale = float(self.config.get('ocr.normalize.max_scale', 3.0) or 3.0)
+        tolerance = float(self.config.get('ocr.normalize.tolerance', 0.15) or 0)
+        
+        text_height = self._estimate_text_height(img)
+        if not text_height:
+            self.logger.debug("Text height estimate unavailable, keeping resolution")
+            return 1.0
+        
+        scale = min(max_scale, max(min_scale, target / text_height))
+        self.logger.debug(f"Estimated text height {text_height:.1f}px -> scale {scale:.2f}")
+        return 1.0 if abs(scale - 1.0) < tolerance else scale
+    
     def _sharpen_image(self, gray):
         """Sharpen để tăng độ nét chữ"""
         # Use unsharp mask for better sharpening
         kernel = np.array([[0, -1, 0], [-1, 5, -1], [0, -1, 0]], dtype=np.float32)
         return cv2.filter2D(gray, -1, kernel)
     
+    DENOISE_METHODS = ('nlmeans', 'nlmeans_downscaled', 'bilateral', 'median', 'none')
+    
     def _denoise_image(self, img):
-        """Khử nhiễu"""
+        """Khử nhiễu theo ocr.denoise_method"""
+        method = self.config.get('ocr.denoise_method', 'nlmeans') or 'none'
         h = self.config.get('ocr.denoise_strength', 10)
         h = int(h) if h else 10
+        
+        if method == 'none':
+            return img
+        
+        if method == 'median':
+            return cv2.medianBlur(img, 3)
+        
+        if method == 'bilateral':
+            # Edge-preserving, roughly an order of magnitude faster than NL-means
+            return cv2.bilateralFilter(img, 7, h * 5, 7)
+        
+        if method == 'nlmeans_downscaled':
+            # NL-means cost grows with pixel count; run it at reduced size and scale back
+            scale = float(self.config.get('ocr.denoise_downscale', 0.5) or 0.5)
+            rows, cols = img.shape[:2]
+            small = cv2.resize(img, (max(1, int(cols * scale)), max(1, int(rows * scale))),
+                               interpolation=cv2.INTER_AREA)
+            small = cv2.fastNlMeansDenoising(small, h=h, templateWindowSize=7, searchWindowSize=21)
+            return cv2.resize(small, (cols, rows), interpolation=cv2.INTER_LINEAR)
+        
+        if method != 'nlmeans':
+            raise ValueError(f"Unknown denoise method: {method}")
+        
         return cv2.fastNlMeansDenoising(
             img, 
             h=h, 
@@ -104,8 +440,15 @@ class ImagePreprocessor:
             searchWindowSize=21
         )
     
-    def _apply_threshold(self, img):
-        """Adaptive threshold"""
+    def _threshold_params(self):
+        """Lấy block size (luôn lẻ) và hằng số C cho adaptive threshold
+        
+        Returns the auto-tuned pair while processing an image with
+        ocr.threshold_tuning enabled, the configured pair otherwise.
+        """
+        if self._tuned_threshold is not None:
+            return self._tuned_threshold
+        
         block_size = self.config.get('ocr.adaptive_threshold_block', 31)
         c = self.config.get('ocr.adaptive_threshold_c', 9)
         
@@ -116,6 +459,128 @@ class ImagePreprocessor:
         if block_size % 2 == 0:
             block_size += 1
         
+        return block_size, c
+    
+    def _tune_threshold(self, gray):
+        """Chọn block size/C tốt nhất cho ảnh này từ lưới ocr.threshold_tuning, không chạy OCR
+        
+        The grid is evaluated on a downscaled, sharpened and denoised copy.
+        Per block size the Gaussian local mean is computed once and all C
+        values are thresholded against it in one NumPy comparison (the same
+        rule cv2.adaptiveThreshold applies). Each candidate is scored with
+        _score_binary times _ink_stability; block sizes are given at full
+        resolution and scaled to the analysis copy.
+        """
+        with self.metrics.span('preprocess.threshold_tuning') as span:
+            default_block, default_c = self._threshold_params()
+            blocks = self.config.get('ocr.threshold_tuning.blocks', None) or [15, 21, 31, 45, 61]
+            c_values = self.config.get('ocr.threshold_tuning.c_values', None) or [3, 5, 9, 13, 17]
+            analysis_size = int(self.config.get('ocr.threshold_tuning.analysis_size', 1000) or 1000)
+            
+            h, w = gray.shape[:2]
+            factor = min(1.0, analysis_size / max(h, w))
+            small = cv2.resize(gray, (max(1, int(w * factor)), max(1, int(h * factor))),
+                               interpolation=cv2.INTER_AREA) if factor < 1.0 else gray
+            small = self._denoise_image(self._sharpen_image(small))
+            
+            c_values = sorted(int(c) for c in c_values)
+            offsets = np.asarray(c_values, dtype=np.int16)[:, None, None]
+            pixels = small.astype(np.int16)
+            best, best_score = (default_block, default_c), -1.0
+            evaluated = 0
+            for block_size in blocks:
+                block_size = int(block_size) | 1
+                small_block = max(3, int(round(block_size * factor)) | 1)
+                kernel = cv2.getGaussianKernel(small_block, 0)
+                mean = cv2.sepFilter2D(small, -1, kernel, kernel,
+                                       borderType=cv2.BORDER_REPLICATE | cv2.BORDER_ISOLATED)
+                # Text (0) where pixel - mean <= -C, background (255) elsewhere
+                text_masks = (pixels - mean.astype(np.int16)) <= -offsets
+                stability = self._ink_stability(text_masks.mean(axis=(1, 2)), c_values)
+                # _score_binary is at most 1, so stability bounds the score: most stable first,
+                # stop once no remaining candidate can beat the best
+                for i in np.argsort(-stability):
+                    if stability[i] <= best_score:
+                        break
+                    score = stability[i] * self._score_binary(text_masks[i])
+                    if score > best_score:
+                        best, best_score = (block_size, c_values[i]), score
+                    evaluated += 1
+            
+            span.update(block=best[0], c=best[1], score=round(float(best_score), 4),
+                        candidates=len(blocks) * len(c_values), evaluated=evaluated)
+        
+        self.logger.debug(f"Threshold tuning: block {best[0]}, C {best[1]} (score {best_score:.3f})")
+        return best
+    
+    @staticmethod
+    def _ink_stability(ink_fractions, c_values):
+        """Độ ổn định của lượng mực theo C (0-1, cao = ổn định)
+        
+        Between the noise floor and the point where strokes start to erode
+        the amount of ink barely changes with C, as in MSER. The relative
+        change per unit of C is taken from the neighbouring grid values.
+        """
+        ink = np.asarray(ink_fractions, dtype=np.float64)
+        c_values = np.asarray(c_values, dtype=np.float64)
+        if len(ink) < 2:
+            return np.ones_like(ink)
+        
+        upper = np.minimum(np.arange(len(ink)) + 1, len(ink) - 1)
+        lower = np.maximum(np.arange(len(ink)) - 1, 0)
+        change = np.abs(ink[upper] - ink[lower]) / np.maximum(c_values[upper] - c_values[lower], 1)
+        return 1.0 / (1.0 + 50.0 * change / np.maximum(ink, 1e-6))
+    
+    @staticmethod
+    def _score_binary(text_mask):
+        """Điểm chất lượng của một ảnh nhị phân (cao hơn = giống chữ in hơn), 0-1
+        
+        Combines connected-component statistics with stroke-width
+        consistency: the share of ink in glyph-sized components (penalizes
+        blotches and merged glyphs), the share of ink in specks (penalizes
+        noise) and the coefficient of variation of stroke widths measured on
+        the distance-transform ridges of the glyphs.
+        """
+        ink = text_mask.view(np.uint8)
+        ink_fraction = np.count_nonzero(ink) / ink.size
+        if ink_fraction == 0 or ink_fraction > 0.5:
+            return 0.0
+        
+        count, labels, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+        areas = stats[1:, cv2.CC_STAT_AREA]
+        widths = stats[1:, cv2.CC_STAT_WIDTH]
+        heights = stats[1:, cv2.CC_STAT_HEIGHT]
+        
+        specks = areas < 6
+        if specks.all():
+            return 0.0
+        median_height = np.median(heights[~specks])
+        fill = areas / (widths * heights)
+        glyph = ~specks & (heights >= median_height * 0.5) & (heights <= median_height * 2.5) & \
+                (widths <= heights * 4) & (fill > 0.1) & (fill < 0.9)
+        if not glyph.any():
+            return 0.0
+        
+        total = areas.sum()
+        glyph_share = areas[glyph].sum() / total
+        speck_share = areas[specks].sum() / total
+        
+        # Stroke width = 2 x distance to background on the medial ridge of each glyph
+        dist = cv2.distanceTransform(ink, cv2.DIST_L2, 3)
+        ridge = (dist > 0) & (dist >= cv2.dilate(dist, np.ones((3, 3), np.uint8)))
+        ridge &= np.concatenate(([False], glyph))[labels]
+        strokes = dist[ridge]
+        stroke_cv = float(strokes.std() / strokes.mean()) if strokes.size else 1.0
+        
+        return float(glyph_share * (1.0 - speck_share) / (1.0 + stroke_cv))
+    
+    def _apply_threshold(self, img, block_size=None, c=None):
+        """Adaptive threshold (mặc định dùng tham số trong config)"""
+        if block_size is None or c is None:
+            default_block, default_c = self._threshold_params()
+            block_size = default_block if block_size is None else block_size
+            c = default_c if c is None else c
+        
         return cv2.adaptiveThreshold(
             img, 255,
             cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
@@ -123,6 +588,34 @@ class ImagePreprocessor:
             block_size, c
         )
     
+    def binarize(self, gray, roi=None, block_size=None, c=None, denoise=True):
+        """Chạy lại chuỗi filter trên (một phần) ảnh xám với tham số khác config
+        
+        Used to re-binarize low-confidence lines before re-OCR. With roi
+        (x0, y0, x1, y1) only that part is processed, padded by the filter
+        halo so the result matches a full-page run. block_size and c default
+        to the configured values; denoise=False skips the denoise stage.
+        No metrics spans are emitted.
+        """
+        default_block, default_c = self._threshold_params()
+        block_size = int(block_size or default_block) | 1
+        c = default_c if c is None else c
+        
+        if roi is not None:
+            x0, y0, x1, y1 = roi
+            rows, cols = gray.shape[:2]
+            halo = self._chain_halo() + max(0, block_size - default_block) // 2
+            top, left = max(0, y0 - halo), max(0, x0 - halo)
+            padded = gray[top:min(rows, y1 + halo), left:min(cols, x1 + halo)]
+            out = self.binarize(padded, block_size=block_size, c=c, denoise=denoise)
+            return out[y0 - top:y1 - top, x0 - left:x1 - left]
+        
+        img = self._sharpen_image(gray)
+        if denoise:
+            img = self._denoise_image(img)
+        binary = self._apply_threshold(img, block_size, c)
+        return self._morphological_clean(binary)
+    
     def _morphological_clean(self, img):
         """Morphological cleaning"""
         kernel = np.ones((1, 1), np.uint8)
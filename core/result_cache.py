@@ -0,0 +1,186 @@
+"""Cache kết quả OCR theo nội dung ảnh + cấu hình pipeline"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from utils.config import Config
+from utils.logger import Logger
+
+# Bump when the shape of cached results changes so older entries are not served
+RESULT_FORMAT = 3
+
+# Other processes (batch/server workers) write to the same database, so the running
+# size total is re-read from SQLite every this many puts
+_RESYNC_PUTS = 256
+
+
+class ResultCache:
+    """Two-tier (memory LRU + SQLite) content-addressed result cache
+
+    Keys are SHA-256 digests of the raw image bytes plus everything that
+    influences the output: the ocr.*, tesseract.*, keywords.* and
+    models.keybert settings and the contents of the drug dictionary file.
+    Changing the pipeline configuration or editing data/drugs.txt therefore
+    never returns stale results.
+    """
+
+    def __init__(self):
+        self.config = Config()
+        self.logger = Logger.get_logger('ResultCache')
+        self._lock = threading.Lock()
+
+        self.memory_items = int(self.config.get('cache.memory_items', 256) or 0)
+        self._memory = OrderedDict()
+
+        self.disk_max_bytes = int(float(self.config.get('cache.disk_max_mb', 512) or 0) * 1024 * 1024)
+        self._db = None
+        disk_path = self.config.get('cache.disk_path', 'cache/ocr_results.sqlite')
+        if disk_path and self.disk_max_bytes > 0:
+            self._open_disk(Path(disk_path))
+
+        self._config_digest = self._digest_config()
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+
+    def _open_disk(self, path):
+        """Mở (hoặc tạo) SQLite tier"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(path), timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "size INTEGER NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_results_accessed ON results(accessed)")
+        self._db.commit()
+        self._sync_disk_bytes()
+
+    def _sync_disk_bytes(self):
+        """Đọc lại tổng kích thước SQLite tier (khi mở và định kỳ, thay vì mỗi lần put)"""
+        self._disk_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        self._puts_since_sync = 0
+
+    def _digest_config(self):
+        """Hash các cấu hình ảnh hưởng tới kết quả OCR"""
+        relevant = {
+            'format': RESULT_FORMAT,
+            'keywords': self.config.get('keywords', {}),
+            'ocr': self.config.get('ocr', {}),
+            'tesseract': {
+                'backend': self.config.get('tesseract.backend'),
+                'lang': self.config.get('tesseract.lang'),
+                'config': self.config.get('tesseract.config'),
+            },
+            # Embedding model of the semantic fallback classifier (keywords.semantic)
+            'semantic_model': self.config.get('models.keybert'),
+            'drug_dictionary': self._digest_dictionary(),
+        }
+        return hashlib.sha256(json.dumps(relevant, sort_keys=True, default=str).encode('utf-8')).digest()
+
+    def _digest_dictionary(self):
+        """Hash nội dung file danh mục thuốc (tên thuốc được nhận dạng phụ thuộc vào nó)"""
+        from core.drug_dictionary import DrugDictionary
+
+        path = DrugDictionary._resolve_path(self.config.get('keywords.drug_dictionary', 'data/drugs.txt'))
+        try:
+            return hashlib.sha256(path.read_bytes()).hexdigest()
+        except OSError:
+            # Missing file: DrugDictionary raises when the pipeline loads it
+            return None
+
+    def make_key(self, image_bytes):
+        """Tạo key từ bytes ảnh gốc (hoặc mảng pixel của một trang tài liệu)"""
+        h = hashlib.sha256(self._config_digest)
+        if hasattr(image_bytes, 'shape'):
+            # Decoded pages: the shape disambiguates identical pixel buffers
+            h.update(repr(image_bytes.shape).encode('ascii'))
+        h.update(image_bytes)
+        return h.hexdigest()
+
+    def get(self, key):
+        """Lấy kết quả đã cache, trả về None nếu miss"""
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return json.loads(value)
+
+            if self._db is not None:
+                row = self._db.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._db.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+                    self._db.commit()
+                    self._remember(key, row[0])
+                    self.stats['disk_hits'] += 1
+                    return json.loads(row[0])
+
+            self.stats['misses'] += 1
+            return None
+
+    def put(self, key, result):
+        """Lưu kết quả vào cả hai tầng cache"""
+        value = json.dumps(result, ensure_ascii=False)
+
+        with self._lock:
+            self._remember(key, value)
+
+            if self._db is not None:
+                size = len(value.encode('utf-8'))
+                row = self._db.execute("SELECT size FROM results WHERE key = ?", (key,)).fetchone()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO results (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                    (key, value, size, time.time())
+                )
+                self._disk_bytes += size - (row[0] if row else 0)
+                self._puts_since_sync += 1
+                if self._puts_since_sync >= _RESYNC_PUTS:
+                    self._sync_disk_bytes()
+                self._evict_disk()
+                self._db.commit()
+
+    def _remember(self, key, value):
+        """Thêm vào LRU trong bộ nhớ"""
+        if self.memory_items <= 0:
+            return
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self):
+        """Xóa các mục ít dùng nhất khi vượt cache.disk_max_mb"""
+        if self._disk_bytes <= self.disk_max_bytes:
+            return
+        # Entries written by other processes are counted before deciding what to evict
+        self._sync_disk_bytes()
+        if self._disk_bytes <= self.disk_max_bytes:
+            return
+
+        evicted = []
+        for key, size in self._db.execute("SELECT key, size FROM results ORDER BY accessed"):
+            if self._disk_bytes <= self.disk_max_bytes:
+                break
+            evicted.append((key,))
+            self._disk_bytes -= size
+
+        self._db.executemany("DELETE FROM results WHERE key = ?", evicted)
+        self.stats['evictions'] += len(evicted)
+        self.logger.debug(f"Evicted {len(evicted)} cached results")
+
+    def clear(self):
+        """Xóa toàn bộ cache"""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM results")
+                self._db.commit()
+                self._disk_bytes = 0
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
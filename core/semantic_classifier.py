@@ -0,0 +1,221 @@
+"""Phân loại dòng bằng embedding (sentence-transformers) cho các dòng mà luật regex bỏ sót"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+import numpy as np
+from utils.config import Config
+from utils.logger import Logger
+from utils.metrics import Metrics
+
+# Example lines per class; a line is assigned to the class of its most similar example.
+# 'other' absorbs clinic headers, footers and similar lines that must stay unclassified.
+DEFAULT_PROTOTYPES = {
+    'info': [
+        "Họ và tên bệnh nhân: Nguyễn Văn An",
+        "Tuổi: 45   Giới tính: Nam",
+        "Địa chỉ: 12 Lê Lợi, Phường Bến Nghé, Quận 1",
+        "Chẩn đoán: Viêm họng cấp",
+        "Số thẻ BHYT: DN4790123456789",
+        "Ngày khám: 12/03/2024",
+    ],
+    'meds': [
+        "Paracetamol 500mg x 10 viên",
+        "Amoxicillin 250mg uống ngày 2 lần, mỗi lần 1 viên",
+        "Uống sáng 1 viên, tối 1 viên sau ăn",
+        "Ngày uống 3 lần, mỗi lần 1 gói",
+        "Nhỏ mắt 2 giọt mỗi lần, ngày 4 lần",
+        "Siro ho 60ml, uống 5ml khi ho",
+    ],
+    'other': [
+        "PHÒNG KHÁM ĐA KHOA AN BÌNH",
+        "Điện thoại: 028 3822 1234",
+        "Tái khám khi hết thuốc hoặc có dấu hiệu bất thường",
+        "Chữ ký bác sĩ điều trị",
+        "Trang 1/2",
+    ],
+}
+
+
+class SemanticClassifier:
+    """Embedding-based classifier for lines that match no rule
+
+    Lines of one document are embedded in a single batched forward pass
+    on CPU and compared (cosine similarity) with prototype embeddings for
+    'info', 'meds' and 'other'. Embeddings of repeated lines (clinic
+    headers, dosage phrases) are kept in an LRU cache. The model is loaded
+    on first use; without sentence-transformers the classifier is disabled.
+    """
+
+    def __init__(self):
+        self.config = Config()
+        self.logger = Logger.get_logger('SemanticClassifier')
+        self.metrics = Metrics()
+
+        self.enabled = bool(self.config.get('keywords.semantic.enabled', False))
+        self.model_name = self.config.get('models.keybert', 'paraphrase-multilingual-MiniLM-L12-v2')
+        self.cache_dir = self.config.get('models.cache_dir', 'models/')
+        self.threshold = float(self.config.get('keywords.semantic.threshold', 0.5))
+        self.margin = float(self.config.get('keywords.semantic.margin', 0.05))
+        self.batch_size = int(self.config.get('keywords.semantic.batch_size', 64) or 64)
+        self.cache_size = int(self.config.get('keywords.semantic.cache_size', 4096) or 0)
+        self.latency_budget_ms = float(self.config.get('keywords.semantic.latency_budget_ms', 0) or 0)
+        self.prototypes = self.config.get('keywords.semantic.prototypes', None) or DEFAULT_PROTOTYPES
+
+        self._model = None
+        self._proto_embeddings = None  # (n, dim), L2-normalized
+        self._proto_labels = None      # class name per row
+        self._cache = OrderedDict()    # line -> normalized embedding
+        self._lock = threading.Lock()
+        self._ms_per_line = None       # moving average of encode cost
+        self.stats = {'documents': 0, 'lines': 0, 'cache_hits': 0, 'encoded': 0, 'over_budget': 0}
+
+    @property
+    def available(self):
+        """True nếu đã bật và model tải được"""
+        return self.enabled and self.load()
+
+    def load(self):
+        """Tải model và prototype embeddings (tự động ở lần dùng đầu tiên)"""
+        if self._model is not None:
+            return True
+        if not self.enabled:
+            return False
+
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            self.logger.warning("keywords.semantic.enabled is set but sentence-transformers is not "
+                                "installed (pip install sentence-transformers); semantic classifier disabled")
+            self.enabled = False
+            return False
+
+        try:
+            with self.metrics.span('extract.semantic_load', model=self.model_name):
+                self._model = SentenceTransformer(self.model_name, device='cpu',
+                                                  cache_folder=self.cache_dir)
+                self._proto_labels, self._proto_embeddings = self._load_prototypes()
+            self.logger.info(f"Semantic classifier ready: {self.model_name}, "
+                             f"{len(self._proto_labels)} prototypes")
+            return True
+        except Exception as e:
+            self.logger.error(f"Cannot load semantic model {self.model_name}: {e}")
+            self._model = None
+            self.enabled = False
+            return False
+
+    def _load_prototypes(self):
+        """Embedding của các câu mẫu, lưu vào models.cache_dir để lần sau không phải tính lại"""
+        labels, texts = [], []
+        for label, examples in self.prototypes.items():
+            for text in examples:
+                labels.append(label)
+                texts.append(text)
+
+        digest = hashlib.sha256(json.dumps([self.model_name, labels, texts], ensure_ascii=False)
+                                .encode('utf-8')).hexdigest()[:16]
+        path = Path(self.cache_dir) / f"prototypes-{digest}.npy"
+        if path.exists():
+            return labels, np.load(path)
+
+        embeddings = self._encode(texts)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            np.save(path, embeddings)
+        except OSError as e:
+            self.logger.debug(f"Cannot save prototype embeddings: {e}")
+        return labels, embeddings
+
+    def _encode(self, lines):
+        return np.asarray(self._model.encode(
+            lines,
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False,
+        ), dtype=np.float32)
+
+    def classify(self, lines):
+        """Phân loại một lô dòng (thường là toàn bộ dòng chưa phân loại của một tài liệu)
+
+        Args:
+            lines: List of text lines
+
+        Returns:
+            List with 'info', 'meds' or None per line. Lines that would push
+            the encode time over keywords.semantic.latency_budget_ms are
+            skipped (None).
+        """
+        if not lines or not self.available:
+            return [None] * len(lines)
+
+        with self.metrics.span('extract.semantic', lines=len(lines)) as span, self._lock:
+            embeddings = {}
+            missing = []
+            for ln in dict.fromkeys(lines):
+                cached = self._cache.get(ln)
+                if cached is not None:
+                    self._cache.move_to_end(ln)
+                    embeddings[ln] = cached
+                else:
+                    missing.append(ln)
+
+            missing = self._fit_budget(missing)
+            if missing:
+                start = time.perf_counter()
+                for ln, vector in zip(missing, self._encode(missing)):
+                    embeddings[ln] = vector
+                    self._remember(ln, vector)
+                elapsed = (time.perf_counter() - start) * 1000
+                per_line = elapsed / len(missing)
+                self._ms_per_line = per_line if self._ms_per_line is None else \
+                    0.7 * self._ms_per_line + 0.3 * per_line
+
+            categories = [self._nearest(embeddings[ln]) if ln in embeddings else None for ln in lines]
+
+            self.stats['documents'] += 1
+            self.stats['lines'] += len(lines)
+            self.stats['cache_hits'] += len(embeddings) - len(missing)
+            self.stats['encoded'] += len(missing)
+            span.update(encoded=len(missing), cached=len(embeddings) - len(missing),
+                        classified=sum(c is not None for c in categories))
+
+        return categories
+
+    def _fit_budget(self, missing):
+        """Cắt bớt số dòng cần encode nếu ước lượng vượt latency budget"""
+        if not self.latency_budget_ms or self._ms_per_line is None:
+            return missing
+
+        # At least one line, so the cost estimate keeps being refreshed
+        affordable = max(1, int(self.latency_budget_ms / max(self._ms_per_line, 1e-3)))
+        if len(missing) <= affordable:
+            return missing
+
+        self.stats['over_budget'] += 1
+        self.logger.warning(f"Semantic budget {self.latency_budget_ms:.0f}ms allows {affordable} of "
+                            f"{len(missing)} new lines (~{self._ms_per_line:.1f}ms/line); rest left unclassified")
+        return missing[:affordable]
+
+    def _remember(self, line, vector):
+        if self.cache_size <= 0:
+            return
+        self._cache[line] = vector
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _nearest(self, vector):
+        """Lớp của prototype gần nhất; None nếu không đủ chắc chắn hoặc là 'other'"""
+        scores = self._proto_embeddings @ vector
+        best = {}
+        for label, score in zip(self._proto_labels, scores):
+            best[label] = max(best.get(label, -1.0), float(score))
+
+        ranked = sorted(best.items(), key=lambda item: item[1], reverse=True)
+        label, score = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else -1.0
+        if score < self.threshold or score - runner_up < self.margin or label not in ('info', 'meds'):
+            return None
+        return label
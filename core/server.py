@@ -0,0 +1,326 @@
+"""Dịch vụ HTTP OCR (asyncio) với micro-batching và pool engine luôn sẵn sàng"""
+import asyncio
+import email.parser
+import email.policy
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from utils.config import Config
+from utils.logger import Logger
+from utils.metrics import Metrics
+from core import batch as batch_worker
+
+HTTP_REASONS = {
+    200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+    408: 'Request Timeout', 411: 'Length Required', 413: 'Payload Too Large', 500: 'Internal Server Error',
+    503: 'Service Unavailable', 504: 'Gateway Timeout',
+}
+
+
+def process_batch(images):
+    """Chạy một micro-batch ảnh trong worker process (pipeline đã khởi tạo sẵn)"""
+    pipeline = batch_worker.get_pipeline()
+    results = []
+    for image_bytes in images:
+        try:
+            results.append(pipeline.run(image_bytes))
+        except Exception as e:
+            results.append({'error': str(e)})
+    return results
+
+
+def _warm_worker():
+    """Đảm bảo worker đã tải engine; trả về pid để không phải pickle pipeline"""
+    batch_worker.get_pipeline().warm_up()
+    return os.getpid()
+
+
+class HTTPError(Exception):
+    """Lỗi trả về cho client với mã HTTP tương ứng"""
+
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class OCRServer:
+    """Asyncio HTTP front-end over a pool of warm OCR worker processes
+
+    Requests are queued in a bounded asyncio.Queue (full queue -> 503),
+    grouped into micro-batches and dispatched to worker processes that keep
+    OCREngine and KeywordExtractor loaded. Every request has a timeout.
+    Uploads are admitted before their body is read: bodies being received
+    count against the queue, so a burst cannot buffer more than
+    queue_size uploads in memory. Open connections are capped at
+    server.max_connections.
+    """
+
+    def __init__(self, host=None, port=None, workers=None):
+        self.config = Config()
+        self.logger = Logger.get_logger('OCRServer')
+
+        self.host = host or self.config.get('server.host', '127.0.0.1')
+        self.port = int(port or self.config.get('server.port', 8080))
+        workers = workers or self.config.get('server.workers', 0)
+        self.workers = int(workers) if workers else (os.cpu_count() or 1)
+        self.batch_size = max(1, int(self.config.get('server.batch_size', 4) or 1))
+        self.batch_window = float(self.config.get('server.batch_window_ms', 10) or 0) / 1000
+        self.queue_size = max(1, int(self.config.get('server.queue_size', 64) or 1))
+        self.request_timeout = float(self.config.get('server.request_timeout', 60) or 60)
+        self.max_body = int(float(self.config.get('server.max_body_mb', 20) or 20) * 1024 * 1024)
+        self.max_connections = max(1, int(self.config.get('server.max_connections', 256) or 1))
+
+        self.queue = None
+        self.executor = None
+        self._batchers = []
+        self._connections = 0
+        self._receiving = 0  # bodies being read, admitted against the queue
+        self.stats = {'requests': 0, 'ok': 0, 'rejected': 0, 'timeouts': 0, 'errors': 0}
+
+    def _start_executor(self):
+        """Tạo process pool và khởi tạo engine trong từng worker"""
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=batch_worker._init_worker
+        )
+
+    async def serve_forever(self):
+        """Chạy server đến khi bị hủy"""
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self._start_executor()
+
+        # Warm every worker before accepting traffic
+        await self._warm_executor()
+
+        # One batcher per worker keeps at most `workers` batches in flight
+        self._batchers = [asyncio.create_task(self._batcher()) for _ in range(self.workers)]
+
+        server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        self.logger.info(f"OCR server listening on http://{self.host}:{self.port} "
+                         f"({self.workers} workers, batch {self.batch_size}, queue {self.queue_size})")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in self._batchers:
+                task.cancel()
+            # Workers exit normally and flush their metrics; queued batches are dropped
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            Metrics().close()
+
+    async def _warm_executor(self):
+        """Tải engine trong mọi worker của pool hiện tại"""
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(
+            loop.run_in_executor(self.executor, _warm_worker)
+            for _ in range(self.workers)
+        ), return_exceptions=True)
+
+    def _restart_executor(self, broken):
+        """Thay pool bị hỏng; chỉ batcher đầu tiên thấy lỗi của pool đó mới thay
+
+        Returns:
+            True if a new pool was started (it still needs warming)
+        """
+        if self.executor is not broken:
+            # Another batcher already replaced it
+            return False
+        self._start_executor()
+        broken.shutdown(wait=False, cancel_futures=True)
+        return True
+
+    async def _batcher(self):
+        """Gom request thành micro-batch và gửi cho worker"""
+        loop = asyncio.get_running_loop()
+
+        while True:
+            items = [await self.queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(items) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    items.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Drop requests whose client already timed out
+            items = [(data, fut) for data, fut in items if not fut.done()]
+            if not items:
+                continue
+
+            restarted = False
+            executor = self.executor
+            try:
+                results = await loop.run_in_executor(
+                    executor, process_batch, [data for data, _ in items]
+                )
+            except BrokenProcessPool as e:
+                restarted = self._restart_executor(executor)
+                if restarted:
+                    self.logger.error(f"Worker pool crashed, restarting: {e}")
+                results = [{'error': 'worker crashed'}] * len(items)
+            except Exception as e:
+                self.logger.error(f"Batch error: {e}")
+                results = [{'error': str(e)}] * len(items)
+
+            for (_, fut), result in zip(items, results):
+                if not fut.done():
+                    fut.set_result(result)
+
+            if restarted:
+                await self._warm_executor()
+
+    async def _handle_client(self, reader, writer):
+        started = time.perf_counter()
+        status, body, headers = 500, {'error': 'internal error'}, {}
+        method, path = '-', '-'
+
+        if self._connections >= self.max_connections:
+            self.stats['rejected'] += 1
+            await self._write_response(writer, 503, {'error': 'too many connections, retry later'},
+                                       {'Retry-After': '1'})
+            return
+
+        self._connections += 1
+        try:
+            try:
+                method, path, req_headers, payload = await asyncio.wait_for(
+                    self._read_request(reader), self.request_timeout)
+                status, body = await self._route(method, path, req_headers, payload)
+            except HTTPError as e:
+                status, body, headers = e.status, {'error': str(e)}, e.headers
+            except asyncio.TimeoutError:
+                status, body = 408, {'error': f'request not received within {self.request_timeout:.0f}s'}
+            except (asyncio.IncompleteReadError, ConnectionError):
+                writer.close()
+                return
+            except Exception as e:
+                self.logger.error(f"Request error: {e}")
+                self.stats['errors'] += 1
+                status, body = 500, {'error': str(e)}
+
+            await self._write_response(writer, status, body, headers)
+        finally:
+            self._connections -= 1
+        self.logger.info(f"{method} {path} {status} {(time.perf_counter() - started) * 1000:.0f}ms")
+
+    async def _read_request(self, reader):
+        """Đọc request line, headers và body (yêu cầu Content-Length)"""
+        request_line = (await reader.readline()).decode('latin-1').strip()
+        parts = request_line.split()
+        if len(parts) != 3:
+            raise HTTPError(400, 'malformed request line')
+        method, path, _ = parts
+
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1')
+            if line in ('\r\n', '\n', ''):
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        payload = b''
+        if method == 'POST':
+            if 'content-length' not in headers:
+                raise HTTPError(411, 'Content-Length required')
+            try:
+                length = int(headers['content-length'])
+            except ValueError:
+                raise HTTPError(400, 'invalid Content-Length')
+            if length < 0:
+                raise HTTPError(400, 'invalid Content-Length')
+            if length > self.max_body:
+                raise HTTPError(413, f'body exceeds {self.max_body} bytes')
+
+            # Admission before the upload is buffered: a full queue rejects without reading it
+            if self.queue.qsize() + self._receiving >= self.queue_size:
+                self.stats['rejected'] += 1
+                raise HTTPError(503, 'server busy, retry later', {'Retry-After': '1'})
+            self._receiving += 1
+            try:
+                payload = await reader.readexactly(length)
+            finally:
+                self._receiving -= 1
+
+        return method, path.split('?', 1)[0], headers, payload
+
+    async def _route(self, method, path, headers, payload):
+        if path == '/health':
+            return 200, {
+                'status': 'ok',
+                'queued': self.queue.qsize(),
+                'queue_size': self.queue_size,
+                'workers': self.workers,
+                'stats': self.stats,
+            }
+
+        if path != '/ocr':
+            raise HTTPError(404, 'not found')
+        if method != 'POST':
+            raise HTTPError(405, 'use POST')
+
+        image_bytes = self._extract_image(headers, payload)
+        return 200, await self.submit(image_bytes)
+
+    def _extract_image(self, headers, payload):
+        """Lấy bytes ảnh từ body thô hoặc multipart/form-data"""
+        content_type = headers.get('content-type', '')
+        if not content_type.startswith('multipart/form-data'):
+            if not payload:
+                raise HTTPError(400, 'empty body')
+            return payload
+
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            f'Content-Type: {content_type}\r\n\r\n'.encode('latin-1') + payload
+        )
+        for part in message.iter_parts():
+            if part.get_filename() or part.get_param('name', header='content-disposition') == 'file':
+                return part.get_payload(decode=True)
+        raise HTTPError(400, "multipart body has no 'file' field")
+
+    async def submit(self, image_bytes):
+        """Đưa ảnh vào hàng đợi và chờ kết quả (có timeout)"""
+        self.stats['requests'] += 1
+        fut = asyncio.get_running_loop().create_future()
+
+        try:
+            self.queue.put_nowait((image_bytes, fut))
+        except asyncio.QueueFull:
+            self.stats['rejected'] += 1
+            raise HTTPError(503, 'server busy, retry later', {'Retry-After': '1'})
+
+        try:
+            result = await asyncio.wait_for(fut, self.request_timeout)
+        except asyncio.TimeoutError:
+            self.stats['timeouts'] += 1
+            raise HTTPError(504, f'OCR did not finish within {self.request_timeout:.0f}s')
+
+        if 'error' in result:
+            self.stats['errors'] += 1
+            raise HTTPError(500, result['error'])
+
+        self.stats['ok'] += 1
+        return result
+
+    async def _write_response(self, writer, status, body, headers):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        head = [
+            f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}",
+            "Content-Type: application/json; charset=utf-8",
+            f"Content-Length: {len(data)}",
+            "Connection: close",
+        ] + [f"{k}: {v}" for k, v in headers.items()]
+
+        try:
+            writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + data)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
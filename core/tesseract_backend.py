@@ -0,0 +1,175 @@
+"""Backend gọi Tesseract: pytesseract (mỗi ảnh một process) hoặc tesserocr (worker thường trú)"""
+import os
+import queue
+import re
+import pytesseract
+from utils.logger import Logger
+
+
+class PytesseractBackend:
+    """Spawns the tesseract CLI for every image (default behaviour)"""
+
+    name = 'pytesseract'
+
+    def __init__(self, lang, config_str):
+        self.lang = lang
+        self.config_str = config_str
+
+    def image_to_string(self, img):
+        return pytesseract.image_to_string(img, lang=self.lang, config=self.config_str)
+
+    def image_to_data(self, img, psm=None):
+        """Các từ nhận dạng được kèm bbox, độ tin cậy và id dòng (TSV của tesseract)
+
+        psm overrides the page segmentation mode of tesseract.config for this call.
+        """
+        config_str = self.config_str
+        if psm is not None:
+            config_str = re.sub(r'--psm\s+\d+', '', config_str or '').strip() + f' --psm {int(psm)}'
+        data = pytesseract.image_to_data(img, lang=self.lang, config=config_str,
+                                         output_type=pytesseract.Output.DICT)
+        words = []
+        for i, text in enumerate(data['text']):
+            if int(data['level'][i]) != 5 or not text.strip():
+                continue
+            words.append({
+                'text': text,
+                'conf': float(data['conf'][i]),
+                'bbox': (int(data['left'][i]), int(data['top'][i]),
+                         int(data['width'][i]), int(data['height'][i])),
+                'line': (int(data['block_num'][i]), int(data['par_num'][i]), int(data['line_num'][i])),
+            })
+        return words
+
+    def close(self):
+        pass
+
+
+class TesserocrBackend:
+    """Long-lived Tesseract C-API workers with the language model loaded once
+
+    Each worker is a PyTessBaseAPI instance; images are handed over as raw
+    pixel buffers so nothing is written to disk and no process is forked.
+    """
+
+    name = 'tesserocr'
+
+    def __init__(self, lang, config_str, tessdata_path=None, workers=1):
+        import tesserocr
+
+        self.logger = Logger.get_logger('TesserocrBackend')
+        psm, oem = self._parse_config(config_str, tesserocr)
+
+        kwargs = {'lang': lang, 'psm': psm, 'oem': oem}
+        if tessdata_path:
+            kwargs['path'] = tessdata_path
+
+        self._apis = queue.Queue()
+        self._all_apis = []
+        for _ in range(max(1, int(workers))):
+            api = tesserocr.PyTessBaseAPI(**kwargs)
+            self._apis.put(api)
+            self._all_apis.append(api)
+
+        self.logger.info(f"Loaded {len(self._all_apis)} tesserocr worker(s), lang={lang}")
+
+    @staticmethod
+    def _parse_config(config_str, tesserocr):
+        """Chuyển '--oem 1 --psm 6' sang enum của tesserocr"""
+        psm = tesserocr.PSM.AUTO
+        oem = tesserocr.OEM.DEFAULT
+
+        m = re.search(r'--psm\s+(\d+)', config_str or '')
+        if m:
+            psm = int(m.group(1))
+        m = re.search(r'--oem\s+(\d+)', config_str or '')
+        if m:
+            oem = int(m.group(1))
+
+        return psm, oem
+
+    @staticmethod
+    def _set_image(api, img):
+        if len(img.shape) == 2:
+            h, w = img.shape
+            bpp = 1
+        else:
+            h, w, bpp = img.shape
+        buf = img if img.flags['C_CONTIGUOUS'] else img.copy(order='C')
+        api.SetImageBytes(buf.tobytes(), w, h, bpp, w * bpp)
+
+    def image_to_string(self, img):
+        api = self._apis.get()
+        try:
+            self._set_image(api, img)
+            return api.GetUTF8Text()
+        finally:
+            self._apis.put(api)
+
+    def image_to_data(self, img, psm=None):
+        """Giống PytesseractBackend.image_to_data, đọc qua ResultIterator"""
+        from tesserocr import RIL, iterate_level
+
+        api = self._apis.get()
+        default_psm = api.GetPageSegMode()
+        try:
+            if psm is not None:
+                api.SetPageSegMode(int(psm))
+            self._set_image(api, img)
+            api.Recognize()
+            iterator = api.GetIterator()
+            if iterator is None:
+                return []
+            words = []
+            line_id = 0
+            for word in iterate_level(iterator, RIL.WORD):
+                if word.IsAtBeginningOf(RIL.TEXTLINE):
+                    line_id += 1
+                text = word.GetUTF8Text(RIL.WORD)
+                box = word.BoundingBox(RIL.WORD)
+                if not text or not text.strip() or box is None:
+                    continue
+                x0, y0, x1, y1 = box
+                words.append({
+                    'text': text,
+                    'conf': float(word.Confidence(RIL.WORD)),
+                    'bbox': (x0, y0, x1 - x0, y1 - y0),
+                    'line': line_id,
+                })
+            return words
+        finally:
+            if psm is not None:
+                api.SetPageSegMode(default_psm)
+            self._apis.put(api)
+
+    def close(self):
+        for api in self._all_apis:
+            api.End()
+        self._all_apis = []
+
+
+def create_backend(config, tesseract_path, logger):
+    """Tạo backend theo tesseract.backend trong config
+
+    Falls back to pytesseract when tesserocr is not installed.
+    """
+    lang = config.get('tesseract.lang', 'vie')
+    config_str = config.get('tesseract.config', '--oem 1 --psm 6')
+    backend = config.get('tesseract.backend', 'pytesseract')
+
+    if backend == 'tesserocr':
+        tessdata_path = config.get('tesseract.tessdata')
+        if not tessdata_path:
+            candidate = os.path.join(os.path.dirname(tesseract_path), 'tessdata')
+            tessdata_path = candidate if os.path.isdir(candidate) else None
+
+        try:
+            return TesserocrBackend(
+                lang, config_str,
+                tessdata_path=tessdata_path,
+                workers=config.get('tesseract.workers', 1) or 1
+            )
+        except ImportError:
+            logger.warning("tesserocr not installed, falling back to pytesseract")
+
+    return PytesseractBackend(lang, config_str)
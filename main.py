@@ -1,19 +1,22 @@
 """Ứng dụng chính - OCR + KE Đơn Thuốc"""
+import time
+_STARTED = time.perf_counter()
+
 import tkinter as tk
 from tkinter import filedialog, messagebox, scrolledtext, ttk
 from PIL import Image, ImageTk
 import threading
+import json
 from pathlib import Path
-import cv2
-import numpy as np
 import webbrowser
 import urllib.parse
 import os
 
 from utils.config import Config
 from utils.logger import Logger
-from core.ocr_engine import OCREngine
-from core.keyword_extractor import KeywordExtractor
+
+# OpenCV, NumPy, pytesseract and the engines are imported in the background
+# by load_engines (or at first use), so the window appears immediately.
 
 class OCRApp:
     def __init__(self, root):
@@ -29,13 +32,27 @@ class OCRApp:
         self.result_data = None
         self.ocr_engine = None
         self.keyword_extractor = None
+        self.pipeline = None
         self.preprocessing_steps = None  # Store preprocessing images
         
+        # Set once load_engines finished (successfully or not)
+        self.engine_ready = threading.Event()
+        self.engine_error = None
+        self.startup_times = {}
+        
         self.create_widgets()
-        self.load_engines()
+        self.startup_times['widgets_ms'] = self._elapsed_ms()
+        
+        # Start loading only after the window has been drawn
+        self.root.after_idle(self.load_engines)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
         self.logger.info("App started")
     
+    @staticmethod
+    def _elapsed_ms():
+        return round((time.perf_counter() - _STARTED) * 1000, 1)
+    
     def create_widgets(self):
         # Header
         header = tk.Frame(self.root, bg="#00695C", height=80)
@@ -133,7 +150,7 @@ class OCRApp:
 
         self.preprocess_var = tk.StringVar(value="final")
         self.preprocess_dropdown = ttk.Combobox(control_frame, textvariable=self.preprocess_var,
-                                               values=["original", "resized", "grayscale", "sharpened",
+                                               values=["original", "resized", "deskewed", "grayscale", "sharpened",
                                                        "denoised", "binary", "final"],
                                                state="readonly", width=15)
         self.preprocess_dropdown.pack(side="left", padx=5)
@@ -148,20 +165,56 @@ class OCRApp:
                  bg="#FF9800", fg="white", command=self.xuat_ket_qua).pack(pady=5)
     
     def load_engines(self):
+        """Import và khởi tạo engine trong thread nền; engine_ready báo khi xong"""
+        self.startup_times['window_ms'] = self._elapsed_ms()
+        
         def worker():
             try:
-                self.update_status("⏳ Loading OCR...", "orange")
+                self.update_status("⏳ Loading OCR engine...", "orange")
+                from core.ocr_engine import OCREngine
+                from core.keyword_extractor import KeywordExtractor
+                from core.pipeline import OCRPipeline
+                self.startup_times['imports_ms'] = self._elapsed_ms()
+                
                 self.ocr_engine = OCREngine()
                 
-                self.update_status("⏳ Loading KeyBERT...", "orange")
+                self.update_status("⏳ Loading drug dictionary...", "orange")
                 self.keyword_extractor = KeywordExtractor()
+                self.pipeline = OCRPipeline(self.ocr_engine, self.keyword_extractor)
+                
+                self.update_status("⏳ Warming up...", "orange")
+                self.pipeline.warm_up()
                 
                 self.update_status("✅ Sẵn sàng!", "green")
             except Exception as e:
+                self.engine_error = e
+                self.logger.error(f"Engine loading failed: {e}")
                 self.update_status(f"❌ Lỗi: {e}", "red")
+            finally:
+                self.startup_times['ready_ms'] = self._elapsed_ms()
+                self.logger.info(f"Startup times: {self.startup_times}")
+                self.engine_ready.set()
         
         threading.Thread(target=worker, daemon=True).start()
     
+    def exit_when_ready(self, report_path):
+        """Dùng cho benchmarks/bench_startup.py: ghi thời gian khởi động rồi thoát"""
+        def check():
+            if not self.engine_ready.is_set():
+                self.root.after(10, check)
+                return
+            report = dict(self.startup_times, error=str(self.engine_error) if self.engine_error else None)
+            Path(report_path).write_text(json.dumps(report), encoding='utf-8')
+            self.on_close()
+        
+        self.root.after(10, check)
+    
+    def on_close(self):
+        """Đóng cửa sổ: ghi nốt metrics đang đệm rồi thoát"""
+        from utils.metrics import Metrics
+        Metrics().close()
+        self.root.destroy()
+    
     def update_status(self, text, color="black"):
         colors = {"green": "#C8E6C9", "orange": "#FFE082", "red": "#FFCDD2"}
         self.status_label.config(text=text, bg=colors.get(color, "#FFF9C4"))
@@ -169,7 +222,11 @@ class OCRApp:
     def chon_anh(self):
         filepath = filedialog.askopenfilename(
             title="Chọn ảnh",
-            filetypes=[("Images", "*.jpg *.jpeg *.png *.bmp")]
+            filetypes=[
+                ("Images & documents", "*.jpg *.jpeg *.png *.bmp *.pdf *.tif *.tiff"),
+                ("Images", "*.jpg *.jpeg *.png *.bmp"),
+                ("PDF / TIFF", "*.pdf *.tif *.tiff"),
+            ]
         )
         
         if filepath:
@@ -180,7 +237,14 @@ class OCRApp:
     
     def hien_thi_anh(self, path):
         try:
-            img = Image.open(path)
+            if Path(path).suffix.lower() == '.pdf':
+                # Preview the first page only
+                import cv2
+                from core.document_loader import DocumentLoader
+                page = DocumentLoader().load_page(path, 1)
+                img = Image.fromarray(cv2.cvtColor(page, cv2.COLOR_BGR2RGB))
+            else:
+                img = Image.open(path)
             img.thumbnail((400, 400))
             photo = ImageTk.PhotoImage(img)
             self.image_label.config(image=photo, text="")
@@ -193,10 +257,6 @@ class OCRApp:
             messagebox.showwarning("Lỗi", "Chọn ảnh trước!")
             return
         
-        if not self.ocr_engine or not self.keyword_extractor:
-            messagebox.showwarning("Chờ", "Engine chưa sẵn sàng!")
-            return
-        
         self.btn_analyze.config(state="disabled")
         self.result_text.delete("1.0", tk.END)
         self.raw_text.delete("1.0", tk.END)
@@ -205,20 +265,39 @@ class OCRApp:
         
         def worker():
             try:
-                text, preprocessing_steps = self.ocr_engine.extract_text(
-                    self.image_path, 
-                    self.update_status,
-                    return_preprocessing_steps=True
-                )
+                result = None
                 
-                # Store preprocessing steps for visualization
-                self.preprocessing_steps = preprocessing_steps
+                if not self.engine_ready.is_set():
+                    self.update_status("⏳ Đang chờ engine khởi động...", "orange")
+                    self.engine_ready.wait()
+                if self.pipeline is None:
+                    raise RuntimeError(f"Engine chưa sẵn sàng ({self.engine_error})")
+                
+                from core.document_loader import DocumentLoader
+                if DocumentLoader.is_document(self.image_path):
+                    self.phan_tich_tai_lieu()
+                    return
                 
-                # Display final preprocessing image
-                self.display_preprocessing_step('final')
+                # Lines are shown as soon as each text block is recognized;
+                # full-resolution steps so "save step image" writes the real stage output
+                for event in self.pipeline.iter_results(
+                    self.image_path, 
+                    self.update_status,
+                    return_preprocessing_steps=True,
+                    snapshots='all'
+                ):
+                    if event['type'] == 'preprocessed':
+                        # Store preprocessing steps for visualization
+                        self.preprocessing_steps = event['steps']
+                        self.display_preprocessing_step('final')
+                    elif event['type'] == 'line':
+                        self.hien_thi_dong_tam(event['category'], event['text'])
+                    elif event['type'] == 'done':
+                        result = event['result']
                 
-                result = self.keyword_extractor.extract(text, self.update_status)
-                result['raw_text'] = text
+                # Preprocessing images are not available for cached results
+                if not self.preprocessing_steps:
+                    self.preprocess_label.config(image="", text="Kết quả lấy từ cache")
                 
                 self.hien_thi_ket_qua(result)
             except Exception as e:
@@ -228,6 +307,30 @@ class OCRApp:
         
         threading.Thread(target=worker, daemon=True).start()
     
+    def phan_tich_tai_lieu(self):
+        """PDF/TIFF nhiều trang: xử lý lần lượt từng trang, hiển thị kết quả mỗi trang ngay khi xong"""
+        def on_page(page_result):
+            self.result_text.insert(tk.END, f"📄 Trang {page_result['page']}\n")
+            if 'error' in page_result:
+                self.result_text.insert(tk.END, f"❌ {page_result['error']}\n")
+                return
+            for category in ('info', 'meds'):
+                for ln in page_result[category]:
+                    self.hien_thi_dong_tam(category, ln)
+        
+        result = self.pipeline.run_document(self.image_path, self.update_status, on_page)
+        if 'error' in result:
+            raise RuntimeError(result['error'])
+        
+        self.preprocess_label.config(image="", text=f"Tài liệu {result['page_count']} trang")
+        self.hien_thi_ket_qua(result)
+    
+    def hien_thi_dong_tam(self, category, line):
+        """Hiển thị ngay một dòng vừa nhận dạng (kết quả tạm thời)"""
+        icon = "🔹" if category == 'info' else "💊"
+        self.result_text.insert(tk.END, f"{icon} {line}\n")
+        self.result_text.see(tk.END)
+    
     def hien_thi_ket_qua(self, data):
         """Display results with clickable drug links"""
         self.result_text.config(state="normal")
@@ -245,9 +348,13 @@ class OCRApp:
         med_header = "\n💊 THUỐC\n" + "="*60 + "\n"
         self.result_text.insert(tk.END, med_header)
         
-        for i, med in enumerate(data['meds'], 1):
-            # Extract drug name (first word or phrase before dosage)
-            drug_name = self._extract_drug_name(med)
+        # Structured records from the extractor (older cached results only have the lines)
+        records = data.get('medications')
+        if records is None:
+            records = self.keyword_extractor.medication_records(data['meds'])
+        
+        for i, med in enumerate(records, 1):
+            drug_name = med['drug'] or med['line']
             
             # Insert number and separator
             self.result_text.insert(tk.END, f"{i}. ")
@@ -259,31 +366,14 @@ class OCRApp:
             # Insert drug name with BOTH tags: drug_link (for styling) and drug_i (for data)
             self.result_text.insert(tk.END, drug_name, ("drug_link", tag_name))
             
-            # Find the actual position of drug name in original med line and get the rest
-            # Use case-insensitive search
-            drug_upper = drug_name.upper()
-            med_upper = med.upper()
-            pos = med_upper.find(drug_upper)
-            
-            if pos >= 0:
-                # Found the drug name in the original text
-                rest_start = pos + len(drug_name)
-                rest_of_med = med[rest_start:]
-            else:
-                # Fallback: get everything after first word(s)
-                words = med.split()
-                # Find first word with dosage unit
-                dosage_units = ['mg', 'ml', 'g', 'viên', 'tab', 'lần', 'ngày', 'gói', 'sáng', 'chiều', 'tối']
-                rest_start = 0
-                for word in words:
-                    if any(unit in word.lower() for unit in dosage_units):
-                        break
-                    rest_start += len(word) + 1
-                rest_of_med = med[rest_start:] if rest_start < len(med) else ""
-            
-            # Insert rest of medication info
+            # Rest of the line after the drug name span (strength, quantity, instructions)
+            rest_of_med = med['line'][med['drug_end']:] if med['drug_end'] is not None else ""
             if rest_of_med.strip():
-                self.result_text.insert(tk.END, rest_of_med.strip())
+                self.result_text.insert(tk.END, " " + rest_of_med.strip())
+            
+            schedule = self._format_schedule(med)
+            if schedule:
+                self.result_text.insert(tk.END, f"\n   ⏰ {schedule}")
             
             self.result_text.insert(tk.END, "\n")
         
@@ -292,42 +382,13 @@ class OCRApp:
         self.result_data = data
         self.update_status("✅ Hoàn tất!", "green")
     
-    def _extract_drug_name(self, medication_line):
-        """Extract drug name from medication line"""
-        # Known drug names (to match against messy OCR)
-        known_drugs = [
-            'PROPANOLOL', 'AUGMENTIN', 'AUNGMENTIN', 'PARACETAMOL', 'IBUPROFEN',
-            'AMOXICILLIN', 'CEPHALEXIN', 'CEFIXIME', 'OMEPRAZOLE', 'RANITIDINE',
-            'SALBUTAMOL', 'LORATADINE', 'CETIRIZINE', 'VITAMIN', 'ASPIRIN',
-            'METFORMIN', 'LISINOPRIL', 'AMLODIPINE', 'AEEMUC', 'CETIN'
-        ]
-        
-        med_upper = medication_line.upper()
-        
-        # Check if line contains any known drug name
-        for drug in known_drugs:
-            if drug in med_upper:
-                # Return the drug name as it appears in config
-                if drug == 'AUNGMENTIN':
-                    return 'AUGMENTIN'
-                return drug
-        
-        # Fallback: get first word(s) before dosage/instructions
-        words = medication_line.split()
-        if not words:
-            return medication_line
-        
-        # Find where dosage/instructions start
-        dosage_units = ['mg', 'ml', 'g', 'viên', 'tab', 'lần', 'ngày', 'gói', 'sáng', 'chiều', 'tối']
-        for i, word in enumerate(words):
-            if any(unit in word.lower() for unit in dosage_units):
-                # Return everything before the dosage
-                if i > 0:
-                    return ' '.join(words[:i])
-                return words[0]
-        
-        # If no dosage found, take first word (most likely to be drug name)
-        return words[0] if words else medication_line
+    def _format_schedule(self, med):
+        """Lịch dùng thuốc dạng 'Sáng 1 · Tối 1 viên'"""
+        labels = (('morning', 'Sáng'), ('noon', 'Trưa'), ('afternoon', 'Chiều'), ('evening', 'Tối'))
+        parts = [f"{label} {med[slot]:g}" for slot, label in labels if med.get(slot) is not None]
+        if not parts:
+            return ""
+        return " · ".join(parts) + (f" {med['form']}" if med.get('form') else "")
     
     def on_drug_click(self, event):
         """Handle drug name click - open Google search"""
@@ -470,6 +531,7 @@ class OCRApp:
         if not self.preprocessing_steps or step_name not in self.preprocessing_steps:
             return
         
+        import cv2  # already loaded by the engine thread
         img_array = self.preprocessing_steps[step_name]
         
         # Convert to RGB if grayscale
@@ -506,6 +568,7 @@ class OCRApp:
         
         if filepath:
             try:
+                import cv2
                 img_array = self.preprocessing_steps[step_name]
                 cv2.imwrite(filepath, img_array)
                 messagebox.showinfo("OK", f"Đã lưu: {filepath}")
@@ -531,4 +594,6 @@ if __name__ == "__main__":
     Path("logs").mkdir(exist_ok=True)
     root = tk.Tk()
     app = OCRApp(root)
+    if os.environ.get('OCR_STARTUP_PROBE'):
+        app.exit_when_ready(os.environ['OCR_STARTUP_PROBE'])
     root.mainloop()
@@ -0,0 +1,39 @@
+"""Chạy dịch vụ HTTP OCR cho các máy trạm phòng khám
+
+Ví dụ:
+    python server.py --port 8080 --workers 4
+    curl --data-binary @don_thuoc.jpg http://127.0.0.1:8080/ocr
+"""
+import argparse
+import asyncio
+import multiprocessing
+import sys
+from pathlib import Path
+
+from core.server import OCRServer
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Dịch vụ HTTP OCR + KE đơn thuốc")
+    parser.add_argument('--host', default=None, help="Địa chỉ lắng nghe (mặc định: server.host)")
+    parser.add_argument('--port', type=int, default=None, help="Cổng (mặc định: server.port)")
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help="Số worker process (mặc định: server.workers hoặc số lõi CPU)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    Path("logs").mkdir(exist_ok=True)
+
+    server = OCRServer(host=args.host, port=args.port, workers=args.workers)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -1,4 +0,0 @@
-from PyInstaller.utils.hooks import collect_submodules, collect_data_files
-
-hiddenimports = collect_submodules('sklearn')
-datas = collect_data_files('sklearn')
\ No newline at end of file
@@ -0,0 +1,21 @@
+"""Tests run against the repository root: config.yaml and data/ are resolved from the working directory"""
+import copy
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from utils.config import Config  # noqa: E402
+
+
+@pytest.fixture
+def config():
+    """Config() singleton; every config.set() made by the test is undone afterwards"""
+    config = Config()
+    saved = copy.deepcopy(config._config)
+    yield config
+    config._config = saved
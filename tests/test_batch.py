@@ -0,0 +1,54 @@
+"""A worker process that dies must not hang BatchProcessor.run/run_queue"""
+import json
+import os
+import time
+
+import pytest
+
+import core.batch as batch
+from core.batch import BatchProcessor
+
+
+class FakePipeline:
+    """Pipeline stand-in: 'poison' images kill the worker process like a native crash"""
+
+    def run(self, image):
+        time.sleep(0.02)
+        if 'poison' in str(image):
+            os._exit(1)
+        return {'info': [], 'meds': [], 'medications': [], 'lines': [], 'raw_text': str(image)}
+
+
+def fake_init_worker():
+    batch._pipeline = FakePipeline()
+
+
+@pytest.fixture
+def images(monkeypatch, tmp_path):
+    # Workers are forked, so they inherit the patched initializer
+    monkeypatch.setattr(batch, '_init_worker', fake_init_worker)
+    paths = [str(tmp_path / f'img{i:02d}.png') for i in range(12)]
+    paths.insert(5, str(tmp_path / 'poison.png'))
+    return paths
+
+
+def read_jsonl(path):
+    with open(path, encoding='utf-8') as f:
+        return {row['image']: row for row in map(json.loads, f)}
+
+
+def test_run_reports_crashed_image_as_error(images, tmp_path):
+    stats = BatchProcessor(workers=3).run(images, tmp_path / 'out.jsonl')
+
+    assert (stats['ok'], stats['failed']) == (12, 1)
+    rows = read_jsonl(tmp_path / 'out.jsonl')
+    assert len(rows) == 13
+    assert rows[str(tmp_path / 'poison.png')]['error'] == 'worker process crashed'
+
+
+def test_run_queue_fails_crashing_job_after_max_attempts(config, images, tmp_path):
+    config.set('batch.queue.max_attempts', 3)
+    stats = BatchProcessor(workers=3).run_queue(images, tmp_path / 'out.jsonl', tmp_path / 'q.sqlite')
+
+    assert (stats['ok'], stats['failed']) == (12, 1)
+    assert 'error' in read_jsonl(tmp_path / 'out.jsonl')[str(tmp_path / 'poison.png')]
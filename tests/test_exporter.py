@@ -0,0 +1,105 @@
+"""ResultExporter round trips: JSON Lines, CSV and (with pyarrow) Parquet"""
+import csv
+import json
+
+import pytest
+
+from core.exporter import COLUMNS, NESTED_COLUMNS, ResultExporter
+
+RESULTS = [
+    {
+        'image': 'scans/a.png',
+        'info': ['Họ tên: Nguyễn Văn An'],
+        'meds': ['Paracetamol 500mg x 10 viên'],
+        'medications': [{'drug': 'Paracetamol', 'drug_start': 0, 'drug_end': 11, 'strength': 500.0,
+                         'unit': 'mg', 'quantity': 10.0, 'form': 'viên',
+                         'line': 'Paracetamol 500mg x 10 viên'}],
+        'raw_text': 'Họ tên: Nguyễn Văn An\nParacetamol 500mg x 10 viên',
+        'timings': {'pipeline.total': 812.5},
+    },
+    {'image': 'scans/doc.pdf', 'page_count': 2, 'info': [], 'meds': [], 'medications': [],
+     'raw_text': '', 'timings': {}},
+    {'image': 'scans/broken.png', 'error': 'cannot decode image'},
+]
+
+
+def export(path, fmt=None, results=RESULTS):
+    with ResultExporter(path, fmt) as exporter:
+        for result in results:
+            exporter.write(result)
+    return exporter
+
+
+@pytest.fixture
+def small_row_groups(config):
+    # Several flushes, including a partial last one
+    config.set('export.row_group_size', 2)
+
+
+def test_jsonl_round_trip(tmp_path):
+    exporter = export(tmp_path / 'out.jsonl')
+    assert exporter.format == 'jsonl' and exporter.rows == 3
+    with open(tmp_path / 'out.jsonl', encoding='utf-8') as f:
+        assert [json.loads(line) for line in f] == RESULTS
+
+
+def test_csv_round_trip(tmp_path, small_row_groups):
+    exporter = export(tmp_path / 'out.csv')
+    assert exporter.format == 'csv' and exporter.rows == 3
+
+    with open(tmp_path / 'out.csv', encoding='utf-8', newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert tuple(rows[0]) == COLUMNS
+    assert [row['image'] for row in rows] == ['scans/a.png', 'scans/doc.pdf', 'scans/broken.png']
+
+    first = {name: json.loads(rows[0][name]) for name in NESTED_COLUMNS}
+    assert first['info'] == RESULTS[0]['info']
+    assert first['timings'] == RESULTS[0]['timings']
+    assert first['medications'][0]['drug'] == 'Paracetamol'
+    assert first['medications'][0]['dose'] is None  # every medication field is present
+    assert rows[0]['raw_text'] == RESULTS[0]['raw_text']
+    assert rows[1]['page_count'] == '2'
+    assert rows[2]['error'] == 'cannot decode image'
+
+
+def test_empty_export_writes_header(tmp_path):
+    export(tmp_path / 'empty.csv', results=[])
+    with open(tmp_path / 'empty.csv', encoding='utf-8', newline='') as f:
+        assert next(csv.reader(f)) == list(COLUMNS)
+
+
+def test_unknown_format_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        ResultExporter(tmp_path / 'out.xml', 'xml')
+
+
+def test_parquet_round_trip(tmp_path, small_row_groups):
+    pq = pytest.importorskip('pyarrow.parquet')
+    exporter = export(tmp_path / 'out.parquet')
+    assert exporter.format == 'parquet'
+
+    parquet = pq.ParquetFile(tmp_path / 'out.parquet')
+    assert parquet.metadata.num_row_groups == 2
+    rows = parquet.read().to_pylist()
+    assert [row['image'] for row in rows] == ['scans/a.png', 'scans/doc.pdf', 'scans/broken.png']
+    assert rows[0]['medications'][0]['strength'] == 500.0
+    assert dict(rows[0]['timings']) == RESULTS[0]['timings']
+    assert rows[1]['page_count'] == 2
+    assert rows[2]['error'] == 'cannot decode image'
+
+
+def test_parquet_falls_back_to_csv_without_pyarrow(tmp_path, monkeypatch):
+    import builtins
+
+    real_import = builtins.__import__
+
+    def no_pyarrow(name, *args, **kwargs):
+        if name.startswith('pyarrow'):
+            raise ImportError(name)
+        return real_import(name, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, '__import__', no_pyarrow)
+    exporter = export(tmp_path / 'out.parquet')
+    assert exporter.format == 'csv'
+    assert exporter.path == tmp_path / 'out.csv'
+    assert (tmp_path / 'out.csv').exists()
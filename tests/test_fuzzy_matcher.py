@@ -0,0 +1,90 @@
+"""SymSpellIndex lookups and DrugDictionary matching (exact, OCR-error tolerant, no false positives)"""
+import pytest
+
+from core.drug_dictionary import DrugDictionary
+from core.fuzzy_matcher import FuzzyMatch, SymSpellIndex, bounded_distance
+
+TERMS = ['PARACETAMOL', 'AMOXICILLIN', 'AUGMENTIN', 'IBUPROFEN', 'ZINC']
+
+
+@pytest.fixture
+def index():
+    return SymSpellIndex(TERMS, max_distance=2, prefix_length=7)
+
+
+@pytest.fixture(scope='module')
+def drugs():
+    return DrugDictionary()
+
+
+def test_exact_lookup(index):
+    assert index.lookup('PARACETAMOL') == [FuzzyMatch('PARACETAMOL', 0)]
+    assert index.lookup('ZINC') == [FuzzyMatch('ZINC', 0)]
+
+
+@pytest.mark.parametrize('token, term, distance', [
+    ('PARACETAM0L', 'PARACETAMOL', 1),   # substitution (O read as 0)
+    ('PARACETAML', 'PARACETAMOL', 1),    # deletion
+    ('AUNGMENTIN', 'AUGMENTIN', 1),      # insertion
+    ('IBUPRFOEN', 'IBUPROFEN', 1),       # transposition
+    ('PARAC3TAM0L', 'PARACETAMOL', 2),
+    ('AM0XICILIN', 'AMOXICILLIN', 2),
+])
+def test_corrections_within_max_distance(index, token, term, distance):
+    assert index.lookup(token)[0] == FuzzyMatch(term, distance)
+
+
+def test_max_distance_is_respected(index):
+    assert index.lookup('PARAC3TAM0L', max_distance=1) == []
+    assert index.lookup('P4RAC3TAM0L') == []  # three edits
+    # A per-call limit cannot exceed the limit the index was built with
+    assert index.lookup('P4RAC3TAM0L', max_distance=3) == []
+
+
+def test_prefix_length_cut_off():
+    index = SymSpellIndex(['PARACETAMOL'], max_distance=2, prefix_length=4)
+    # Only deletions of the first prefix_length characters are indexed
+    assert max(len(variant) for variant in index._index) == 4
+    # Errors after the prefix are still found, verified on the whole word
+    assert index.lookup('PARACXTAMXL') == [FuzzyMatch('PARACETAMOL', 2)]
+    assert index.lookup('PARAXXTAMXL') == []
+    # Errors inside the prefix count against the same budget
+    assert index.lookup('P4R4CETAMOL') == [FuzzyMatch('PARACETAMOL', 2)]
+    assert index.lookup('XXXXCETAMOL') == []
+
+
+def test_bounded_distance_stops_early():
+    assert bounded_distance('PARACETAMOL', 'PARACETAMOL', 2) == 0
+    assert bounded_distance('PARACETAMOL', 'IBUPROFEN', 2) == 3
+
+
+def test_dictionary_exact_match(drugs):
+    [match] = drugs.find_all('1. Paracetamol 500mg x 10 viên')
+    assert (match.text, match.canonical, match.distance) == ('Paracetamol', 'PARACETAMOL', 0)
+    assert (match.start, match.end) == (3, 14)
+
+
+@pytest.mark.parametrize('line, canonical, distance', [
+    ('Paracetam0l 500mg', 'PARACETAMOL', 1),
+    ('AUNGMENTIN 625mg', 'AUGMENTIN', 1),
+    ('Amoxicilin 500mg', 'AMOXICILLIN', 1),
+    ('L0RATAD1NE 10mg', 'LORATADINE', 2),
+])
+def test_dictionary_fuzzy_match(drugs, line, canonical, distance):
+    assert drugs.find_all(line) == []
+    match = drugs.first_match(line)
+    assert (match.canonical, match.distance) == (canonical, distance)
+
+
+@pytest.mark.parametrize('line', [
+    'Ngày uống 2 lần, mỗi lần 1 viên sau ăn',
+    'Sáng 1 viên, trưa 1 viên, chiều 1 viên, tối 1 viên',
+    'Uống khi sốt, cách 6 giờ',
+    'Ngay uong 3 lan, moi lan 2 vien truoc an',
+    'Họ tên: Nguyễn Văn An   Tuổi: 45',
+    'Chẩn đoán: Viêm họng cấp',
+    'Tái khám sau 5 ngày, mang theo đơn thuốc',
+])
+def test_no_false_positives_on_instruction_lines(drugs, line):
+    assert drugs.find_all(line, fuzzy=True) == []
+    assert not drugs.has_match(line)
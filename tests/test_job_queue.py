@@ -0,0 +1,79 @@
+"""JobQueue state machine: claim/start/complete/fail/recover and resuming a run"""
+import pytest
+
+from core.job_queue import DONE, FAILED, IN_PROGRESS, PENDING, JobQueue
+
+
+@pytest.fixture
+def queue(config, tmp_path):
+    config.set('batch.queue.max_attempts', 3)
+    queue = JobQueue(tmp_path / 'jobs.sqlite')
+    yield queue
+    queue.close()
+
+
+def statuses(queue):
+    return {path: (status, attempts) for path, status, attempts in
+            queue._db.execute("SELECT path, status, attempts FROM jobs")}
+
+
+def test_failed_job_is_retried_until_max_attempts(queue):
+    queue.add(['a.png'])
+    for attempt in range(1, 4):
+        [(job_id, task)] = queue.claim(10)
+        assert task == 'a.png'
+        queue.start(job_id)
+        retry = queue.fail(job_id, 'boom')
+        assert retry == (attempt < 3)
+
+    assert statuses(queue) == {'a.png': (FAILED, 3)}
+    assert queue.claim(10) == []
+    assert list(queue.iter_finished()) == [('a.png', 0, {'error': 'boom'})]
+
+
+def test_recover_returns_interrupted_jobs_to_pending(queue):
+    queue.add(['a.png', 'b.png', ('doc.pdf', 2)])
+    jobs = queue.claim(10)
+    assert queue.counts()[IN_PROGRESS] == 3
+    queue.start(jobs[0][0])  # only a.png was started before the crash
+
+    assert queue.recover() == 3
+    assert statuses(queue) == {'a.png': (PENDING, 1), 'b.png': (PENDING, 0), 'doc.pdf': (PENDING, 0)}
+    assert [task for _, task in queue.claim(10)] == ['a.png', 'b.png', ('doc.pdf', 2)]
+
+
+def test_recover_fails_jobs_that_crashed_on_every_attempt(queue):
+    queue.add(['poison.png'])
+    for _ in range(3):
+        [(job_id, _)] = queue.claim(10)
+        queue.start(job_id)
+        queue.recover()  # the worker died before fail()/complete()
+
+    assert statuses(queue) == {'poison.png': (FAILED, 3)}
+
+
+def test_second_run_skips_finished_paths(config, tmp_path):
+    path = tmp_path / 'jobs.sqlite'
+    first = JobQueue(path)
+    first.add(['a.png', 'b.png'])
+    [(job_a, _), _] = first.claim(10)
+    first.start(job_a)
+    first.complete(job_a, {'raw_text': 'A'})
+    first.close()  # stopped before b.png finished
+
+    second = JobQueue(path)
+    second.recover()
+    assert second.known_paths() == {'a.png', 'b.png'}
+    assert second.add(['a.png', 'b.png']) == 0
+    assert [task for _, task in second.claim(10)] == ['b.png']
+    assert second.counts()[DONE] == 1
+    second.close()
+
+
+def test_claim_by_ids_only_takes_pending_jobs(queue):
+    queue.add(['a.png', 'b.png', 'c.png'])
+    ids = [job_id for job_id, _ in queue.claim(10)]
+    queue.complete(ids[0], {})
+    queue.recover()
+
+    assert [task for _, task in queue.claim(10, ids=ids[:2])] == ['b.png']
@@ -0,0 +1,26 @@
+"""KeywordExtractor.reload picks up every classifier setting"""
+from core.keyword_extractor import KeywordExtractor
+
+
+def test_reload_rebuilds_semantic_classifier(config):
+    config.set('keywords.semantic.enabled', False)
+    extractor = KeywordExtractor()
+    old = extractor.semantic
+
+    config.set('keywords.semantic.enabled', True)
+    config.set('models.keybert', 'another-model')
+    config.set('keywords.semantic.threshold', 0.8)
+    extractor.reload()
+
+    assert extractor.semantic is not old
+    assert extractor.semantic.enabled
+    assert extractor.semantic.model_name == 'another-model'
+    assert extractor.semantic.threshold == 0.8
+
+
+def test_reload_recompiles_info_keywords(config):
+    extractor = KeywordExtractor()
+    config.set('keywords.info', ['mã bệnh nhân'])
+    extractor.reload()
+
+    assert extractor.info_pattern.search('Mã bệnh nhân: 123')
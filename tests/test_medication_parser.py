@@ -0,0 +1,59 @@
+"""Regression tests: instruction lines must be folded into the drug above, not parsed as new drugs"""
+import pytest
+
+from core.keyword_extractor import KeywordExtractor
+
+
+@pytest.fixture(scope='module')
+def extractor():
+    return KeywordExtractor()
+
+
+def test_daily_instruction_line_is_folded(extractor):
+    records = extractor.parse_medications(['1. PARACETAMOL 500mg x 10 viên',
+                                           'Ngày uống 2 lần, mỗi lần 1 viên'])
+    assert len(records) == 1
+    med = records[0]
+    assert med.drug.lower() == 'paracetamol'
+    assert (med.strength, med.unit) == (500.0, 'mg')
+    assert med.quantity == 10.0
+    assert med.times_per_day == 2.0
+    assert med.dose == 1.0
+    assert med.route == 'uống'
+
+
+def test_per_intake_dose_is_not_quantity(extractor):
+    records = extractor.parse_medications(['Amoxicillin 250mg x 14 viên',
+                                           'Mỗi lần 1 viên, ngày 3 lần'])
+    assert len(records) == 1
+    med = records[0]
+    assert med.quantity == 14.0
+    assert med.dose == 1.0
+    assert med.times_per_day == 3.0
+
+
+@pytest.mark.parametrize('line', [
+    'Ngày uống 2 lần, mỗi lần 1 viên',
+    'Mỗi lần 1 viên, ngày 3 lần',
+    'Sau ăn, uống sáng 1 viên',
+    'Trước khi ngủ 1 viên',
+    'Cách 6 giờ uống 1 gói khi sốt',
+])
+def test_instruction_line_has_no_drug(extractor, line):
+    med = extractor.medication_parser.parse(line)
+    assert med.drug is None
+
+
+def test_standalone_per_intake_dose(extractor):
+    med = extractor.medication_parser.parse('Mỗi lần 1 viên, ngày 3 lần')
+    assert med.dose == 1.0
+    assert med.form == 'viên'
+    assert med.quantity is None
+    assert med.times_per_day == 3.0
+
+
+def test_unaccented_instruction_words(extractor):
+    med = extractor.medication_parser.parse('Moi lan 2 vien, ngay 2 lan')
+    assert med.drug is None
+    assert med.dose == 2.0
+    assert med.times_per_day == 2.0
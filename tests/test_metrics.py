@@ -0,0 +1,43 @@
+"""Prometheus sink: one file per process, flushed on close"""
+import os
+
+from utils.metrics import PrometheusFileSink
+
+
+def span(name='preprocess.denoise', ms=5.0, nbytes=100):
+    return {'name': name, 'ts': 0.0, 'duration_ms': ms, 'attrs': {'bytes': nbytes}}
+
+
+def test_writes_one_file_per_pid_with_pid_label(tmp_path):
+    sink = PrometheusFileSink({'path': str(tmp_path / 'metrics.prom'), 'flush_interval': 0})
+    sink.emit(span())
+
+    path = tmp_path / f'metrics.{os.getpid()}.prom'
+    assert sink.path == path
+    assert not (tmp_path / 'metrics.prom').exists()
+    text = path.read_text(encoding='utf-8')
+    assert f'ocr_stage_duration_seconds_count{{stage="preprocess.denoise",pid="{os.getpid()}"}} 1' in text
+
+
+def test_close_flushes_pending_spans(tmp_path):
+    sink = PrometheusFileSink({'path': str(tmp_path / 'metrics.prom'), 'flush_interval': 3600})
+    sink.emit(span())  # first span flushes immediately
+    sink.emit(span())
+    sink.emit(span())
+    assert 'stage="preprocess.denoise",pid=' in sink.path.read_text(encoding='utf-8')
+    assert '} 3\n' not in sink.path.read_text(encoding='utf-8')
+
+    sink.close()
+    assert f'ocr_stage_duration_seconds_count{{stage="preprocess.denoise",pid="{os.getpid()}"}} 3' \
+        in sink.path.read_text(encoding='utf-8')
+
+
+def test_forked_process_starts_with_own_counters(tmp_path):
+    sink = PrometheusFileSink({'path': str(tmp_path / 'metrics.prom'), 'flush_interval': 0})
+    sink.emit(span())
+    # Pretend the sink was inherited from a parent process
+    sink.pid = -1
+    sink.emit(span())
+
+    assert sink.pid == os.getpid()
+    assert sink._stats['preprocess.denoise'][0] == 1
@@ -0,0 +1,78 @@
+"""run() and iter_results() share cache entries, so they must produce identical results"""
+import cv2
+import numpy as np
+import pytest
+
+from core.ocr_engine import OCREngine
+from core.pipeline import OCRPipeline
+
+
+class FakeBackend:
+    """Tesseract stand-in: the recognized text depends on the crop it is given"""
+
+    name = 'fake'
+
+    def image_to_data(self, img, psm=None):
+        h, w = img.shape[:2]
+        return [
+            {'text': f'Paracetamol 500mg {w}x{h}', 'conf': 90.0, 'bbox': (1, 1, w - 2, h - 2), 'line': (1, 1, 1)},
+            {'text': 'Họ tên: Nguyễn Văn An', 'conf': 90.0, 'bbox': (1, 1, 20, 10), 'line': (1, 1, 2)},
+        ]
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def pipeline(config):
+    config.set('cache.enabled', False)
+    engine = OCREngine()
+    engine.backend = FakeBackend()
+    return OCRPipeline(ocr_engine=engine)
+
+
+@pytest.fixture
+def image_bytes():
+    img = np.full((300, 400, 3), 255, np.uint8)
+    cv2.putText(img, 'Paracetamol 500mg', (10, 40), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0), 2)
+    cv2.putText(img, 'Ho ten An', (10, 200), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0), 2)
+    return cv2.imencode('.png', img)[1].tobytes()
+
+
+@pytest.mark.parametrize('layout', [False, True])
+def test_streaming_matches_run(pipeline, config, image_bytes, layout):
+    config.set('ocr.layout.enabled', layout)
+    expected = pipeline.run(image_bytes)
+    streamed = list(pipeline.iter_results(image_bytes))[-1]['result']
+    expected.pop('timings', None)
+    streamed.pop('timings', None)
+    assert streamed == expected
+
+
+def test_gui_snapshots_are_full_resolution(pipeline, config):
+    img = np.full((1200, 1600, 3), 255, np.uint8)
+    cv2.putText(img, 'Paracetamol 500mg', (40, 200), cv2.FONT_HERSHEY_SIMPLEX, 2, (0, 0, 0), 4)
+    data = cv2.imencode('.png', img)[1].tobytes()
+    preview_size = config.get('ocr.snapshot_preview_size')
+
+    def final_step(**kwargs):
+        events = pipeline.iter_results(data, return_preprocessing_steps=True, **kwargs)
+        return next(e for e in events if e['type'] == 'preprocessed')['steps']['final']
+
+    assert max(final_step(snapshots='preview').shape) == preview_size
+    assert max(final_step(snapshots='all').shape) > preview_size
+
+
+def test_page_streams_in_bands_without_layout(pipeline, config, image_bytes):
+    config.set('ocr.layout.enabled', False)
+    config.set('ocr.bands', 4)
+    events = list(pipeline.iter_results(image_bytes))
+    blocks = [event for event in events if event['type'] == 'block']
+
+    # The two text lines are far apart, so the page is cut between them
+    assert len(blocks) > 1
+    assert events.index(blocks[0]) < len(events) - 1
+    streamed = events[-1]['result']
+    expected = pipeline.run(image_bytes)
+    assert streamed['lines'] == expected['lines']
+    assert len(streamed['lines']) == 2 * len(blocks)  # FakeBackend reads two lines per region
@@ -0,0 +1,34 @@
+"""Deskew: ocr.deskew.max_angle bounds the corrected skew"""
+import cv2
+import numpy as np
+import pytest
+
+from core.preprocessor import ImagePreprocessor
+
+
+@pytest.fixture
+def skewed_page():
+    img = np.full((600, 800, 3), 255, np.uint8)
+    for i in range(8):
+        cv2.putText(img, 'Paracetamol 500mg x 10 vien', (40, 80 + i * 60), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 2)
+    M = cv2.getRotationMatrix2D((400, 300), 5, 1.0)
+    return cv2.warpAffine(img, M, (800, 600), borderValue=(255, 255, 255))
+
+
+def test_max_angle_zero_disables_skew_correction(config, skewed_page, monkeypatch):
+    config.set('ocr.deskew.orientation', False)
+    config.set('ocr.deskew.max_angle', 0)
+    preprocessor = ImagePreprocessor()
+    monkeypatch.setattr(preprocessor, '_estimate_skew', lambda gray: pytest.fail('skew estimated'))
+    assert preprocessor._deskew_image(skewed_page) is skewed_page
+
+
+def test_skew_beyond_max_angle_is_ignored(config, skewed_page, monkeypatch):
+    config.set('ocr.deskew.orientation', False)
+    config.set('ocr.deskew.max_angle', 15)
+    preprocessor = ImagePreprocessor()
+    monkeypatch.setattr(preprocessor, '_estimate_skew', lambda gray: 20.0)
+    assert preprocessor._deskew_image(skewed_page) is skewed_page
+
+    monkeypatch.setattr(preprocessor, '_estimate_skew', lambda gray: 5.0)
+    assert preprocessor._deskew_image(skewed_page) is not skewed_page
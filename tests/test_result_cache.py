@@ -0,0 +1,58 @@
+"""ResultCache keys and disk tier bookkeeping"""
+import pytest
+
+from core.result_cache import ResultCache
+
+
+@pytest.fixture(autouse=True)
+def disk_path(config, tmp_path):
+    config.set('cache.disk_path', str(tmp_path / 'cache.sqlite'))
+
+
+def test_key_changes_when_drug_dictionary_is_edited(config, tmp_path):
+    drugs = tmp_path / 'drugs.txt'
+    drugs.write_text('PARACETAMOL\n', encoding='utf-8')
+    config.set('keywords.drug_dictionary', str(drugs))
+    before = ResultCache().make_key(b'image')
+    assert ResultCache().make_key(b'image') == before
+
+    drugs.write_text('PARACETAMOL\nAMOXICILLIN\n', encoding='utf-8')
+    assert ResultCache().make_key(b'image') != before
+
+
+def disk_sum(cache):
+    return cache._db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+
+def test_running_disk_total_matches_table(config):
+    config.set('cache.disk_max_mb', 1)
+    cache = ResultCache()
+    for i in range(5):
+        cache.put(f'k{i}', {'raw_text': 'x' * 100})
+    cache.put('k0', {'raw_text': 'y' * 300})  # replacing an entry counts only its new size
+    assert cache._disk_bytes == disk_sum(cache)
+
+    reopened = ResultCache()
+    assert reopened._disk_bytes == disk_sum(reopened)
+    cache.clear()
+    assert cache._disk_bytes == 0
+
+
+def test_evicts_least_recently_used_past_limit(config):
+    config.set('cache.disk_max_mb', 0.001)  # ~1 KB
+    config.set('cache.memory_items', 0)
+    cache = ResultCache()
+    for i in range(10):
+        cache.put(f'k{i}', {'raw_text': 'x' * 200})
+
+    assert cache._disk_bytes == disk_sum(cache) <= cache.disk_max_bytes
+    assert cache.stats['evictions'] > 0
+    assert cache.get('k9') is not None
+    assert cache.get('k0') is None
+
+
+@pytest.mark.parametrize('key, value', [('models.keybert', 'another-model'), ('tesseract.backend', 'tesserocr')])
+def test_key_changes_with_semantic_model_and_backend(config, key, value):
+    before = ResultCache().make_key(b'image')
+    config.set(key, value)
+    assert ResultCache().make_key(b'image') != before
@@ -0,0 +1,132 @@
+"""Request parsing and admission in OCRServer (no worker pool needed)"""
+import asyncio
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from core.server import HTTPError, OCRServer
+
+
+def make_server(queue_size=2):
+    server = OCRServer(workers=1)
+    server.queue_size = queue_size
+    return server
+
+
+def read_request(server, raw):
+    async def run():
+        server.queue = asyncio.Queue(maxsize=server.queue_size)
+        reader = asyncio.StreamReader()
+        reader.feed_data(raw)
+        # No feed_eof: reading a body that was never sent would hang, not fail
+        return await asyncio.wait_for(server._read_request(reader), 2)
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize('length', ['abc', '-5', ''])
+def test_invalid_content_length_is_400(length):
+    with pytest.raises(HTTPError) as exc:
+        read_request(make_server(), f'POST /ocr HTTP/1.1\r\nContent-Length: {length}\r\n\r\n'.encode())
+    assert exc.value.status == 400
+
+
+def test_full_queue_rejects_before_reading_body():
+    server = make_server(queue_size=1)
+    server._receiving = 1  # another upload is being received
+    with pytest.raises(HTTPError) as exc:
+        read_request(server, b'POST /ocr HTTP/1.1\r\nContent-Length: 1000\r\n\r\n')
+    assert exc.value.status == 503
+    assert server._receiving == 1
+
+
+def test_body_is_read_when_admitted():
+    server = make_server()
+    method, path, _, payload = read_request(server, b'POST /ocr?x=1 HTTP/1.1\r\nContent-Length: 3\r\n\r\nabc')
+    assert (method, path, payload) == ('POST', '/ocr', b'abc')
+    assert server._receiving == 0
+
+
+def test_connections_beyond_limit_get_503():
+    server = make_server()
+
+    async def run():
+        server.queue = asyncio.Queue(maxsize=server.queue_size)
+        server.max_connections = 1
+        server._connections = 1
+        listener = await asyncio.start_server(server._handle_client, '127.0.0.1', 0)
+        port = listener.sockets[0].getsockname()[1]
+        async with listener:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            response = await asyncio.wait_for(reader.read(), 2)
+            writer.close()
+        return response
+
+    assert asyncio.run(run()).startswith(b'HTTP/1.1 503')
+
+
+class FakeExecutor:
+    """Stand-in for ProcessPoolExecutor: batches fail once the pool is 'broken'"""
+
+    def __init__(self):
+        self.pending = []
+        self.submitted = []
+        self.shut_down = False
+
+    def submit(self, func, *args):
+        future = concurrent.futures.Future()
+        self.submitted.append(func.__name__)
+        if func.__name__ == 'process_batch':
+            self.pending.append(future)
+        else:
+            future.set_result(0)
+        return future
+
+    def crash(self):
+        for future in self.pending:
+            future.set_exception(BrokenProcessPool('worker died'))
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+def test_worker_crash_restarts_pool_once():
+    server = make_server(queue_size=8)
+    server.workers = 2
+    server.batch_size = 1
+    server.batch_window = 0
+    executors = []
+
+    def start_executor():
+        server.executor = FakeExecutor()
+        executors.append(server.executor)
+
+    server._start_executor = start_executor
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        server.queue = asyncio.Queue(maxsize=server.queue_size)
+        start_executor()
+        batchers = [asyncio.create_task(server._batcher()) for _ in range(server.workers)]
+        futures = []
+        for data in (b'a', b'b'):
+            futures.append(loop.create_future())
+            server.queue.put_nowait((data, futures[-1]))
+        while len(executors[0].pending) < 2:
+            await asyncio.sleep(0)
+        # Both in-flight batches fail with the same broken pool
+        executors[0].crash()
+        results = await asyncio.gather(*futures)
+        for _ in range(10):
+            await asyncio.sleep(0)
+        for task in batchers:
+            task.cancel()
+        return results
+
+    results = asyncio.run(run())
+    assert results == [{'error': 'worker crashed'}] * 2
+    assert len(executors) == 2
+    assert executors[0].shut_down and not executors[1].shut_down
+    # The replacement pool is warmed
+    assert executors[1].submitted == ['_warm_worker'] * server.workers
@@ -38,3 +38,18 @@ class Config:
                 return default
         
         return value
+    
+    def set(self, key_path, value):
+        """
+        Ghi đè giá trị config trong bộ nhớ (không lưu ra file)
+        Ví dụ: config.set('ocr.denoise_method', 'median')
+        """
+        keys = key_path.split('.')
+        target = self._config
+        
+        for key in keys[:-1]:
+            if not isinstance(target.get(key), dict):
+                target[key] = {}
+            target = target[key]
+        
+        target[keys[-1]] = value
@@ -0,0 +1,204 @@
+"""Đo thời gian/bộ nhớ từng giai đoạn pipeline và xuất ra các sink"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from utils.config import Config
+from utils.logger import Logger
+
+
+class LogSink:
+    """Writes one debug log line per span"""
+
+    def __init__(self, options):
+        self.logger = Logger.get_logger('Metrics')
+
+    def emit(self, span):
+        attrs = ' '.join(f"{k}={v}" for k, v in span['attrs'].items())
+        self.logger.debug(f"{span['name']} {span['duration_ms']:.2f}ms {attrs}".rstrip())
+
+
+class JsonLinesSink:
+    """Appends every span as a JSON object to a .jsonl file"""
+
+    def __init__(self, options):
+        self.path = Path(options.get('path', 'logs/metrics.jsonl'))
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def emit(self, span):
+        line = json.dumps(span, ensure_ascii=False, default=str)
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+
+
+class PrometheusFileSink:
+    """Aggregates spans and rewrites a Prometheus text-format file
+
+    Meant for the node_exporter textfile collector: the file is replaced
+    atomically at most once per flush_interval seconds. Every process
+    (batch and server workers included) writes its own file,
+    <stem>.<pid><suffix> next to the configured path, with a pid label so
+    the collector can merge them without duplicate series.
+    """
+
+    def __init__(self, options):
+        self.base_path = Path(options.get('path', 'logs/metrics.prom'))
+        self.base_path.parent.mkdir(parents=True, exist_ok=True)
+        self.flush_interval = float(options.get('flush_interval', 10))
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        """Bắt đầu thống kê mới cho process hiện tại (cũng dùng sau fork)"""
+        self.pid = os.getpid()
+        self.path = self.base_path.with_name(f"{self.base_path.stem}.{self.pid}{self.base_path.suffix}")
+        self._stats = {}  # stage -> [count, seconds_sum, seconds_max, bytes_sum]
+        self._last_flush = 0.0
+        self._dirty = False
+
+    def emit(self, span):
+        with self._lock:
+            if self.pid != os.getpid():
+                # Forked worker: do not re-export the parent's counters under its own pid
+                self._reset()
+            stats = self._stats.setdefault(span['name'], [0, 0.0, 0.0, 0])
+            seconds = span['duration_ms'] / 1000
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+            stats[3] += int(span['attrs'].get('bytes', 0) or 0)
+            self._dirty = True
+
+            if time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush()
+
+    def _flush(self):
+        pid = self.pid
+        lines = [
+            "# HELP ocr_stage_duration_seconds Time spent in each pipeline stage",
+            "# TYPE ocr_stage_duration_seconds summary",
+        ]
+        for name, (count, total, _, _) in sorted(self._stats.items()):
+            lines.append(f'ocr_stage_duration_seconds_sum{{stage="{name}",pid="{pid}"}} {total:.6f}')
+            lines.append(f'ocr_stage_duration_seconds_count{{stage="{name}",pid="{pid}"}} {count}')
+        lines += [
+            "# HELP ocr_stage_duration_seconds_max Slowest observation per stage",
+            "# TYPE ocr_stage_duration_seconds_max gauge",
+        ]
+        for name, (_, _, peak, _) in sorted(self._stats.items()):
+            lines.append(f'ocr_stage_duration_seconds_max{{stage="{name}",pid="{pid}"}} {peak:.6f}')
+        lines += [
+            "# HELP ocr_stage_output_bytes_total Bytes of image buffers produced per stage",
+            "# TYPE ocr_stage_output_bytes_total counter",
+        ]
+        for name, (_, _, _, nbytes) in sorted(self._stats.items()):
+            lines.append(f'ocr_stage_output_bytes_total{{stage="{name}",pid="{pid}"}} {nbytes}')
+
+        tmp = self.path.with_suffix(self.path.suffix + '.tmp')
+        tmp.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+        os.replace(tmp, self.path)
+        self._last_flush = time.monotonic()
+        self._dirty = False
+
+    def close(self):
+        with self._lock:
+            if self.pid == os.getpid() and self._dirty:
+                self._flush()
+
+
+SINKS = {
+    'log': LogSink,
+    'jsonl': JsonLinesSink,
+    'prometheus': PrometheusFileSink,
+}
+
+
+class Metrics:
+    """Singleton instrumentation layer
+
+    Usage:
+        with Metrics().span('preprocess.denoise') as span:
+            out = denoise(img)
+            span['bytes'] = out.nbytes
+    """
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._setup()
+        return cls._instance
+
+    def _setup(self):
+        config = Config()
+        self.enabled = bool(config.get('metrics.enabled', False))
+        self._local = threading.local()
+        self.sinks = []
+
+        if self.enabled:
+            for options in config.get('metrics.sinks', []) or []:
+                if isinstance(options, str):
+                    options = {'type': options}
+                sink_cls = SINKS.get(options.get('type'))
+                if sink_cls is None:
+                    Logger.get_logger('Metrics').warning(f"Unknown metrics sink: {options}")
+                    continue
+                self.sinks.append(sink_cls(options))
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """Đo thời gian một khối lệnh; attrs có thể được bổ sung bên trong khối"""
+        if not self.enabled:
+            yield attrs
+            return
+
+        start = time.perf_counter()
+        try:
+            yield attrs
+        finally:
+            self.record(name, (time.perf_counter() - start) * 1000, **attrs)
+
+    def record(self, name, duration_ms, **attrs):
+        """Ghi một span đã đo sẵn"""
+        if not self.enabled:
+            return
+
+        span = {'name': name, 'ts': time.time(), 'duration_ms': duration_ms, 'attrs': attrs}
+
+        collected = getattr(self._local, 'collected', None)
+        if collected is not None:
+            collected.append(span)
+
+        for sink in self.sinks:
+            try:
+                sink.emit(span)
+            except Exception as e:
+                Logger.get_logger('Metrics').warning(f"Metrics sink error: {e}")
+
+    @contextmanager
+    def collect(self):
+        """Thu thập các span của thread hiện tại (vd. để gắn timings vào kết quả)"""
+        previous = getattr(self._local, 'collected', None)
+        self._local.collected = []
+        try:
+            yield self._local.collected
+        finally:
+            self._local.collected = previous
+
+    def close(self):
+        """Ghi nốt dữ liệu còn đệm của các sink (gọi khi process kết thúc; gọi nhiều lần được)"""
+        for sink in self.sinks:
+            if hasattr(sink, 'close'):
+                try:
+                    sink.close()
+                except Exception as e:
+                    Logger.get_logger('Metrics').warning(f"Metrics sink error: {e}")
+
+
+def image_attrs(img):
+    """Kích thước + số byte của một buffer ảnh numpy"""
+    return {'shape': 'x'.join(str(d) for d in img.shape), 'bytes': int(img.nbytes)}